@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'core.middleware.ForcePasswordChangeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -149,6 +151,78 @@ ANYMAIL = {
     'RESEND_API_KEY': config('RESEND_API_KEY', default=''),
 }
 
+# --- Kategoryzacja AI (Ollama, core/services/ai_categorization.py) ---
+# Bez modelu można uruchomić atrapę: `python manage.py fake_ollama` i ustawić
+# OLLAMA_URL na jej adres.
+OLLAMA_URL = config('OLLAMA_URL', default='http://localhost:11434')
+OLLAMA_MODEL = config('OLLAMA_MODEL', default='neural-chat')
+OLLAMA_TIMEOUT = config('OLLAMA_TIMEOUT', default=30, cast=int)  # sekundy na jedno zapytanie
+OLLAMA_HEALTH_TIMEOUT = 2  # sprawdzenie dostępności przed importem [s]
+OLLAMA_POOL_SIZE = 4  # połączenia keep-alive w puli sesji
+OLLAMA_CIRCUIT_FAILURES = 3  # tyle kolejnych błędów/timeoutów wyłącza AI do końca importu
+OLLAMA_KEEP_ALIVE = '30m'  # jak długo Ollama trzyma model w pamięci po zapytaniu
+OLLAMA_NUM_PREDICT = 12  # limit tokenów odpowiedzi na jedną transakcję (kod kategorii)
+OLLAMA_BATCH_SIZE = 10  # transakcji w jednym zapytaniu wsadowym podczas importu
+OLLAMA_IMPORT_BUDGET = config('OLLAMA_IMPORT_BUDGET', default=120, cast=int)  # łączny czas AI na import [s]
+
+# --- Lokalny klasyfikator tytułów (core/services/categorizer.py) ---
+# Trenowany komendą `python manage.py train_categorizer`; bez pliku modelu import
+# kieruje wszystkie niedopasowane transakcje do Ollamy.
+CATEGORIZER_MODEL_PATH = config('CATEGORIZER_MODEL_PATH', default=str(BASE_DIR / 'categorizer_model.json'))
+CATEGORIZER_MIN_CONFIDENCE = 0.9  # poniżej tej pewności transakcja trafia do Ollamy
+
+# --- Sugestie reguł z decyzji AI (core/services/rule_suggestions.py) ---
+RULE_SUGGESTION_MIN_COUNT = 3  # tyle decyzji AI musi pasować do słowa kluczowego
+RULE_SUGGESTION_MIN_AGREEMENT = 0.9  # udział najczęstszego tytułu wśród nich
+RULE_SUGGESTION_AUTO_CREATE = config('RULE_SUGGESTION_AUTO_CREATE', default=False, cast=bool)  # twórz reguły po imporcie
+RULE_SUGGESTION_AUTO_MIN_LENGTH = 6  # krótsze słowa kluczowe trafiają tylko do przeglądu, nie są tworzone po imporcie
+
+# --- Statystyki reguł (liczniki dopasowań) ---
+RULE_MATCH_EARLY_EXIT = True  # dwa różne lokale z reguł: pomiń analizę tekstu i najemców (wynik i tak CONFLICT)
+RULE_STALE_DAYS = 365  # reguła bez dopasowania od tylu dni (licząc od utworzenia) jest nieaktualna
+
+# --- Import etapowy (podgląd przed zatwierdzeniem, core/services/import_staging.py) ---
+IMPORT_STAGING_TTL_HOURS = 24  # niezatwierdzone podglądy starsze niż tyle godzin są usuwane
+
+# --- Cache raportów ---
+# Domyślnie cache w pamięci procesu. Aby współdzielić raporty między workerami
+# gunicorna bez Redisa, ustaw w .env np.:
+#   REPORT_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#   REPORT_CACHE_LOCATION=/var/tmp/kamienica_cache
+# albo cache w bazie (wymaga `python manage.py createcachetable`):
+#   REPORT_CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+#   REPORT_CACHE_LOCATION=report_cache
+REPORT_CACHE_ALIAS = 'reports'
+REPORT_CACHE_TIMEOUT = config('REPORT_CACHE_TIMEOUT', default=86400, cast=int)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    REPORT_CACHE_ALIAS: {
+        'BACKEND': config('REPORT_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('REPORT_CACHE_LOCATION', default='kamienica-reports'),
+        'TIMEOUT': REPORT_CACHE_TIMEOUT,
+    },
+}
+
+# --- Pomiar wydajności żądań (core.middleware.PerformanceMiddleware) ---
+# Wyłączony domyślnie; włącz PERF_MONITORING=True w .env. Statystyki: /perf/.
+PERF_MONITORING_ENABLED = config('PERF_MONITORING', default=False, cast=bool)
+PERF_SLOW_REQUEST_MS = config('PERF_SLOW_REQUEST_MS', default=500, cast=int)
+PERF_DUPLICATE_QUERY_THRESHOLD = 5  # tyle identycznych zapytań w żądaniu = podejrzenie N+1
+PERF_RING_SIZE = 200  # liczba ostatnich wolnych żądań trzymanych w pamięci
+
+# --- Metryki etapów (core/services/metrics.py), eksport: /metrics/ ---
+# Token Bearer dla Prometheusa (scrape_config: authorization). Pusty — /metrics/ tylko dla superużytkownika.
+# Adres IP nie jest sprawdzany: za reverse proxy (nginx -> gunicorn) każde żądanie przychodzi z 127.0.0.1.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_RESERVOIR_SIZE = 1000  # liczba ostatnich pomiarów na etap do liczenia percentyli
+
+# --- Profilowanie na żądanie (core/services/profiling.py) ---
+# Reguły dodaje superużytkownik w adminie; profile trafiają do MEDIA_ROOT/profiles/.
+PROFILING_RULES_TTL = 30  # co ile sekund proces odświeża listę reguł z bazy
+PROFILING_MAX_PROFILES = 50  # starsze profile (i ich pliki) są usuwane
+
 # --- Session & Cookie Security ---
 SESSION_COOKIE_HTTPONLY = True   # ciasteczko sesji niedostępne przez JavaScript
 SESSION_COOKIE_SAMESITE = 'Strict'  # ochrona przed CSRF cross-site
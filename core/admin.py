@@ -1,6 +1,8 @@
 from django.contrib import admin, messages
 from django.contrib.auth.models import User as AuthUser
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.html import format_html
 from dateutil.relativedelta import relativedelta
 from .models import (
     User,
@@ -13,8 +15,16 @@ from .models import (
     FinancialTransaction,
     LokalAssignmentRule,
     LocalPhoto,
+    MonthlyCharge,
     WaterCostOverride,
+    AgreementBalance,
+    ProfilingRule,
+    CapturedProfile,
+    AIDecision,
 )
+from .services.balances import refresh_balances
+from .services.charges import close_period, post_charges
+from .services.rule_suggestions import create_rules, suggest_rules
 
 @admin.register(WaterCostOverride)
 class WaterCostOverrideAdmin(admin.ModelAdmin):
@@ -23,6 +33,113 @@ class WaterCostOverrideAdmin(admin.ModelAdmin):
     list_display_links = ('period_start_date',)
 
 
+@admin.register(MonthlyCharge)
+class MonthlyChargeAdmin(admin.ModelAdmin):
+    list_display = ('agreement', 'month_year', 'rent', 'fixed_fees', 'water_cost', 'is_stale', 'posted_at', 'closed_at')
+    list_filter = ('month_year', 'is_stale', ('closed_at', admin.EmptyFieldListFilter))
+    search_fields = ('agreement__lokal__unit_number', 'agreement__user__lastname')
+    date_hierarchy = 'month_year'
+    actions = ['repost_months', 'close_months']
+
+    @admin.action(description='Przelicz naliczenia za miesiące wybranych wierszy')
+    def repost_months(self, request, queryset):
+        months = set(queryset.values_list('month_year', flat=True))
+        summary = post_charges(months)
+        self.message_user(
+            request,
+            f"Przeliczono {len(months)} mies.: utworzono {summary['created']}, "
+            f"zaktualizowano {summary['updated']}, usunięto {summary['deleted']} naliczeń.",
+            level=messages.SUCCESS,
+        )
+
+    @admin.action(description='Zamknij okres (zamroź naliczenia za miesiące wybranych wierszy)')
+    def close_months(self, request, queryset):
+        months = set(queryset.values_list('month_year', flat=True))
+        closed = close_period(months)
+        self.message_user(request, f"Zamknięto {closed} naliczeń w {len(months)} mies.", level=messages.SUCCESS)
+
+
+@admin.register(AgreementBalance)
+class AgreementBalanceAdmin(admin.ModelAdmin):
+    list_display = ('agreement', 'month', 'opening_balance', 'charges', 'payments', 'closing_balance', 'is_stale', 'updated_at')
+    list_filter = ('is_stale', 'month')
+    search_fields = ('agreement__lokal__unit_number', 'agreement__user__lastname')
+    date_hierarchy = 'month'
+    actions = ['refresh_agreements']
+
+    @admin.action(description='Przelicz saldo umów wybranych wierszy')
+    def refresh_agreements(self, request, queryset):
+        agreements = Agreement.all_objects.filter(pk__in=queryset.values('agreement_id'))
+        AgreementBalance.objects.filter(agreement__in=agreements).update(is_stale=True)
+        refreshed = refresh_balances(agreements)
+        self.message_user(request, f"Przeliczono saldo {refreshed} umów.", level=messages.SUCCESS)
+
+
+class SuperuserOnlyAdmin(admin.ModelAdmin):
+    # Profile zawierają ścieżki i argumenty żądań — tylko dla superużytkownika.
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        return request.user.is_superuser
+
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+
+@admin.register(ProfilingRule)
+class ProfilingRuleAdmin(SuperuserOnlyAdmin):
+    list_display = ('target', 'kind', 'threshold_ms', 'is_active', 'expires_at', 'created_at')
+    list_filter = ('kind', 'is_active')
+    search_fields = ('target',)
+
+
+@admin.register(CapturedProfile)
+class CapturedProfileAdmin(SuperuserOnlyAdmin):
+    list_display = ('created_at', 'kind', 'target', 'duration_ms', 'path', 'download_link')
+    list_filter = ('kind', 'target')
+    readonly_fields = ('rule', 'kind', 'target', 'path', 'duration_ms', 'created_at', 'download_link', 'summary')
+    exclude = ('file',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Plik .prof')
+    def download_link(self, obj):
+        return format_html('<a href="{}">Pobierz</a>', reverse('profile_download', args=[obj.pk]))
+
+
+@admin.register(AIDecision)
+class AIDecisionAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'contractor_key', 'description', 'title', 'transaction')
+    list_filter = ('title',)
+    search_fields = ('contractor', 'description')
+    readonly_fields = ('transaction', 'description', 'contractor', 'contractor_key', 'title', 'created_at')
+    actions = ['create_suggested_rules']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Utwórz reguły z powtarzalnych decyzji (wśród zaznaczonych)')
+    def create_suggested_rules(self, request, queryset):
+        suggestions = suggest_rules(decisions=queryset)
+        if not suggestions:
+            self.message_user(request, "Brak wzorców spełniających próg — nie utworzono reguł.", level=messages.WARNING)
+            return
+        created = create_rules(suggestions)
+        keywords = ", ".join(f"'{s.keywords}' -> {s.title_display}" for s in suggestions[:10])
+        self.message_user(request, f"Utworzono {created} reguł: {keywords}", level=messages.SUCCESS)
+
+
 @admin.register(Agreement)
 class AgreementAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'start_date', 'end_date', 'initial_balance', 'is_active')
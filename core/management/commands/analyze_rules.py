@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.services.rule_analysis import FINDING_KINDS, analyze_rules, delete_rules, drop_phrase, prune_stale_rules
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyse categorization and lokal assignment rules against the transaction history: "
+        "conflicting, substring, duplicate and redundant phrases and rules that never fire."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=FINDING_KINDS, action="append", help="Only show these finding kinds")
+        parser.add_argument("--limit", type=int, default=50, help="Show at most this many findings")
+        parser.add_argument("--json", action="store_true", help="Print findings as JSON")
+        parser.add_argument("--delete-dead", action="store_true", help="Delete rules that match no transaction")
+        parser.add_argument(
+            "--drop-redundant", action="store_true",
+            help="Drop duplicate phrases (keeping the oldest rule) and phrases made redundant by a shorter one",
+        )
+        parser.add_argument(
+            "--prune-stale", type=int, nargs="?", const=-1, metavar="DAYS",
+            help="Delete rules without a hit for DAYS days (default settings.RULE_STALE_DAYS)",
+        )
+
+    def handle(self, *args, **options):
+        analysis = analyze_rules()
+        findings = [f for f in analysis.findings if not options["kind"] or f.kind in options["kind"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps({
+                "title_rules": analysis.title_rules,
+                "lokal_rules": analysis.lokal_rules,
+                "phrases": analysis.phrases,
+                "transactions": analysis.ledger_size,
+                "conflict_rows": analysis.conflict_rows,
+                "counts": analysis.counts(),
+                "findings": [
+                    {
+                        "kind": f.kind,
+                        "rule_kind": f.rule_kind,
+                        "rules": [p.key for p in f.phrases],
+                        "phrases": [p.text for p in f.phrases],
+                        "affected": f.affected,
+                        "message": f.message,
+                    }
+                    for f in findings[:options["limit"]]
+                ],
+            }, ensure_ascii=False, indent=2))
+        else:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{analysis.title_rules} categorization and {analysis.lokal_rules} lokal rules "
+                f"({analysis.phrases} phrases) checked against {analysis.ledger_size} transactions "
+                f"in {analysis.seconds} s"
+            ))
+            self.stdout.write(
+                ", ".join(f"{kind}: {count}" for kind, count in analysis.counts().items())
+                + f" — conflicts affect {analysis.conflict_rows} transactions"
+            )
+            for finding in findings[:options["limit"]]:
+                style = self.style.ERROR if finding.kind == "conflict" else self.style.WARNING
+                self.stdout.write(style(f"[{finding.kind}] ") + f"{finding.message} ({finding.affected} transactions)")
+            if len(findings) > options["limit"]:
+                self.stdout.write(f"... and {len(findings) - options['limit']} more")
+
+        if options["drop_redundant"]:
+            dropped = 0
+            for finding in analysis.findings:
+                if finding.kind not in ("duplicate", "redundant"):
+                    continue
+                # duplicate: keep the first (oldest) rule; redundant: drop the longer phrase.
+                for phrase in finding.phrases[1:]:
+                    drop_phrase(phrase.rule, phrase.text)
+                    dropped += 1
+            self.stdout.write(self.style.SUCCESS(f"Dropped {dropped} duplicate/redundant phrases."))
+
+        if options["delete_dead"]:
+            dead = [f.phrases[0] for f in analysis.findings if f.kind == "dead"]
+            deleted = delete_rules(
+                [p.rule.pk for p in dead if p.rule_kind == "title" and p.rule.pk],
+                [p.rule.pk for p in dead if p.rule_kind == "lokal" and p.rule.pk],
+            )
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} rules that never fire."))
+
+        if options["prune_stale"] is not None:
+            days = None if options["prune_stale"] < 0 else options["prune_stale"]
+            deleted_title, deleted_lokal = prune_stale_rules(days)
+            self.stdout.write(self.style.SUCCESS(
+                f"Deleted {deleted_title} categorization and {deleted_lokal} lokal rules without recent hits."
+            ))
@@ -0,0 +1,169 @@
+import io
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core.management.commands.benchmark_import import (
+    DEFAULT_MIX as IMPORT_MIX,
+    generate_statement,
+    parse_mix,
+    seed_benchmark_data,
+)
+from core.management.commands.fake_ollama import add_fake_ollama_arguments, fake_ollama_config
+from core.services import metrics
+from core.services.ai_categorization import categorize_with_ai
+from core.services.benchmarking import quantile, throwaway_sqlite_database
+from core.services.fake_ollama import running_fake_ollama
+from core.services.transaction_processing import AI_MODES, process_csv_file
+
+# More rows that need the AI than the plain import benchmark, otherwise there is little to measure.
+DEFAULT_MIX = "rule=0.3,conflict=0.2,unprocessed=0.3,tenant=0.2"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the AI categorisation path against the built-in fake Ollama server: "
+        "a full import per AI mode, then raw categorize_with_ai calls at several concurrency levels."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=300, help="Rows in the synthetic statement")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Row kind weights (import benchmark default: {IMPORT_MIX})")
+        parser.add_argument("--modes", nargs="+", default=AI_MODES, choices=AI_MODES, help="AI modes to import with")
+        parser.add_argument(
+            "--concurrency", default="1,4,16",
+            help="Comma separated thread counts for the raw call benchmark (empty to skip)",
+        )
+        parser.add_argument("--calls", type=int, default=100, help="Raw categorize_with_ai calls per concurrency level")
+        parser.add_argument("--timeout", type=float, help="Client timeout in seconds (default settings.OLLAMA_TIMEOUT)")
+        parser.add_argument("--url", help="Benchmark an already running Ollama (real or fake) instead of starting one")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+        add_fake_ollama_arguments(parser)
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1 or options["calls"] < 1:
+            raise CommandError("--rows and --calls must be positive")
+        try:
+            levels = [int(level) for level in options["concurrency"].split(",") if level.strip()]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma separated list of integers")
+        mix = parse_mix(options["mix"])
+        config = fake_ollama_config(options)
+        statement = generate_statement(options["rows"], mix, seed=options["seed"])
+
+        if options["url"]:
+            results = self._run(options["url"], None, statement, options, levels)
+        else:
+            with running_fake_ollama(config) as server:
+                results = self._run(server.url, server, statement, options, levels)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"AI path, {options['rows']} rows, Ollama at {results['url']}"
+        ))
+        for row in results["imports"]:
+            self.stdout.write(
+                f"{row['mode']:>26}: {row['seconds']:8.2f} s, {row['rows_per_second']:7.1f} rows/s, "
+                f"{row['ai_calls']:>5} AI calls, title_match {row['title_match_ms']:.0f} ms, "
+                f"left unprocessed {row['unprocessed']}"
+            )
+            for name, span in row["ai_spans"].items():
+                self.stdout.write(
+                    f"{'':>28}{name}: {span['count']} x, p50 {span['p50_ms']:.0f} ms, p95 {span['p95_ms']:.0f} ms"
+                )
+            if row["client"] and row["client"]["disabled_reason"]:
+                self.stdout.write(
+                    f"{'':>28}AI disabled after {row['client']['calls']} calls: {row['client']['disabled_reason']} "
+                    f"({row['client']['skipped']} skipped)"
+                )
+            if row.get("server"):
+                self.stdout.write(
+                    f"{'':>28}server: {row['server']['errors']} errors, "
+                    f"{row['server']['repeated_prompts']} repeated prompts (cacheable), "
+                    f"{row['server']['cold_starts']} cold starts"
+                )
+        for row in results["concurrency"]:
+            self.stdout.write(
+                f"{row['threads']:>4} threads: {row['calls_per_second']:7.1f} calls/s, "
+                f"p50 {row['p50_ms']:.0f} ms, p95 {row['p95_ms']:.0f} ms, "
+                f"{row['errors']} errors ({row['timeouts']} timeouts)"
+            )
+
+    def _run(self, url, server, statement, options, levels):
+        overrides = {"OLLAMA_URL": url}
+        if options["timeout"]:
+            overrides["OLLAMA_TIMEOUT"] = options["timeout"]
+        results = {"url": url, "rows": options["rows"], "imports": [], "concurrency": []}
+        with override_settings(**overrides):
+            for mode in options["modes"]:
+                with throwaway_sqlite_database():
+                    seed_benchmark_data()
+                    results["imports"].append(self._import(mode, statement, server))
+            for threads in levels:
+                results["concurrency"].append(self._concurrent_calls(threads, options["calls"], server))
+        return results
+
+    @staticmethod
+    def _import(mode, statement, server):
+        metrics.reset()
+        if server:
+            server.stats.reset()
+        timings = {}
+        started = time.perf_counter()
+        summary = process_csv_file(io.BytesIO(statement), ai_mode=mode, timings=timings)
+        seconds = time.perf_counter() - started
+        if "error" in summary:
+            raise CommandError(summary["error"])
+        # Single-item and batched requests are recorded under separate span names.
+        ai_spans = {
+            row["name"]: {"count": row["count"], "p50_ms": round(row["p50"] * 1000, 1), "p95_ms": round(row["p95"] * 1000, 1)}
+            for row in metrics.snapshot() if row["name"].startswith("ai.")
+        }
+        rows = summary["processed_count"] + len(summary["skipped_rows"])
+        return {
+            "mode": mode,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds, 1) if seconds else None,
+            "ai_calls": sum(span["count"] for name, span in ai_spans.items() if name != "ai.warm_up"),
+            "ai_spans": ai_spans,
+            "title_match_ms": round(timings.get("title_match", 0.0) * 1000, 1),
+            "conflicts": summary["conflict_count"],
+            "unprocessed": summary["unprocessed_count"],
+            "client": summary["ai"],
+            "server": server.stats.as_dict() if server else None,
+        }
+
+    @staticmethod
+    def _concurrent_calls(threads, calls, server):
+        if server:
+            server.stats.reset()
+        descriptions = [f"Przelew nr {i} za usługę" for i in range(calls)]
+
+        def call(description):
+            started = time.perf_counter()
+            code, status, log = categorize_with_ai(description, "FIRMA TESTOWA")
+            return time.perf_counter() - started, status, log
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = list(pool.map(call, descriptions))
+        seconds = time.perf_counter() - started
+        latencies = [latency for latency, _, _ in outcomes]
+        errors = [log for _, status, log in outcomes if status == "ERROR"]
+        return {
+            "threads": threads,
+            "calls": calls,
+            "calls_per_second": round(calls / seconds, 1) if seconds else None,
+            "p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "p95_ms": round(quantile(latencies, 0.95) * 1000, 1),
+            "errors": len(errors),
+            "timeouts": sum(1 for log in errors if log.startswith("Timeout")),
+            "server_max_in_flight": server.stats.max_in_flight if server else None,
+        }
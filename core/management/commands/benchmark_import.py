@@ -0,0 +1,224 @@
+import io
+import json
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import (
+    BUILDING_LOKAL_NUMBER,
+    Agreement,
+    CategorizationRule,
+    FinancialTransaction,
+    Lokal,
+    User,
+)
+from core.services.benchmarking import count_queries, peak_rss_kb, throwaway_sqlite_database
+from core.services.transaction_processing import AI_MODES, process_csv_file
+
+ROW_KINDS = ("rule", "conflict", "unprocessed", "tenant")
+DEFAULT_MIX = "rule=0.4,conflict=0.1,unprocessed=0.2,tenant=0.3"
+STAGES = ("decode", "prefetch", "parse", "title_match", "lokal_match", "classifier", "write")
+
+HEADER = (
+    '"Data transakcji";"Data księgowania";"Dane kontrahenta";"Tytuł";"Nr rachunku";'
+    '"Nazwa banku";"Szczegóły";"Nr transakcji";"Kwota transakcji (waluta rachunku)";"Waluta";'
+    '"Kwota blokady/zwolnienie blokady";"Waluta";"Kwota płatności w walucie";"Waluta";'
+    '"Saldo po transakcji";"Waluta";;;;;'
+)
+FOOTER = '"Dokument ma charakter informacyjny, nie stanowi dowodu księgowego";'
+
+# Rules seeded into the benchmark DB: "rule" rows hit one of them, "conflict" rows hit two.
+BENCHMARK_RULES = [
+    ("wywóz odpadów", "wywoz_smieci"),
+    ("sprzątanie klatki", "sprzatanie"),
+    ("usługi ogrodnicze", "ogrodnik"),
+    ("naprawa dachu", "naprawy_remonty"),
+]
+TENANT_NAMES = [
+    ("ANNA", "NOWAK"), ("PIOTR", "WIŚNIEWSKI"), ("EWA", "WÓJCIK"), ("MAREK", "KOWALCZYK"),
+    ("KATARZYNA", "KAMIŃSKA"), ("TOMASZ", "LEWANDOWSKI"), ("AGNIESZKA", "ZIELIŃSKA"),
+    ("PAWEŁ", "SZYMAŃSKI"), ("MAGDALENA", "WOŹNIAK"), ("KRZYSZTOF", "DĄBROWSKI"),
+]
+
+
+def parse_mix(value):
+    """Parses "rule=0.4,conflict=0.1,..." into normalised weights for every row kind."""
+    weights = dict.fromkeys(ROW_KINDS, 0.0)
+    try:
+        for part in value.split(","):
+            kind, weight = part.split("=")
+            kind = kind.strip()
+            if kind not in weights:
+                raise CommandError(f"Unknown row kind '{kind}' in --mix (expected one of {', '.join(ROW_KINDS)})")
+            weights[kind] = float(weight)
+    except ValueError:
+        raise CommandError(f"Invalid --mix value '{value}', expected e.g. {DEFAULT_MIX}")
+    total = sum(weights.values())
+    if total <= 0:
+        raise CommandError("--mix weights must sum to a positive number")
+    return {kind: weight / total for kind, weight in weights.items()}
+
+
+def _row(kind, index, posting_date, rng):
+    if kind == "rule":
+        keyword = rng.choice(BENCHMARK_RULES)[0]
+        contractor, description = " FIRMA USŁUGOWA SP. Z O.O. ", f" Faktura {index}/2025 {keyword}"
+        amount = -Decimal(rng.randint(5000, 90000)) / 100
+    elif kind == "conflict":
+        first, second = rng.sample(BENCHMARK_RULES, 2)
+        contractor, description = " FIRMA USŁUGOWA SP. Z O.O. ", f" {first[0]} oraz {second[0]}"
+        amount = -Decimal(rng.randint(5000, 90000)) / 100
+    elif kind == "tenant":
+        name, lastname = rng.choice(TENANT_NAMES)
+        contractor, description = f" {lastname} {name} UL. TESTOWA 1 43-300 BIELSKO-BIAŁA ", " Czynsz za mieszkanie"
+        amount = Decimal(rng.randint(80000, 250000)) / 100
+    else:
+        contractor, description = " JAN PRZYKŁADOWY ", " Przelew środków własnych"
+        amount = Decimal(rng.randint(1000, 50000)) / 100
+
+    amount_str = f"{amount:.2f}".replace(".", ",")
+    day = posting_date.isoformat()
+    return (
+        f'{day};{day};"{contractor}";"{description}";\'{rng.randint(10**25, 10**26 - 1)} \';'
+        f'"ING Bank Śląski S.A.";"PRZELEW  ";\'B{index:017d}\';{amount_str};PLN;;;;;0,00;PLN;;;;;'
+    )
+
+
+def generate_statement(rows, mix, seed=0, end_date=None):
+    """
+    Builds a synthetic bank statement in the ING layout accepted by
+    process_csv_file (semicolon separated, windows-1250, "Data transakcji" header,
+    transaction id in column 7, amount in column 8). Returns encoded bytes.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=rows)
+    lines = [
+        '"Lista transakcji";;;;;"ING Bank Śląski S.A. ul. Sokolska 34, 40-086 Katowice www.ing.pl";;;;;;;;;;;;;;;',
+        '"Dokument nr 0000000000_benchmark";',
+        "",
+        HEADER,
+    ]
+    for index, kind in enumerate(kinds):
+        posting_date = end_date - timedelta(days=index * 365 // max(rows, 1))
+        lines.append(_row(kind, index, posting_date, rng))
+    lines += ["", "", FOOTER]
+    return "\r\n".join(lines).encode("windows-1250")
+
+
+def seed_benchmark_data(today=None):
+    """Creates the rules, building lokal and tenants the synthetic rows refer to."""
+    today = today or date.today()
+    CategorizationRule.objects.bulk_create(
+        CategorizationRule(keywords=keyword, title=title) for keyword, title in BENCHMARK_RULES
+    )
+    Lokal.objects.get_or_create(unit_number=BUILDING_LOKAL_NUMBER, defaults={"size_sqm": 0})
+    for i, (name, lastname) in enumerate(TENANT_NAMES, 1):
+        lokal = Lokal.objects.create(unit_number=f"B{i}", size_sqm=40)
+        user = User.objects.create(
+            name=name.title(), lastname=lastname.title(), email=f"bench{i}@example.com", role="lokator",
+        )
+        Agreement.objects.create(
+            user=user, lokal=lokal, signing_date=date(today.year - 2, 1, 1),
+            start_date=date(today.year - 2, 1, 1), rent_amount=1500, number_of_occupants=2,
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark process_csv_file on synthetic bank statements in a throwaway SQLite "
+        "database: rows/s, SQL query count, peak RSS and time per import stage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="100,1000,5000",
+            help="Comma separated statement sizes (rows) to benchmark",
+        )
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Row kind weights (default: {DEFAULT_MIX})")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the generator")
+        parser.add_argument(
+            "--ai-mode", default="rule_only", choices=AI_MODES,
+            help="AI mode passed to the importer (default rule_only, so Ollama is not needed)",
+        )
+        parser.add_argument(
+            "--reimport", action="store_true",
+            help="Import every statement a second time to measure the cost of an overlapping re-import",
+        )
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+        parser.add_argument("--write-csv", metavar="PATH", help="Also save the largest generated statement")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of integers")
+        if not sizes or min(sizes) < 1:
+            raise CommandError("--sizes must contain positive integers")
+        mix = parse_mix(options["mix"])
+
+        results = []
+        for size in sizes:
+            statement = generate_statement(size, mix, seed=options["seed"])
+            if options["write_csv"] and size == max(sizes):
+                with open(options["write_csv"], "wb") as fh:
+                    fh.write(statement)
+            # Fresh DB per size, so every run measures a first import rather than updates.
+            with throwaway_sqlite_database():
+                seed_benchmark_data()
+                result = self._run(size, statement, options["ai_mode"])
+                if options["reimport"]:
+                    result["reimport"] = self._run(size, statement, options["ai_mode"])
+                results.append(result)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(
+                {"mix": mix, "seed": options["seed"], "ai_mode": options["ai_mode"], "results": results},
+                indent=2,
+            ))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Import benchmark"))
+        for result in results:
+            self.stdout.write(
+                f"{result['rows']:>7} rows: {result['seconds']:8.3f} s, {result['rows_per_second']:9.1f} rows/s, "
+                f"{result['queries']:>7} queries ({result['queries_per_row']:.2f}/row), "
+                f"peak RSS {result['peak_rss_kb'] or '?'} KB"
+            )
+            stages = ", ".join(f"{stage} {result['stages_ms'][stage]:.1f}" for stage in STAGES)
+            self.stdout.write(f"         stages [ms]: {stages}")
+            if "reimport" in result:
+                again = result["reimport"]
+                self.stdout.write(
+                    f"         re-import: {again['seconds']:.3f} s, {again['queries']} queries, "
+                    f"{again['unchanged']} unchanged, {again['imported']} re-processed"
+                )
+
+    @staticmethod
+    def _run(size, statement, ai_mode):
+        timings = {}
+        started = time.perf_counter()
+        with count_queries() as counter:
+            summary = process_csv_file(io.BytesIO(statement), ai_mode=ai_mode, timings=timings)
+        seconds = time.perf_counter() - started
+        if "error" in summary:
+            raise CommandError(summary["error"])
+        return {
+            "rows": size,
+            "imported": summary["processed_count"],
+            "unchanged": summary["unchanged_count"],
+            "skipped": len(summary["skipped_rows"]),
+            "conflicts": summary["conflict_count"],
+            "unprocessed": summary["unprocessed_count"],
+            "stored": FinancialTransaction.objects.count(),
+            "seconds": round(seconds, 4),
+            "rows_per_second": round(size / seconds, 1) if seconds else None,
+            "queries": counter.count,
+            "queries_per_row": round(counter.count / size, 2),
+            # Process-wide peak (ru_maxrss): it only grows across sizes, so run sizes in ascending order.
+            "peak_rss_kb": peak_rss_kb(),
+            "stages_ms": {stage: round(timings.get(stage, 0.0) * 1000, 2) for stage in STAGES},
+        }
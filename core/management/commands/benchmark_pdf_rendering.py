@@ -0,0 +1,98 @@
+import statistics
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Agreement
+from core.services.pdf_generation import AnnualReportPdfRenderer, get_pdf_renderer
+from core.services.reporting import get_annual_report_context
+
+
+def _sample_context():
+    """Builds a synthetic annual report context so the benchmark needs no DB data."""
+    months = [
+        "Styczeń", "Luty", "Marzec", "Kwiecień", "Maj", "Czerwiec",
+        "Lipiec", "Sierpień", "Wrzesień", "Październik", "Listopad", "Grudzień",
+    ]
+    rent = Decimal("1500.00")
+    return {
+        "title": "Raport roczny dla lokalu 1 (2025)",
+        "rent_schedule": [{"month_name": m, "rent": rent} for m in months],
+        "total_rent": rent * 12,
+        "bimonthly_data": [
+            {
+                "name": f"okres {i + 1} 2025",
+                "waste_cost": Decimal("120.00"),
+                "water_consumption": Decimal("12.500"),
+                "water_cost": Decimal("180.00"),
+            }
+            for i in range(6)
+        ],
+        "cumulative_payments": [
+            {"date": date(2025, i, 10), "amount": Decimal("1800.00"), "description": "czynsz"}
+            for i in range(1, 13)
+        ],
+        "total_payments": Decimal("21600.00"),
+        "total_waste_cost_year": Decimal("720.00"),
+        "total_water_cost_year": Decimal("1080.00"),
+        "total_water_consumption_year": Decimal("75.000"),
+        "total_costs": Decimal("19800.00"),
+        "final_balance": Decimal("1800.00"),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-PDF latency of the annual report renderer: cold (fonts and "
+        "styles rebuilt for every document) versus warm (shared renderer)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20, help="Number of PDFs per variant")
+        parser.add_argument(
+            "--agreement",
+            type=int,
+            help="Render the real report for this agreement id instead of a synthetic context",
+        )
+        parser.add_argument("--year", type=int, default=date.today().year)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        if iterations < 1:
+            raise CommandError("--iterations must be at least 1")
+
+        if options["agreement"]:
+            try:
+                agreement = Agreement.all_objects.get(pk=options["agreement"])
+            except Agreement.DoesNotExist:
+                raise CommandError(f"Agreement {options['agreement']} does not exist")
+            context = get_annual_report_context(agreement, options["year"], _cache={})
+        else:
+            context = _sample_context()
+
+        cold = self._measure(
+            lambda: AnnualReportPdfRenderer(reload_fonts=True).render(context), iterations
+        )
+        renderer = get_pdf_renderer()
+        warm = self._measure(lambda: renderer.render(context), iterations)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"PDF rendering, {iterations} iterations"))
+        for label, samples in (("cold", cold), ("warm", warm)):
+            self.stdout.write(
+                f"{label:>5}: mean {statistics.mean(samples):8.2f} ms, "
+                f"median {statistics.median(samples):8.2f} ms, "
+                f"min {min(samples):8.2f} ms"
+            )
+        speedup = statistics.mean(cold) / statistics.mean(warm) if statistics.mean(warm) else 0
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {speedup:.2f}x"))
+
+    @staticmethod
+    def _measure(fn, iterations):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
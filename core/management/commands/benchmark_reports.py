@@ -0,0 +1,143 @@
+import json
+import statistics
+from datetime import date
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User as AuthUser
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from core.models import Agreement
+from core.services.benchmarking import (
+    check_budgets,
+    load_budgets,
+    measure_request,
+    throwaway_sqlite_database,
+)
+
+DEFAULT_BUDGETS = Path(__file__).resolve().parents[2] / "report_budgets.json"
+DATASET_PREFIX = "R"
+
+
+def report_urls(agreement, year):
+    """URL of every benchmarked view, keyed by the names used in the budgets file."""
+    return {
+        "bimonthly_report": reverse("lokal-bimonthly-report", args=[agreement.lokal_id]) + f"?year={year}",
+        "annual_agreement_report": reverse("annual_agreement_report", args=[agreement.pk]) + f"?year={year}",
+        "annual_report_pdf": reverse("annual_report_pdf", args=[agreement.pk]) + f"?year={year}",
+        "water_cost_table": reverse("water_cost_table") + f"?year={year}",
+        "water_cost_summary": reverse("water_cost_summary"),
+        "fixed_costs": reverse("fixed_costs_list"),
+        "settlement": reverse("settlement", args=[agreement.pk]),
+        "meter_consumption_report": reverse("meter-consumption-report"),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the expensive report views through the Django test client on a generated "
+        "dataset in a throwaway SQLite database. Records wall time, SQL query count and SQL "
+        "time per request and fails when a view exceeds its budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--budgets", default=str(DEFAULT_BUDGETS), help="Path to the budgets JSON file")
+        parser.add_argument("--lokals", type=int, help="Override the dataset scale from the budgets file")
+        parser.add_argument("--years", type=int, help="Override the dataset history length from the budgets file")
+        parser.add_argument("--repeat", type=int, default=3, help="Measured requests per view (median is reported)")
+        parser.add_argument("--view", action="append", help="Only benchmark these views (repeatable)")
+        parser.add_argument(
+            "--warm", action="store_true",
+            help="Keep the report cache between requests instead of measuring uncached rendering",
+        )
+        parser.add_argument("--json", action="store_true", help="Print results as JSON")
+        parser.add_argument("--no-fail", action="store_true", help="Report budget violations without failing")
+
+    def handle(self, *args, **options):
+        try:
+            config = load_budgets(options["budgets"])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read budgets file: {exc}")
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        scale = config.get("scale", {})
+        lokals = options["lokals"] or scale.get("lokals", 50)
+        years = options["years"] or scale.get("years", 5)
+        budgets = config.get("views", {})
+        if options["view"]:
+            unknown = set(options["view"]) - set(budgets)
+            if unknown:
+                raise CommandError(f"Unknown view(s): {', '.join(sorted(unknown))}")
+            budgets = {name: budgets[name] for name in options["view"]}
+
+        with throwaway_sqlite_database():
+            call_command(
+                "generate_scale_dataset", lokals=lokals, years=years, prefix=DATASET_PREFIX, stdout=StringIO()
+            )
+            setup_test_environment()
+            try:
+                results = self._run(budgets, options["repeat"], options["warm"])
+            finally:
+                teardown_test_environment()
+
+        violations = check_budgets(results, budgets)
+        if options["json"]:
+            self.stdout.write(json.dumps(
+                {"scale": {"lokals": lokals, "years": years}, "results": results, "violations": violations},
+                indent=2,
+            ))
+        else:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"Report views, {lokals} lokals x {years} years, median of {options['repeat']}"
+            ))
+            for name, result in results.items():
+                budget = budgets[name]
+                self.stdout.write(
+                    f"{name:>26}: {result['ms']:9.1f} ms (budget {budget.get('max_ms', '-')}), "
+                    f"{result['queries']:>5} queries (budget {budget.get('max_queries', '-')}), "
+                    f"SQL {result['sql_ms']:8.1f} ms"
+                )
+
+        if violations:
+            message = "Budget exceeded:\n  " + "\n  ".join(violations)
+            if options["no_fail"]:
+                self.stdout.write(self.style.WARNING(message))
+            else:
+                raise CommandError(message)
+        elif not options["json"]:
+            self.stdout.write(self.style.SUCCESS("All views within budget"))
+
+    def _run(self, budgets, repeat, warm):
+        admin = AuthUser.objects.create_superuser("benchmark", "benchmark@example.com", "benchmark")
+        client = Client()
+        client.force_login(admin)
+        # The last complete year, for an agreement that covers all of it when possible.
+        year = date.today().year - 1
+        generated = Agreement.objects.filter(lokal__unit_number__startswith=DATASET_PREFIX).order_by("pk")
+        agreement = generated.filter(start_date__lte=date(year, 1, 1)).first() or generated.first()
+        urls = report_urls(agreement, year)
+        report_cache = caches[getattr(settings, "REPORT_CACHE_ALIAS", "default")]
+
+        results = {}
+        for name in budgets:
+            # Warm-up: posts the monthly charges the report reads, as the nightly job would.
+            client.get(urls[name])
+            samples = []
+            for _ in range(repeat):
+                if not warm:
+                    report_cache.clear()
+                samples.append(measure_request(client, urls[name]))
+            results[name] = {
+                "url": urls[name],
+                "status": samples[-1]["status"],
+                "ms": statistics.median(s["ms"] for s in samples),
+                "queries": max(s["queries"] for s in samples),
+                "sql_ms": statistics.median(s["sql_ms"] for s in samples),
+            }
+        return results
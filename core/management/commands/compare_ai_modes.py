@@ -1,10 +1,63 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from core.services.transaction_processing import process_csv_file, AI_MODES
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
+from django.core.management.base import CommandError
 
-class Command(BaseCommand):
-    help = "Compare Ollama AI categorization modes for a CSV file without persisting changes."
+from core.services.ai_categorization import OllamaClient
+from core.services.benchmarking import quantile
+from core.services.categorizer import load_model as load_categorizer, training_queryset
+from core.services.profiling import ProfiledCommand
+from core.services.transaction_processing import (
+    AI_MODES,
+    _should_use_ai,
+    apply_ai_result,
+    categorize_pending,
+    final_status,
+    parse_statement,
+)
+
+
+class SharedAnswers:
+    """
+    AI answers per statement row, shared by modes running in parallel.
+
+    A mode claims the rows nobody has asked for yet, categorises them itself
+    and publishes the answers; rows claimed by another mode are waited for.
+    conflict_only therefore reuses what conflict_and_unprocessed already asked
+    (or the other way round) and no row is sent to Ollama twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self._answers = {}
+
+    def claim(self, keys):
+        with self._lock:
+            mine = [key for key in keys if key not in self._events]
+            for key in mine:
+                self._events[key] = threading.Event()
+        return mine
+
+    def publish(self, answers):
+        for key, answer in answers.items():
+            self._answers[key] = answer
+            self._events[key].set()
+
+    def get(self, key):
+        self._events[key].wait()
+        return self._answers[key]
+
+
+class Command(ProfiledCommand):
+    help = (
+        "Compare Ollama AI categorization modes for a CSV file without writing to the database. "
+        "The file is parsed and rule-matched once, AI answers are shared between modes, modes run "
+        "concurrently, and each mode is scored against already verified transactions."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("csv_path", help="Path to the CSV file to process")
@@ -15,32 +68,157 @@ class Command(BaseCommand):
             choices=AI_MODES,
             help="Which AI categorization modes to compare",
         )
+        parser.add_argument("--sequential", action="store_true", help="Run modes one after another")
+        parser.add_argument(
+            "--no-classifier", action="store_true",
+            help="Send every AI row to Ollama instead of consulting the local classifier first",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
 
     def handle(self, *args, **options):
-        csv_path = options["csv_path"]
-        modes = options["modes"]
+        try:
+            with open(options["csv_path"], "rb") as csv_file:
+                started = time.perf_counter()
+                statement = parse_statement(csv_file)
+                parse_seconds = time.perf_counter() - started
+        except OSError as exc:
+            raise CommandError(f"Cannot read {options['csv_path']}: {exc}")
+        if statement.get("error"):
+            raise CommandError(statement["error"])
+
+        rows = statement["rows"]
+        reference = dict(
+            training_queryset()
+            .filter(transaction_id__in=[row["transaction_id"] for row in rows])
+            .values_list("transaction_id", "title")
+        )
+        classifier = None if options["no_classifier"] else load_categorizer()
+        shared = SharedAnswers()
+        modes = list(dict.fromkeys(options["modes"]))
+
+        def run(mode):
+            return self._run_mode(mode, rows, shared, classifier, reference)
+
+        started = time.perf_counter()
+        if options["sequential"]:
+            reports = [run(mode) for mode in modes]
+        else:
+            with ThreadPoolExecutor(max_workers=len(modes)) as pool:
+                reports = list(pool.map(run, modes))
+        report = {
+            "rows": len(rows),
+            "skipped_rows": len(statement["skipped_rows"]),
+            "encoding_warning": statement["encoding_warning"],
+            "verified_rows": len(reference),
+            "parse_seconds": round(parse_seconds, 3),
+            "compare_seconds": round(time.perf_counter() - started, 3),
+            "modes": reports,
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print(report, statement)
+
+    @staticmethod
+    def _run_mode(mode, rows, shared, classifier, reference):
+        started = time.perf_counter()
+        needed = [index for index, row in enumerate(rows) if _should_use_ai(row["title_status"], mode)]
+        own = shared.claim(needed)
+        ai = latencies = None
+        classified = set()
+        if own:
+            answers = {}
+            with OllamaClient() as client:
+                try:
+                    if client.health_check():
+                        answers, classified = categorize_pending(
+                            [(index, rows[index]) for index in own], client, classifier,
+                        )
+                finally:
+                    # Modes waiting for these rows must not hang when Ollama is down or a call crashed.
+                    missing = (None, "ERROR", f"AI pominięte: {client.open_reason or 'przerwane porównanie'}")
+                    shared.publish({index: answers.get(index, missing) for index in own})
+                ai = client.summary()
+                latencies = client.latencies
+
+        statuses = Counter()
+        correct = labelled = unresolved = 0
+        for index, row in enumerate(rows):
+            title, title_status = row["title"], row["title_status"]
+            if _should_use_ai(title_status, mode):
+                title, title_status, _ = apply_ai_result(title_status, row["title_provenance"], shared.get(index))
+            statuses[final_status(title_status, row["lokal_status"])] += 1
+            expected = reference.get(row["transaction_id"])
+            if expected is not None:
+                labelled += 1
+                correct += title == expected
+                unresolved += title is None
+
+        return {
+            "mode": mode,
+            "seconds": round(time.perf_counter() - started, 3),
+            "processed": statuses["PROCESSED"],
+            "conflicts": statuses["CONFLICT"],
+            "unprocessed": statuses["UNPROCESSED"],
+            "ai_rows": len(needed),
+            "ai_rows_reused": len(needed) - len(own),
+            "classified": len(classified),
+            "ai": ai,
+            "latency_ms": {
+                "p50": round(quantile(latencies, 0.5) * 1000, 1),
+                "p95": round(quantile(latencies, 0.95) * 1000, 1),
+                "max": round(max(latencies) * 1000, 1),
+            } if ai and latencies else None,
+            "accuracy": {
+                "labelled": labelled,
+                "correct": correct,
+                "unresolved": unresolved,
+                "rate": round(correct / labelled, 3) if labelled else None,
+            },
+        }
 
+    def _print(self, report, statement):
         self.stdout.write(self.style.MIGRATE_HEADING(
-            f"Comparing AI modes: {', '.join(modes)}"
+            f"Comparing AI modes on {report['rows']} rows "
+            f"(parsed and rule-matched once in {report['parse_seconds']} s, "
+            f"{report['verified_rows']} already verified)"
         ))
+        for mode in report["modes"]:
+            self.stdout.write(self.style.WARNING(f"\nMode: {mode['mode']} ({mode['seconds']} s)"))
+            self.stdout.write(self.style.SUCCESS(
+                f"Processed: {mode['processed']}, "
+                f"Conflicts: {mode['conflicts']}, "
+                f"Unprocessed: {mode['unprocessed']}, "
+                f"Skipped: {report['skipped_rows']}, "
+                f"Encoding warning: {report['encoding_warning']}"
+            ))
+            if mode["ai_rows"]:
+                self.stdout.write(
+                    f"AI rows: {mode['ai_rows']} "
+                    f"({mode['classified']} by local classifier, {mode['ai_rows_reused']} reused from another mode)"
+                )
+            ai = mode["ai"]
+            if ai:
+                self.stdout.write(
+                    f"AI: {ai['calls']} calls ({ai['failures']} failed, {ai['skipped']} skipped) "
+                    f"in {ai['seconds']} s"
+                    + (f", disabled: {ai['disabled_reason']}" if ai["disabled_reason"] else "")
+                )
+            if mode["latency_ms"]:
+                latency = mode["latency_ms"]
+                self.stdout.write(
+                    f"AI latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, max {latency['max']} ms"
+                )
+            accuracy = mode["accuracy"]
+            if accuracy["labelled"]:
+                self.stdout.write(
+                    f"Accuracy vs verified: {accuracy['correct']}/{accuracy['labelled']} "
+                    f"({accuracy['rate']:.1%}), unresolved {accuracy['unresolved']}"
+                )
 
-        for mode in modes:
-            self.stdout.write(self.style.WARNING(f"\nMode: {mode}"))
-            with open(csv_path, "rb") as csv_file:
-                with transaction.atomic():
-                    summary = process_csv_file(csv_file, ai_mode=mode)
-                    transaction.set_rollback(True)
-
-                self.stdout.write(self.style.SUCCESS(
-                    f"Processed: {summary['processed_count']}, "
-                    f"Conflicts: {summary['conflict_count']}, "
-                    f"Unprocessed: {summary['unprocessed_count']}, "
-                    f"Manual work: {summary['has_manual_work']}, "
-                    f"Skipped: {len(summary['skipped_rows'])}, "
-                    f"Encoding warning: {summary['encoding_warning']}"
-                ))
-
-                if summary["skipped_rows"]:
-                    self.stdout.write(self.style.WARNING(
-                        f"Skipped rows: {summary['skipped_rows'][:5]}"
-                    ))
+        self.stdout.write(f"\nTotal: {report['compare_seconds']} s")
+        if statement["skipped_rows"]:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped rows: {statement['skipped_rows'][:5]}"
+            ))
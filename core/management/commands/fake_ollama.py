@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.fake_ollama import LATENCY_DISTRIBUTIONS, FakeOllamaConfig, FakeOllamaServer
+
+
+def add_fake_ollama_arguments(parser):
+    """Options shared with benchmark_ai, which starts the same server in a thread."""
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median/mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Latency spread (± for uniform, sigma for lognormal)")
+    parser.add_argument("--distribution", default="lognormal", choices=LATENCY_DISTRIBUTIONS, help="Latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of /api/generate calls answered with HTTP 500")
+    parser.add_argument("--unknown-rate", type=float, default=0.1, help="Fraction of unmatched prompts answered with UNKNOWN")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="Time per generated token after the first one")
+    parser.add_argument(
+        "--chatter-tokens", type=int, default=20,
+        help="Extra explanation tokens the model generates after the category code (cut by num_predict)",
+    )
+    parser.add_argument("--load-ms", type=float, default=0.0, help="Model load time on a cold start")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for latency and errors")
+
+
+def fake_ollama_config(options):
+    for key in ("error_rate", "unknown_rate"):
+        if not 0 <= options[key] <= 1:
+            raise CommandError(f"--{key.replace('_', '-')} must be between 0 and 1")
+    if min(options["latency_ms"], options["jitter_ms"], options["token_ms"], options["load_ms"]) < 0:
+        raise CommandError("--latency-ms, --jitter-ms, --token-ms and --load-ms must not be negative")
+    return FakeOllamaConfig(
+        latency_ms=options["latency_ms"],
+        jitter_ms=options["jitter_ms"],
+        distribution=options["distribution"],
+        error_rate=options["error_rate"],
+        unknown_rate=options["unknown_rate"],
+        token_ms=options["token_ms"],
+        chatter_tokens=options["chatter_tokens"],
+        load_ms=options["load_ms"],
+        seed=options["seed"],
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Run an offline stand-in for the Ollama API (/api/tags, /api/generate) with configurable "
+        "latency, error rate and deterministic category answers. Point OLLAMA_URL at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=11434)
+        add_fake_ollama_arguments(parser)
+
+    def handle(self, *args, **options):
+        config = fake_ollama_config(options)
+        try:
+            server = FakeOllamaServer((options["host"], options["port"]), config)
+        except OSError as exc:
+            raise CommandError(f"Cannot listen on {options['host']}:{options['port']}: {exc}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake Ollama listening on {server.url} "
+            f"({config.distribution} {config.latency_ms:.0f}±{config.jitter_ms:.0f} ms, "
+            f"error rate {config.error_rate:.0%}). Ctrl+C to stop."
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served: {server.stats.as_dict()}")
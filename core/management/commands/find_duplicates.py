@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.duplicates import backfill_fingerprints, open_candidates, scan_duplicates
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill missing transaction fingerprints and record pairs of transactions sharing a fingerprint "
+        "(same posting date, amount and normalized description/contractor) as duplicate candidates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20, help="Show at most this many open candidates")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        filled = backfill_fingerprints()
+        found = scan_duplicates()
+        self.stdout.write(self.style.SUCCESS(
+            f"Fingerprinted {filled} transactions, {found} new duplicate candidates "
+            f"in {time.perf_counter() - started:.2f} s."
+        ))
+        candidates = open_candidates()
+        for candidate in candidates[:options["limit"]]:
+            first, second = candidate.first, candidate.second
+            self.stdout.write(
+                f"{first.posting_date} {first.amount:>10} {first.transaction_id} <-> {second.transaction_id}  "
+                f"{(first.contractor or first.description)[:50]}"
+            )
+        remaining = candidates.count() - options["limit"]
+        if remaining > 0:
+            self.stdout.write(f"... and {remaining} more")
@@ -0,0 +1,306 @@
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import (
+    BUILDING_LOKAL_NUMBER,
+    Agreement,
+    FinancialTransaction,
+    FixedCost,
+    Lokal,
+    Meter,
+    MeterReading,
+    RentSchedule,
+    User,
+    WaterCostOverride,
+)
+from core.services.charges import mark_charges_stale, month_range
+from core.services.report_cache import BUILDING_SCOPE, invalidate
+
+CENT = Decimal("0.01")
+# Months in which bimonthly billing periods start (Jan-Feb, Mar-Apr, ...).
+PERIOD_START_MONTHS = (1, 3, 5, 7, 9, 11)
+
+
+def _money(value):
+    return Decimal(value).quantize(CENT)
+
+
+def _period_end(period_start):
+    return period_start + relativedelta(months=2, days=-1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large synthetic dataset (lokals, water meters, bimonthly readings, "
+        "agreements with annexes and rent history, rent schedule overrides, fixed cost "
+        "rate changes, water cost overrides and payments) using bulk_create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lokals", type=int, default=100, help="Number of lokals to create")
+        parser.add_argument("--years", type=int, default=5, help="Years of history to generate, ending today")
+        parser.add_argument(
+            "--prefix", default="S",
+            help="Prefix for unit numbers, e-mails, serial numbers and transaction ids (must be unused)",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument("--batch-size", type=int, default=2000, help="bulk_create batch size")
+        parser.add_argument(
+            "--chunk", type=int, default=100,
+            help="Lokals generated per chunk; bounds memory for readings and payments",
+        )
+
+    def handle(self, *args, **options):
+        lokal_count, years, prefix = options["lokals"], options["years"], options["prefix"]
+        if lokal_count < 1 or years < 1:
+            raise CommandError("--lokals and --years must be at least 1")
+        if len(f"{prefix}{lokal_count}") > Lokal._meta.get_field("unit_number").max_length:
+            raise CommandError("--prefix is too long for the unit_number field")
+        if Lokal.all_objects.filter(unit_number=f"{prefix}1").exists():
+            raise CommandError(f"Lokal '{prefix}1' already exists; choose another --prefix")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.prefix = prefix
+        self.today = date.today()
+        self.start = date(self.today.year - years + 1, 1, 1)
+        self.counts = {}
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            building = self._building_lokal()
+            self._create_fixed_costs()
+            self._create_water_overrides()
+            lokals = self._create_lokals(lokal_count)
+            users = self._create_users(lokal_count)
+            meters = self._create_meters(lokals)
+            for offset in range(0, lokal_count, options["chunk"]):
+                chunk = range(offset, min(offset + options["chunk"], lokal_count))
+                agreements = self._create_agreements([lokals[i] for i in chunk], [users[i] for i in chunk])
+                self._create_readings([m for i in chunk for m in meters[lokals[i].pk]])
+                self._create_rent_history(agreements)
+                self._create_rent_overrides(agreements)
+                self._create_payments(agreements)
+                self.stdout.write(f"  {min(offset + options['chunk'], lokal_count)}/{lokal_count} lokals")
+            self._create_water_invoices(building)
+
+            # bulk_create bypasses signals, so invalidate reports and charges explicitly.
+            mark_charges_stale()
+            invalidate(BUILDING_SCOPE)
+
+        elapsed = time.perf_counter() - started
+        for name, count in self.counts.items():
+            self.stdout.write(f"{name:>22}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Dataset generated in {elapsed:.1f} s"))
+
+    # --- helpers ---
+
+    def _bulk_create(self, model, objects, key=None):
+        """
+        bulk_create in batches. MySQL does not return primary keys from bulk inserts,
+        so when `key` (a unique field) is given the rows are re-read to fill them in.
+        """
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        name = str(model._meta.verbose_name_plural)
+        self.counts[name] = self.counts.get(name, 0) + len(objects)
+        if key and objects and objects[0].pk is None:
+            stored = model._default_manager.filter(
+                **{f"{key}__in": [getattr(obj, key) for obj in objects]}
+            ).in_bulk(field_name=key)
+            return [stored[getattr(obj, key)] for obj in objects]
+        return objects
+
+    def _building_lokal(self):
+        building, _ = Lokal.all_objects.get_or_create(
+            unit_number=BUILDING_LOKAL_NUMBER, defaults={"size_sqm": 0, "description": "Części wspólne"}
+        )
+        return building
+
+    def _create_fixed_costs(self):
+        # Per-person waste rate, raised every January.
+        rate = Decimal("22.00")
+        costs = []
+        for year in range(self.start.year, self.today.year + 1):
+            costs.append(FixedCost(
+                name=f"Wywóz śmieci {year} ({self.prefix})", category="waste",
+                calculation_method="per_person", amount=rate, effective_date=date(year, 1, 1),
+            ))
+            rate = _money(rate * Decimal("1.06"))
+        self._bulk_create(FixedCost, costs)
+
+    def _create_water_overrides(self):
+        existing = set(WaterCostOverride.objects.values_list("period_start_date", flat=True))
+        overrides = [
+            WaterCostOverride(
+                period_start_date=month,
+                overridden_bill_amount=_money(self.rng.uniform(4000, 9000)),
+            )
+            for month in month_range(self.start, self.today)
+            if month.month in PERIOD_START_MONTHS and month not in existing and self.rng.random() < 0.25
+        ]
+        self._bulk_create(WaterCostOverride, overrides)
+
+    def _create_lokals(self, count):
+        lokals = [
+            Lokal(unit_number=f"{self.prefix}{i}", size_sqm=_money(self.rng.uniform(25, 95)))
+            for i in range(1, count + 1)
+        ]
+        return self._bulk_create(Lokal, lokals, key="unit_number")
+
+    def _create_users(self, count):
+        users = [
+            User(
+                name=f"Najemca{i}", lastname=f"Skalowy{self.prefix}{i}",
+                email=f"scale-{self.prefix.lower()}{i}@example.com", role="lokator",
+            )
+            for i in range(1, count + 1)
+        ]
+        return self._bulk_create(User, users, key="email")
+
+    def _create_meters(self, lokals):
+        meters = []
+        for lokal in lokals:
+            for number, meter_type in enumerate(("cold_water", "hot_water"), 1):
+                meters.append(Meter(
+                    serial_number=f"{self.prefix}-{lokal.unit_number}-{meter_type}",
+                    type=meter_type, lokal=lokal, local_meter_number=number,
+                ))
+        meters = self._bulk_create(Meter, meters, key="serial_number")
+        by_lokal = {}
+        for meter in meters:
+            by_lokal.setdefault(meter.lokal_id, []).append(meter)
+        return by_lokal
+
+    def _create_readings(self, meters):
+        reading_dates = [self.start - timedelta(days=1)] + [
+            _period_end(month) for month in month_range(self.start, self.today)
+            if month.month in PERIOD_START_MONTHS and _period_end(month) <= self.today
+        ]
+        readings = []
+        for meter in meters:
+            value = Decimal(self.rng.randint(0, 500))
+            per_period = 6 if meter.type == "cold_water" else 3
+            for reading_date in reading_dates:
+                readings.append(MeterReading(meter=meter, reading_date=reading_date, value=value))
+                value += Decimal(self.rng.uniform(0.5, 2.0) * per_period).quantize(Decimal("0.001"))
+        self._bulk_create(MeterReading, readings)
+
+    def _create_agreements(self, lokals, users):
+        """One agreement per lokal from the start date, extended by annexes every few years."""
+        agreements = []
+        for lokal, user in zip(lokals, users):
+            start = self.start + relativedelta(months=self.rng.randint(0, 11))
+            occupants = self.rng.randint(1, 4)
+            rent = _money(self.rng.randint(8, 25) * 100)
+            while start <= self.today:
+                agreements.append(Agreement(
+                    user=user, lokal=lokal, signing_date=start - timedelta(days=14), start_date=start,
+                    rent_amount=rent, deposit_amount=rent * 2, number_of_occupants=occupants,
+                    type="umowa" if not agreements or agreements[-1].lokal is not lokal else "aneks",
+                ))
+                start = start + relativedelta(years=self.rng.randint(2, 5))
+                rent = _money(rent * Decimal("1.05"))
+                occupants = max(1, occupants + self.rng.choice((-1, 0, 0, 1)))
+
+        # The previous agreement ends the day before its annex and is archived.
+        for previous, current in zip(agreements, agreements[1:]):
+            if current.type == "aneks" and current.lokal is previous.lokal:
+                previous.end_date = current.start_date - timedelta(days=1)
+                previous.is_active = False
+        Agreement.objects.bulk_create(agreements, batch_size=self.batch_size)
+        self.counts["Umowy"] = self.counts.get("Umowy", 0) + len(agreements)
+
+        if agreements[0].pk is None:
+            stored = {
+                (ag.lokal_id, ag.start_date): ag
+                for ag in Agreement.all_objects.filter(lokal__in=lokals).select_related("lokal", "user")
+            }
+            agreements = [stored[(ag.lokal_id, ag.start_date)] for ag in agreements]
+        annexes = []
+        for previous, current in zip(agreements, agreements[1:]):
+            if current.type == "aneks" and current.lokal_id == previous.lokal_id:
+                current.old_agreement = previous
+                annexes.append(current)
+        Agreement.all_objects.bulk_update(annexes, ["old_agreement"], batch_size=self.batch_size)
+        return agreements
+
+    def _create_rent_history(self, agreements):
+        """simple_history rows: creation plus a rent indexation at the start of every later year."""
+        HistoricalAgreement = Agreement.history.model
+        fields = [f.attname for f in Agreement._meta.concrete_fields]
+        records = []
+        for agreement in agreements:
+            end = agreement.end_date or self.today
+            base = agreement.rent_amount
+            for year_offset, year in enumerate(range(agreement.start_date.year, end.year + 1)):
+                changed_on = agreement.start_date if year_offset == 0 else date(year, 1, 1)
+                values = {name: getattr(agreement, name) for name in fields}
+                values["rent_amount"] = _money(base * Decimal("1.03") ** year_offset)
+                records.append(HistoricalAgreement(
+                    **values,
+                    history_date=timezone.make_aware(datetime.combine(changed_on, dt_time.min)),
+                    history_type="+" if year_offset == 0 else "~",
+                    history_change_reason="Waloryzacja czynszu" if year_offset else None,
+                ))
+            # The agreement's current rent matches its latest history record.
+            agreement.rent_amount = records[-1].rent_amount
+        HistoricalAgreement.objects.bulk_create(records, batch_size=self.batch_size)
+        Agreement.all_objects.bulk_update(agreements, ["rent_amount"], batch_size=self.batch_size)
+        self.counts["Historia umów"] = self.counts.get("Historia umów", 0) + len(records)
+
+    def _create_rent_overrides(self, agreements):
+        overrides = []
+        for agreement in agreements:
+            if self.rng.random() >= 0.1:
+                continue
+            months = month_range(agreement.start_date.replace(day=1), agreement.end_date or self.today)
+            for month in self.rng.sample(months, min(2, len(months))):
+                overrides.append(RentSchedule(
+                    agreement=agreement, year_month=month,
+                    due_amount=_money(agreement.rent_amount / 2),
+                    description="Korekta za połowę miesiąca",
+                ))
+        self._bulk_create(RentSchedule, overrides)
+
+    def _create_payments(self, agreements):
+        payments = []
+        for agreement in agreements:
+            for month in month_range(agreement.start_date.replace(day=1), agreement.end_date or self.today):
+                # Some tenants skip a month or pay only part of the rent.
+                roll = self.rng.random()
+                if roll < 0.05:
+                    continue
+                amount = agreement.rent_amount if roll > 0.15 else _money(agreement.rent_amount * Decimal("0.6"))
+                payments.append(FinancialTransaction(
+                    user_id=agreement.user_id, lokal_id=agreement.lokal_id,
+                    amount=amount + Decimal(self.rng.randint(80, 200)),
+                    posting_date=month + timedelta(days=self.rng.randint(0, 14)),
+                    description=f" Czynsz {agreement.lokal.unit_number} {month:%m/%Y}",
+                    contractor=f" {agreement.user.lastname} {agreement.user.name} ",
+                    transaction_id=f"{self.prefix}-{agreement.pk}-{month:%Y%m}",
+                    title="czynsz", status="PROCESSED",
+                ))
+        self._bulk_create(FinancialTransaction, payments)
+
+    def _create_water_invoices(self, building):
+        invoices = [
+            FinancialTransaction(
+                lokal=building,
+                amount=-_money(self.rng.uniform(4000, 9000)),
+                posting_date=_period_end(month) + timedelta(days=self.rng.randint(10, 30)),
+                description=f" Faktura VAT za wodę {month:%m/%Y}",
+                contractor=" AQUA S.A. ",
+                transaction_id=f"{self.prefix}-water-{month:%Y%m}",
+                title="oplata_za_wode", status="PROCESSED",
+            )
+            for month in month_range(self.start, self.today)
+            if month.month in PERIOD_START_MONTHS and _period_end(month) < self.today
+        ]
+        self._bulk_create(FinancialTransaction, invoices)
@@ -0,0 +1,43 @@
+import datetime
+from datetime import date
+
+from django.core.management.base import CommandError
+
+from core.services.charges import close_period, month_range, post_charges
+from core.services.profiling import ProfiledCommand
+
+
+def _parse_month(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError(f"Invalid month '{value}', expected YYYY-MM")
+
+
+class Command(ProfiledCommand):
+    help = (
+        "Post MonthlyCharge rows (rent, waste, water) for all active agreements "
+        "for a month range. Idempotent; optionally closes (freezes) the range."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="month_from", help="First month, YYYY-MM (default: current month)")
+        parser.add_argument("--to", dest="month_to", help="Last month, YYYY-MM (default: same as --from)")
+        parser.add_argument("--close", action="store_true", help="Freeze the posted months afterwards")
+
+    def handle(self, *args, **options):
+        month_from = _parse_month(options["month_from"]) if options["month_from"] else date.today().replace(day=1)
+        month_to = _parse_month(options["month_to"]) if options["month_to"] else month_from
+        if month_to < month_from:
+            raise CommandError("--to must not be earlier than --from")
+
+        months = month_range(month_from, month_to)
+        summary = post_charges(months)
+        self.stdout.write(self.style.SUCCESS(
+            f"Posted {len(months)} month(s): created {summary['created']}, "
+            f"updated {summary['updated']}, deleted {summary['deleted']}"
+        ))
+
+        if options["close"]:
+            closed = close_period(months)
+            self.stdout.write(self.style.WARNING(f"Closed {closed} charge row(s)"))
@@ -0,0 +1,84 @@
+from datetime import date
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Agreement
+from core.services import metrics
+from core.services.pdf_generation import build_annual_report_pdf
+from core.services.reporting import get_annual_report_context
+from core.services.transaction_processing import AI_MODES, process_csv_file
+
+DEFAULT_URL = "http://127.0.0.1:8000/metrics/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Show stage timing histograms (count, p50/p95/p99). Either fetch them from a running "
+        "server's /metrics/ endpoint or run an import / annual report locally and show its spans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help=f"Fetch metrics from this endpoint (default when no workload: {DEFAULT_URL})")
+        parser.add_argument(
+            "--token", help="Bearer token for the endpoint (default: settings.METRICS_TOKEN)",
+        )
+        parser.add_argument("--import-csv", metavar="PATH", help="Import this CSV locally (rolled back) and report its spans")
+        parser.add_argument("--ai-mode", default="rule_only", choices=AI_MODES, help="AI mode for --import-csv")
+        parser.add_argument("--annual-report", type=int, metavar="AGREEMENT_ID", help="Build the annual report and PDF for this agreement")
+        parser.add_argument("--year", type=int, help="Year for --annual-report (default: current year)")
+        parser.add_argument("--repeat", type=int, default=1, help="Run the local workload this many times")
+        parser.add_argument("--prometheus", action="store_true", help="Print the raw Prometheus text format")
+
+    def handle(self, *args, **options):
+        local_workload = options["import_csv"] or options["annual_report"]
+        if local_workload:
+            metrics.reset()
+            for _ in range(options["repeat"]):
+                self._run_workload(options)
+            rows = metrics.snapshot()
+        else:
+            rows = self._fetch(options["url"] or DEFAULT_URL, options["token"] or getattr(settings, "METRICS_TOKEN", ""))
+
+        if options["prometheus"]:
+            self.stdout.write(metrics.render_prometheus(rows), ending="")
+            return
+        if not rows:
+            self.stdout.write(self.style.WARNING("No spans recorded yet."))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{'stage':<32} {'count':>7} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        ))
+        for row in rows:
+            self.stdout.write(
+                f"{row['name']:<32} {row['count']:>7} {row['sum']:>9.3f} "
+                f"{row.get('p50', 0) * 1000:>9.2f} {row.get('p95', 0) * 1000:>9.2f} {row.get('p99', 0) * 1000:>9.2f}"
+            )
+
+    def _run_workload(self, options):
+        if options["import_csv"]:
+            with open(options["import_csv"], "rb") as csv_file, transaction.atomic():
+                summary = process_csv_file(csv_file, ai_mode=options["ai_mode"])
+                transaction.set_rollback(True)
+            if "error" in summary:
+                raise CommandError(summary["error"])
+        if options["annual_report"]:
+            try:
+                agreement = Agreement.all_objects.get(pk=options["annual_report"])
+            except Agreement.DoesNotExist:
+                raise CommandError(f"Agreement {options['annual_report']} does not exist")
+            year = options["year"] or date.today().year
+            build_annual_report_pdf(get_annual_report_context(agreement, year, _cache={}))
+
+    @staticmethod
+    def _fetch(url, token):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        try:
+            response = requests.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as exc:
+            raise CommandError(f"Cannot fetch metrics from {url}: {exc}")
+        return metrics.parse_prometheus(response.text)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.rule_suggestions import create_rules, suggest_rules
+
+
+class Command(BaseCommand):
+    help = (
+        "Propose CategorizationRule keywords from repeated, consistent AI decisions "
+        "(the AIDecision log filled by imports) and optionally create them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-count", type=int, help="Decisions a keyword must match (default RULE_SUGGESTION_MIN_COUNT)")
+        parser.add_argument(
+            "--min-agreement", type=float,
+            help="Required share of the most common title (default RULE_SUGGESTION_MIN_AGREEMENT)",
+        )
+        parser.add_argument("--limit", type=int, default=50, help="Show at most this many suggestions")
+        parser.add_argument("--create", action="store_true", help="Create the suggested rules")
+
+    def handle(self, *args, **options):
+        if options["min_agreement"] is not None and not 0 < options["min_agreement"] <= 1:
+            raise CommandError("--min-agreement must be in (0, 1]")
+        suggestions = suggest_rules(min_count=options["min_count"], min_agreement=options["min_agreement"])
+        if not suggestions:
+            self.stdout.write("No rule suggestions.")
+            return
+
+        shown = suggestions[:options["limit"]]
+        for s in shown:
+            self.stdout.write(
+                f"{s.support:>5}x {s.agreement:>6.0%}  [{s.source}] '{s.keywords}' -> {s.title}"
+            )
+        if len(suggestions) > len(shown):
+            self.stdout.write(f"... and {len(suggestions) - len(shown)} more")
+
+        if options["create"]:
+            created = create_rules(shown)
+            self.stdout.write(self.style.SUCCESS(f"Created {created} rules."))
@@ -0,0 +1,75 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.categorizer import NaiveBayesCategorizer, model_path, save_model, training_queryset
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local transaction title classifier on verified / manually edited transactions "
+        "and save it to CATEGORIZER_MODEL_PATH. Imports consult it before calling Ollama."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Model file (default settings.CATEGORIZER_MODEL_PATH)")
+        parser.add_argument(
+            "--include-processed", action="store_true",
+            help="Also learn from automatically processed (rule-matched) transactions",
+        )
+        parser.add_argument("--alpha", type=float, default=0.5, help="Naive Bayes additive smoothing")
+        parser.add_argument(
+            "--holdout", type=float, default=0.2,
+            help="Fraction held out to report accuracy before training on everything (0 to skip)",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the holdout split")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["holdout"] < 1:
+            raise CommandError("--holdout must be in [0, 1)")
+        samples = list(
+            training_queryset(options["include_processed"]).values_list("description", "contractor", "title")
+        )
+        if not samples:
+            raise CommandError("No labelled transactions to train on (verify some transactions first)")
+
+        if options["holdout"] and len(samples) >= 10:
+            self._evaluate(samples, options)
+
+        started = time.perf_counter()
+        model = NaiveBayesCategorizer(alpha=options["alpha"]).fit(samples)
+        path = options["output"] or model_path()
+        save_model(model, path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained on {len(samples)} transactions, {len(model.class_counts)} titles, "
+            f"{model.vocabulary_size} features in {time.perf_counter() - started:.2f} s -> {path}"
+        ))
+
+    def _evaluate(self, samples, options):
+        shuffled = samples[:]
+        random.Random(options["seed"]).shuffle(shuffled)
+        split = int(len(shuffled) * options["holdout"]) or 1
+        test, train = shuffled[:split], shuffled[split:]
+        model = NaiveBayesCategorizer(alpha=options["alpha"]).fit(train)
+        threshold = getattr(settings, "CATEGORIZER_MIN_CONFIDENCE", 0.9)
+
+        correct = confident = confident_correct = 0
+        started = time.perf_counter()
+        for description, contractor, title in test:
+            predicted, confidence = model.predict(description, contractor)
+            correct += predicted == title
+            if confidence >= threshold:
+                confident += 1
+                confident_correct += predicted == title
+        per_item_ms = (time.perf_counter() - started) * 1000 / len(test)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Holdout evaluation ({len(test)} of {len(samples)})"))
+        self.stdout.write(f"  accuracy (all predictions): {correct / len(test):.1%}")
+        self.stdout.write(
+            f"  confidence >= {threshold:.0%}: {confident / len(test):.1%} of transactions "
+            f"(would skip Ollama), precision {confident_correct / confident:.1%}"
+            if confident else f"  no prediction reached confidence {threshold:.0%}"
+        )
+        self.stdout.write(f"  inference: {per_item_ms:.3f} ms per transaction")
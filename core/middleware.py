@@ -1,5 +1,13 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
 from django.shortcuts import redirect
 
+from .services.performance import QueryRecorder, record_request
+from .services.profiling import match_rule, run_profiled
+
 
 class ForcePasswordChangeMiddleware:
     """
@@ -26,3 +34,80 @@ class ForcePasswordChangeMiddleware:
         ):
             return redirect('password_change')
         return self.get_response(request)
+
+
+class PerformanceMiddleware:
+    """
+    Opcjonalny pomiar wydajności żądań (włączany ustawieniem PERF_MONITORING_ENABLED).
+    Mierzy czas żądania i zapytania SQL, dodaje nagłówek Server-Timing
+    i zapisuje statystyki (core/services/performance.py) widoczne na stronie
+    /perf/ dla superużytkownika.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_MONITORING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'PERF_SLOW_REQUEST_MS', 500)
+        self.duplicate_threshold = getattr(settings, 'PERF_DUPLICATE_QUERY_THRESHOLD', 5)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = recorder.total_ms
+
+        response['Server-Timing'] = (
+            f'total;dur={total_ms:.1f}, '
+            f'db;dur={db_ms:.1f};desc="{recorder.count} queries", '
+            f'app;dur={max(total_ms - db_ms, 0):.1f}'
+        )
+
+        match = getattr(request, 'resolver_match', None)
+        slow = total_ms >= self.slow_ms
+        record_request({
+            'endpoint': match.view_name if match else request.path,
+            'path': request.get_full_path(),
+            'method': request.method,
+            'status': response.status_code,
+            'ms': round(total_ms, 2),
+            'queries': recorder.count,
+            'db_ms': round(db_ms, 2),
+            'slow': slow,
+            # Szczegóły tylko dla wolnych żądań — trafiają do bufora.
+            'slowest_queries': recorder.slowest() if slow else [],
+            'duplicates': recorder.duplicates(self.duplicate_threshold) if slow else [],
+            'timestamp': time.time(),
+        })
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profilowanie cProfile widoków wskazanych regułami ProfilingRule (admin).
+    Widok jest wykonywany pod profilerem tylko, gdy pasuje aktywna reguła;
+    profil zapisywany jest, jeśli czas przekroczy próg (core/services/profiling.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name if request.resolver_match else ''
+        rule = match_rule('url', view_name, request.path)
+        if rule is None:
+            return None
+        def view_and_render():
+            response = view_func(request, *view_args, **view_kwargs)
+            # TemplateResponse renderuje się dopiero poza widokiem — wymuszamy render
+            # pod profilerem, żeby koszt szablonu trafił do profilu.
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            return response
+
+        return run_profiled(rule, 'url', view_name or request.path, request.get_full_path(), view_and_render)
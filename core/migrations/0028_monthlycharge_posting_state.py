@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_user_is_admin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlycharge',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, help_text='Naliczenia w zamkniętym okresie nie są już przeliczane.', null=True, verbose_name='Data zamknięcia okresu'),
+        ),
+        migrations.AddField(
+            model_name='monthlycharge',
+            name='is_stale',
+            field=models.BooleanField(default=False, help_text='Ustawiane, gdy zmieniły się dane wejściowe naliczenia.', verbose_name='Wymaga przeliczenia'),
+        ),
+        migrations.AddField(
+            model_name='monthlycharge',
+            name='posted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data zaksięgowania'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlycharge',
+            index=models.Index(fields=['month_year', 'closed_at'], name='monthlycharge_month_closed_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_monthlycharge_posting_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgreementBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='Pierwszy dzień miesiąca, np. 2025-01-01', verbose_name='Miesiąc')),
+                ('opening_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Saldo otwarcia')),
+                ('charges', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Naliczenia')),
+                ('payments', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Wpłaty')),
+                ('closing_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Saldo zamknięcia')),
+                ('is_stale', models.BooleanField(default=False, verbose_name='Wymaga przeliczenia')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agreement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='core.agreement', verbose_name='Umowa')),
+            ],
+            options={
+                'verbose_name': 'Saldo miesięczne umowy',
+                'verbose_name_plural': 'Salda miesięczne umów',
+                'ordering': ['agreement', '-month'],
+                'indexes': [models.Index(fields=['month', 'closing_balance'], name='balance_month_closing_idx'), models.Index(fields=['is_stale'], name='balance_stale_idx')],
+                'unique_together': {('agreement', 'month')},
+            },
+        ),
+    ]
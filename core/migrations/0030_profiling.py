@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_agreementbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('url', 'Żądanie HTTP'), ('command', 'Komenda zarządzania')], default='url', max_length=20, verbose_name='Rodzaj')),
+                ('target', models.CharField(help_text="Nazwa widoku (np. 'annual_agreement_report'), prefiks ścieżki zaczynający się od '/' lub nazwa komendy (np. 'compare_ai_modes').", max_length=255, verbose_name='Cel')),
+                ('threshold_ms', models.PositiveIntegerField(default=1000, help_text='Profil jest zapisywany tylko dla wolniejszych wykonań.', verbose_name='Próg [ms]')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Aktywna')),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Po tej dacie reguła jest ignorowana.', null=True, verbose_name='Wygasa')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Reguła profilowania',
+                'verbose_name_plural': 'Reguły profilowania',
+            },
+        ),
+        migrations.CreateModel(
+            name='CapturedProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('url', 'Żądanie HTTP'), ('command', 'Komenda zarządzania')], max_length=20, verbose_name='Rodzaj')),
+                ('target', models.CharField(max_length=255, verbose_name='Cel')),
+                ('path', models.CharField(blank=True, max_length=500, verbose_name='Ścieżka / argumenty')),
+                ('duration_ms', models.PositiveIntegerField(verbose_name='Czas [ms]')),
+                ('file', models.FileField(upload_to='profiles/', verbose_name='Plik .prof')),
+                ('summary', models.TextField(blank=True, verbose_name='Najkosztowniejsze funkcje')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('rule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='core.profilingrule', verbose_name='Reguła')),
+            ],
+            options={
+                'verbose_name': 'Zapisany profil',
+                'verbose_name_plural': 'Zapisane profile',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
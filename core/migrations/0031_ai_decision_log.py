@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_profiling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIDecision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.TextField(blank=True, verbose_name='Opis')),
+                ('contractor', models.CharField(blank=True, max_length=255, verbose_name='Kontrahent')),
+                ('contractor_key', models.CharField(blank=True, db_index=True, help_text='Początkowe słowa nazwy kontrahenta — klucz grupowania decyzji.', max_length=255, verbose_name='Kontrahent (znormalizowany)')),
+                ('title', models.CharField(blank=True, choices=[('czynsz', 'czynsz'), ('oplaty', 'opłaty'), ('oplata_bankowa', 'opłata bankowa'), ('energia_klatka', 'energia klatka'), ('energia_m8', 'energię M8'), ('na_potrzeby_kamienicy', 'na potrzeby kamienicy'), ('naprawy_remonty', 'naprawy/remonty'), ('oplata_za_wode', 'opłata za wodę'), ('wywoz_smieci', 'wywóz śmieci'), ('sprzatanie', 'sprzątanie'), ('ogrodnik', 'ogrodnik'), ('ubezpieczenie', 'ubezpieczenie'), ('internet_telefon', 'internet/telefon'), ('elektryk', 'elektryk'), ('kominiarz', 'kominiarz'), ('piece_co', 'piece co'), ('podatek', 'podatek'), ('oplata_nie_stanowiaca_kosztu', 'opłata nie stanowiąca kosztu')], help_text='Puste = AI odpowiedziało UNKNOWN.', max_length=100, null=True, verbose_name='Tytuł wg AI')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_decisions', to='core.financialtransaction', verbose_name='Transakcja')),
+            ],
+            options={
+                'verbose_name': 'Decyzja AI',
+                'verbose_name_plural': 'Decyzje AI',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:20
+
+import datetime
+
+from django.db import migrations, models
+
+# Reguły sprzed liczników dopasowań dostają datę utworzenia z przeszłości — inaczej
+# każda nigdy niedopasowana reguła byłaby niewidoczna dla przeglądu nieaktualnych
+# reguł (RULE_STALE_DAYS) przez rok od migracji.
+EXISTING_RULES_CREATED_AT = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_ai_decision_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categorizationrule',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Liczba dopasowań'),
+        ),
+        migrations.AddField(
+            model_name='categorizationrule',
+            name='last_hit_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Ostatnie dopasowanie'),
+        ),
+        migrations.AddField(
+            model_name='categorizationrule',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=EXISTING_RULES_CREATED_AT, verbose_name='Utworzono'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='lokalassignmentrule',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Liczba dopasowań'),
+        ),
+        migrations.AddField(
+            model_name='lokalassignmentrule',
+            name='last_hit_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Ostatnie dopasowanie'),
+        ),
+        migrations.AddField(
+            model_name='lokalassignmentrule',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=EXISTING_RULES_CREATED_AT, verbose_name='Utworzono'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_rule_hit_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(blank=True, max_length=255, verbose_name='Plik')),
+                ('ai_mode', models.CharField(max_length=40, verbose_name='Tryb AI')),
+                ('status', models.CharField(choices=[('STAGED', 'Do zatwierdzenia'), ('COMMITTED', 'Zatwierdzony'), ('DISCARDED', 'Odrzucony')], default='STAGED', max_length=20, verbose_name='Status')),
+                ('summary', models.JSONField(blank=True, default=dict, help_text='Pominięte wiersze, ostrzeżenie o kodowaniu, statystyki AI i klasyfikatora.', verbose_name='Podsumowanie')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Zakończono')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Utworzył')),
+            ],
+            options={
+                'verbose_name': 'Import (podgląd)',
+                'verbose_name_plural': 'Importy (podgląd)',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StagedTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('NEW', 'Nowa'), ('UPDATE', 'Aktualizacja')], default='NEW', max_length=10, verbose_name='Operacja')),
+                ('transaction_id', models.CharField(max_length=255, verbose_name='ID Transakcji')),
+                ('posting_date', models.DateField(verbose_name='Data księgowania')),
+                ('description', models.TextField(blank=True, verbose_name='Opis')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Kwota [+/-]')),
+                ('contractor', models.CharField(blank=True, max_length=255, null=True, verbose_name='Kontrahent')),
+                ('title', models.CharField(blank=True, choices=[('czynsz', 'czynsz'), ('oplaty', 'opłaty'), ('oplata_bankowa', 'opłata bankowa'), ('energia_klatka', 'energia klatka'), ('energia_m8', 'energię M8'), ('na_potrzeby_kamienicy', 'na potrzeby kamienicy'), ('naprawy_remonty', 'naprawy/remonty'), ('oplata_za_wode', 'opłata za wodę'), ('wywoz_smieci', 'wywóz śmieci'), ('sprzatanie', 'sprzątanie'), ('ogrodnik', 'ogrodnik'), ('ubezpieczenie', 'ubezpieczenie'), ('internet_telefon', 'internet/telefon'), ('elektryk', 'elektryk'), ('kominiarz', 'kominiarz'), ('piece_co', 'piece co'), ('podatek', 'podatek'), ('oplata_nie_stanowiaca_kosztu', 'opłata nie stanowiąca kosztu')], max_length=100, null=True, verbose_name='Tytułem')),
+                ('status', models.CharField(choices=[('PROCESSED', 'Przetworzono automatycznie'), ('UNPROCESSED', 'Nieprzetworzono'), ('CONFLICT', 'Konflikt reguł'), ('MANUALLY_EDITED', 'Edytowano ręcznie')], max_length=20, verbose_name='Status')),
+                ('processing_log', models.TextField(blank=True, verbose_name='Log przetwarzania')),
+                ('ai_source', models.CharField(blank=True, help_text="'AI' — odpowiedź Ollamy, 'ML' — lokalny klasyfikator, puste — reguły.", max_length=2, verbose_name='Źródło tytułu')),
+                ('ai_title', models.CharField(blank=True, max_length=100, null=True, verbose_name='Tytuł wg AI')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_rows', to='core.importjob', verbose_name='Import')),
+                ('lokal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.lokal', verbose_name='Lokal')),
+            ],
+            options={
+                'verbose_name': 'Transakcja w podglądzie importu',
+                'verbose_name_plural': 'Transakcje w podglądzie importu',
+                'ordering': ['job', 'id'],
+            },
+        ),
+    ]
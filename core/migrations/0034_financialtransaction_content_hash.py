@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:10
+
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def row_content_hash(row):
+    # Kopia transaction_processing.row_content_hash z chwili tej migracji —
+    # migracja nie może zależeć od kodu aplikacji, który później się zmieni.
+    content = "\x1f".join((
+        row["posting_date"].isoformat(),
+        str(Decimal(row["amount"]).quantize(Decimal("0.01"))),
+        row["description"] or "",
+        row["contractor"] or "",
+    ))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def backfill_content_hash(apps, schema_editor):
+    # Bez skrótu pierwszy ponowny import po wdrożeniu przetworzyłby cały wyciąg od nowa.
+    FinancialTransaction = apps.get_model('core', 'FinancialTransaction')
+    batch = []
+    for ft in FinancialTransaction.objects.filter(transaction_id__isnull=False).iterator(chunk_size=2000):
+        ft.content_hash = row_content_hash({
+            "posting_date": ft.posting_date,
+            "amount": ft.amount,
+            "description": ft.description,
+            "contractor": ft.contractor,
+        })
+        batch.append(ft)
+        if len(batch) >= 2000:
+            FinancialTransaction.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    FinancialTransaction.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_import_staging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialtransaction',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40, verbose_name='Skrót treści z importu'),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
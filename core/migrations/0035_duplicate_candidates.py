@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:14
+
+import hashlib
+import re
+import unicodedata
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Kopia normalizacji i odcisku z core.services.duplicates z chwili tej migracji —
+# migracja nie może zależeć od kodu aplikacji, który później się zmieni.
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(value):
+    value = unicodedata.normalize("NFKD", (value or "").lower().replace("ł", "l"))
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", value).strip()
+
+
+def transaction_fingerprint(posting_date, amount, description, contractor):
+    if posting_date is None or amount is None:
+        return ""
+    content = "|".join((
+        posting_date.isoformat(),
+        str(Decimal(amount).quantize(Decimal("0.01"))),
+        normalize_text(description),
+        normalize_text(contractor),
+    ))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    FinancialTransaction = apps.get_model('core', 'FinancialTransaction')
+    batch = []
+    for ft in FinancialTransaction.objects.iterator(chunk_size=2000):
+        ft.fingerprint = transaction_fingerprint(ft.posting_date, ft.amount, ft.description, ft.contractor)
+        batch.append(ft)
+        if len(batch) >= 2000:
+            FinancialTransaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    FinancialTransaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_financialtransaction_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialtransaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=40, verbose_name='Odcisk'),
+        ),
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, verbose_name='Odcisk')),
+                ('status', models.CharField(choices=[('OPEN', 'Do przeglądu'), ('DISMISSED', 'To nie duplikat')], default='OPEN', max_length=20, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Wykryto')),
+                ('first', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.financialtransaction', verbose_name='Transakcja')),
+                ('second', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.financialtransaction', verbose_name='Możliwy duplikat')),
+            ],
+            options={
+                'verbose_name': 'Kandydat na duplikat',
+                'verbose_name_plural': 'Kandydaci na duplikaty',
+                'ordering': ['-created_at', 'pk'],
+                'unique_together': {('first', 'second')},
+            },
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_split_lineage(apps, schema_editor):
+    # Dotychczas powiązanie wynikało tylko z identyfikatora: "<id>_split", "<id>_split_<timestamp>",
+    # także zagnieżdżone ("<id>_split_split"). Rodzicem jest najdłuższy istniejący prefiks przed "_split".
+    FinancialTransaction = apps.get_model('core', 'FinancialTransaction')
+    parts = list(
+        FinancialTransaction.objects.filter(transaction_id__contains='_split').values_list('pk', 'transaction_id')
+    )
+    if not parts:
+        return
+    candidates = set()
+    for _, transaction_id in parts:
+        prefix = transaction_id
+        while '_split' in prefix:
+            prefix = prefix.rsplit('_split', 1)[0]
+            candidates.add(prefix)
+    pk_by_id = {}
+    candidates = list(candidates)
+    for offset in range(0, len(candidates), 500):
+        pk_by_id.update(FinancialTransaction.objects.filter(
+            transaction_id__in=candidates[offset:offset + 500]
+        ).values_list('transaction_id', 'pk'))
+
+    parent_of = {}
+    for pk, transaction_id in parts:
+        prefix = transaction_id
+        while '_split' in prefix:
+            prefix = prefix.rsplit('_split', 1)[0]
+            if prefix in pk_by_id:
+                parent_of[pk] = pk_by_id[prefix]
+                break
+
+    def root(pk):
+        while pk in parent_of:
+            pk = parent_of[pk]
+        return pk
+
+    updates = {}
+    for pk, parent_pk in parent_of.items():
+        group = root(pk)
+        updates[pk] = FinancialTransaction(pk=pk, parent_id=parent_pk, split_group=group)
+        updates.setdefault(group, FinancialTransaction(pk=group, parent_id=None, split_group=group))
+    FinancialTransaction.objects.bulk_update(list(updates.values()), ['parent', 'split_group'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_duplicate_candidates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialtransaction',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='split_children', to='core.financialtransaction', verbose_name='Wydzielona z'),
+        ),
+        migrations.AddField(
+            model_name='financialtransaction',
+            name='split_group',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Grupa podziału'),
+        ),
+        migrations.RunPython(backfill_split_lineage, migrations.RunPython.noop),
+    ]
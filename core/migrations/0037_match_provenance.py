@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_split_lineage'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='stagedtransaction',
+            name='processing_log',
+        ),
+        migrations.AddField(
+            model_name='financialtransaction',
+            name='provenance',
+            field=models.JSONField(blank=True, default=dict, help_text='Kody dopasowania: id reguł, rodzaj dopasowania, źródło AI i kandydaci na lokal.', verbose_name='Pochodzenie dopasowania'),
+        ),
+        migrations.AddField(
+            model_name='stagedtransaction',
+            name='provenance',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Pochodzenie dopasowania'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from simple_history.models import HistoricalRecords
@@ -282,8 +283,25 @@ class FinancialTransaction(models.Model):
         ('oplata_nie_stanowiaca_kosztu', 'opłata nie stanowiąca kosztu'),
     ]
     title = models.CharField("Tytułem", max_length=100, choices=TITLE_CHOICES, blank=True, null=True)
+    # Tekstowy log starszych importów; nowe zapisują zwięzłe provenance (czytelny opis: core/services/provenance.py).
     processing_log = models.TextField("Log przetwarzania", blank=True, null=True)
+    provenance = models.JSONField(
+        "Pochodzenie dopasowania", default=dict, blank=True,
+        help_text="Kody dopasowania: id reguł, rodzaj dopasowania, źródło AI i kandydaci na lokal.",
+    )
     verified = models.BooleanField("Zweryfikowano ręcznie", default=False)
+    # Skrót treści wiersza wyciągu z ostatniego importu (row_content_hash) — ponowny import pomija niezmienione.
+    content_hash = models.CharField("Skrót treści z importu", max_length=40, blank=True, editable=False)
+    # Odcisk (data, kwota, znormalizowany opis/kontrahent) do wykrywania duplikatów — core/services/duplicates.py.
+    fingerprint = models.CharField("Odcisk", max_length=40, blank=True, editable=False, db_index=True)
+    # Podział wpłaty (core/services/splits.py): część wskazuje transakcję, z której ją wydzielono,
+    # a cała rodzina podziału (także zagnieżdżonego) ma wspólny split_group = pk transakcji źródłowej.
+    # PROTECT: części to zaksięgowane wpłaty — usuwa się je jawnie (splits.delete_split_family), nie kaskadowo.
+    parent = models.ForeignKey(
+        'self', verbose_name="Wydzielona z", on_delete=models.PROTECT, null=True, blank=True,
+        related_name="split_children",
+    )
+    split_group = models.BigIntegerField("Grupa podziału", null=True, blank=True, editable=False, db_index=True)
 
     STATUS_CHOICES = [
         ('PROCESSED', 'Przetworzono automatycznie'),
@@ -303,12 +321,16 @@ class FinancialTransaction(models.Model):
 
     @property
     def is_split_payment(self):
-        return self.transaction_id and '_split' in self.transaction_id
+        return self.parent_id is not None
 
 # --- 9. Reguły Kategoryzacji ---
 class CategorizationRule(models.Model):
     keywords = models.CharField("Słowa kluczowe (oddzielone przecinkami)", max_length=255)
     title = models.CharField("Tytuł", max_length=100, choices=FinancialTransaction.TITLE_CHOICES)
+    # Statystyki dopasowań — aktualizowane zbiorczo po imporcie / ponownym przetworzeniu (RuleHits).
+    hit_count = models.PositiveIntegerField("Liczba dopasowań", default=0)
+    last_hit_at = models.DateTimeField("Ostatnie dopasowanie", null=True, blank=True)
+    created_at = models.DateTimeField("Utworzono", auto_now_add=True)
 
     class Meta:
         verbose_name = "Reguła kategoryzacji"
@@ -321,6 +343,9 @@ class CategorizationRule(models.Model):
 class LokalAssignmentRule(models.Model):
     keywords = models.CharField("Słowa kluczowe / Nr konta", max_length=255, help_text="Np. nazwisko, fragment opisu, numer konta bankowego")
     lokal = models.ForeignKey(Lokal, verbose_name="Przypisany Lokal", on_delete=models.CASCADE)
+    hit_count = models.PositiveIntegerField("Liczba dopasowań", default=0)
+    last_hit_at = models.DateTimeField("Ostatnie dopasowanie", null=True, blank=True)
+    created_at = models.DateTimeField("Utworzono", auto_now_add=True)
 
     class Meta:
         verbose_name = "Reguła przypisania lokalu"
@@ -357,11 +382,19 @@ class MonthlyCharge(models.Model):
     description = models.TextField("Opis/Notatki do naliczenia", blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Stan księgowania (patrz core/services/charges.py)
+    posted_at = models.DateTimeField("Data zaksięgowania", default=timezone.now)
+    is_stale = models.BooleanField("Wymaga przeliczenia", default=False, help_text="Ustawiane, gdy zmieniły się dane wejściowe naliczenia.")
+    closed_at = models.DateTimeField("Data zamknięcia okresu", null=True, blank=True, help_text="Naliczenia w zamkniętym okresie nie są już przeliczane.")
+
     class Meta:
         verbose_name = "Naliczenie Miesięczne"
         verbose_name_plural = "Naliczenia Miesięczne"
         unique_together = ('agreement', 'month_year') # Zapewnia jedno naliczenie na umowę na miesiąc
         ordering = ['-month_year', 'agreement']
+        indexes = [
+            models.Index(fields=['month_year', 'closed_at'], name='monthlycharge_month_closed_idx'),
+        ]
 
     @property
     def total_charge(self):
@@ -402,4 +435,191 @@ class WaterCostOverride(models.Model):
     def __str__(self):
         return f"Ustawienia dla okresu od {self.period_start_date.strftime('%Y-%m-%d')}"
 
-    
\ No newline at end of file
+# --- 14. Saldo Umowy (księga sald miesięcznych) ---
+class AgreementBalance(models.Model):
+    agreement = models.ForeignKey(Agreement, verbose_name="Umowa", on_delete=models.CASCADE, related_name="balances")
+    month = models.DateField("Miesiąc", help_text="Pierwszy dzień miesiąca, np. 2025-01-01")
+
+    opening_balance = models.DecimalField("Saldo otwarcia", max_digits=12, decimal_places=2, default=0)
+    charges = models.DecimalField("Naliczenia", max_digits=12, decimal_places=2, default=0)
+    payments = models.DecimalField("Wpłaty", max_digits=12, decimal_places=2, default=0)
+    closing_balance = models.DecimalField("Saldo zamknięcia", max_digits=12, decimal_places=2, default=0)
+
+    is_stale = models.BooleanField("Wymaga przeliczenia", default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Saldo miesięczne umowy"
+        verbose_name_plural = "Salda miesięczne umów"
+        unique_together = ('agreement', 'month')
+        ordering = ['agreement', '-month']
+        indexes = [
+            models.Index(fields=['month', 'closing_balance'], name='balance_month_closing_idx'),
+            models.Index(fields=['is_stale'], name='balance_stale_idx'),
+        ]
+
+    def __str__(self):
+        return f"Saldo {self.agreement} za {self.month.strftime('%Y-%m')}: {self.closing_balance} PLN"
+
+# --- 15. Profilowanie na żądanie (patrz core/services/profiling.py) ---
+class ProfilingRule(models.Model):
+    KIND_CHOICES = [
+        ('url', 'Żądanie HTTP'),
+        ('command', 'Komenda zarządzania'),
+    ]
+
+    kind = models.CharField("Rodzaj", max_length=20, choices=KIND_CHOICES, default='url')
+    target = models.CharField(
+        "Cel",
+        max_length=255,
+        help_text="Nazwa widoku (np. 'annual_agreement_report'), prefiks ścieżki zaczynający się od '/' "
+                  "lub nazwa komendy (np. 'compare_ai_modes').",
+    )
+    threshold_ms = models.PositiveIntegerField("Próg [ms]", default=1000, help_text="Profil jest zapisywany tylko dla wolniejszych wykonań.")
+    is_active = models.BooleanField("Aktywna", default=True)
+    expires_at = models.DateTimeField("Wygasa", null=True, blank=True, help_text="Po tej dacie reguła jest ignorowana.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Reguła profilowania"
+        verbose_name_plural = "Reguły profilowania"
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.target} (> {self.threshold_ms} ms)"
+
+
+class CapturedProfile(models.Model):
+    rule = models.ForeignKey(ProfilingRule, verbose_name="Reguła", on_delete=models.SET_NULL, null=True, blank=True, related_name="profiles")
+    kind = models.CharField("Rodzaj", max_length=20, choices=ProfilingRule.KIND_CHOICES)
+    target = models.CharField("Cel", max_length=255)
+    path = models.CharField("Ścieżka / argumenty", max_length=500, blank=True)
+    duration_ms = models.PositiveIntegerField("Czas [ms]")
+    file = models.FileField("Plik .prof", upload_to='profiles/')
+    summary = models.TextField("Najkosztowniejsze funkcje", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Zapisany profil"
+        verbose_name_plural = "Zapisane profile"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.target} — {self.duration_ms} ms ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+# --- 16. Dziennik decyzji AI (patrz core/services/rule_suggestions.py) ---
+class AIDecision(models.Model):
+    transaction = models.ForeignKey(
+        FinancialTransaction, verbose_name="Transakcja", on_delete=models.SET_NULL,
+        null=True, blank=True, related_name="ai_decisions",
+    )
+    description = models.TextField("Opis", blank=True)
+    contractor = models.CharField("Kontrahent", max_length=255, blank=True)
+    contractor_key = models.CharField(
+        "Kontrahent (znormalizowany)", max_length=255, blank=True, db_index=True,
+        help_text="Początkowe słowa nazwy kontrahenta — klucz grupowania decyzji.",
+    )
+    title = models.CharField(
+        "Tytuł wg AI", max_length=100, choices=FinancialTransaction.TITLE_CHOICES, null=True, blank=True,
+        help_text="Puste = AI odpowiedziało UNKNOWN.",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Decyzja AI"
+        verbose_name_plural = "Decyzje AI"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.contractor_key or self.description[:40]} -> {self.title or 'UNKNOWN'}"
+
+
+# --- 17. Import etapowy: podgląd przed zatwierdzeniem (patrz core/services/import_staging.py) ---
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('STAGED', 'Do zatwierdzenia'),
+        ('COMMITTED', 'Zatwierdzony'),
+        ('DISCARDED', 'Odrzucony'),
+    ]
+
+    file_name = models.CharField("Plik", max_length=255, blank=True)
+    ai_mode = models.CharField("Tryb AI", max_length=40)
+    status = models.CharField("Status", max_length=20, choices=STATUS_CHOICES, default='STAGED')
+    summary = models.JSONField(
+        "Podsumowanie", default=dict, blank=True,
+        help_text="Pominięte wiersze, ostrzeżenie o kodowaniu, statystyki AI i klasyfikatora.",
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name="Utworzył", on_delete=models.SET_NULL, null=True, blank=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField("Zakończono", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Import (podgląd)"
+        verbose_name_plural = "Importy (podgląd)"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_name or 'Import'} ({self.created_at:%Y-%m-%d %H:%M}, {self.get_status_display()})"
+
+
+class StagedTransaction(models.Model):
+    """Wiersz wyciągu po dopasowaniu reguł i AI, czekający na zatwierdzenie importu."""
+    ACTION_CHOICES = [
+        ('NEW', 'Nowa'),
+        ('UPDATE', 'Aktualizacja'),
+    ]
+
+    job = models.ForeignKey(ImportJob, verbose_name="Import", on_delete=models.CASCADE, related_name="staged_rows")
+    action = models.CharField("Operacja", max_length=10, choices=ACTION_CHOICES, default='NEW')
+    transaction_id = models.CharField("ID Transakcji", max_length=255)
+    posting_date = models.DateField("Data księgowania")
+    description = models.TextField("Opis", blank=True)
+    amount = models.DecimalField("Kwota [+/-]", max_digits=10, decimal_places=2)
+    contractor = models.CharField("Kontrahent", max_length=255, blank=True, null=True)
+    title = models.CharField("Tytułem", max_length=100, choices=FinancialTransaction.TITLE_CHOICES, blank=True, null=True)
+    lokal = models.ForeignKey(Lokal, verbose_name="Lokal", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    status = models.CharField("Status", max_length=20, choices=FinancialTransaction.STATUS_CHOICES)
+    provenance = models.JSONField("Pochodzenie dopasowania", default=dict, blank=True)
+    ai_source = models.CharField(
+        "Źródło tytułu", max_length=2, blank=True,
+        help_text="'AI' — odpowiedź Ollamy, 'ML' — lokalny klasyfikator, puste — reguły.",
+    )
+    ai_title = models.CharField("Tytuł wg AI", max_length=100, null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Transakcja w podglądzie importu"
+        verbose_name_plural = "Transakcje w podglądzie importu"
+        ordering = ['job', 'id']
+
+    def __str__(self):
+        return f"{self.transaction_id} ({self.get_action_display()})"
+
+
+# --- 18. Kandydaci na duplikaty transakcji (patrz core/services/duplicates.py) ---
+class DuplicateCandidate(models.Model):
+    """Para transakcji o tym samym odcisku, czekająca na przegląd."""
+    STATUS_CHOICES = [
+        ('OPEN', 'Do przeglądu'),
+        ('DISMISSED', 'To nie duplikat'),
+    ]
+
+    first = models.ForeignKey(
+        FinancialTransaction, verbose_name="Transakcja", on_delete=models.CASCADE, related_name="+",
+    )
+    second = models.ForeignKey(
+        FinancialTransaction, verbose_name="Możliwy duplikat", on_delete=models.CASCADE, related_name="+",
+    )
+    fingerprint = models.CharField("Odcisk", max_length=40)
+    status = models.CharField("Status", max_length=20, choices=STATUS_CHOICES, default='OPEN')
+    created_at = models.DateTimeField("Wykryto", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Kandydat na duplikat"
+        verbose_name_plural = "Kandydaci na duplikaty"
+        ordering = ['-created_at', 'pk']
+        unique_together = ('first', 'second')
+
+    def __str__(self):
+        return f"{self.first_id} / {self.second_id} ({self.get_status_display()})"
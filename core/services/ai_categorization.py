@@ -1,13 +1,23 @@
 import requests
 import json
 import logging
+import threading
+import time
 from typing import Optional, Tuple
 
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+from .metrics import span
+
 logger = logging.getLogger(__name__)
 
-# Konfiguracja Ollama
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-OLLAMA_MODEL = "neural-chat"  # lub "mistral"
+
+def ollama_url(path):
+    """Pełny adres endpointu Ollama (settings.OLLAMA_URL, np. http://localhost:11434)."""
+    return getattr(settings, 'OLLAMA_URL', 'http://localhost:11434').rstrip('/') + path
+
 
 # Mapowanie kategorii na ludzkie nazwy
 CATEGORY_DISPLAY_MAP = {
@@ -32,11 +42,70 @@ CATEGORY_DISPLAY_MAP = {
 }
 
 
+def new_session() -> requests.Session:
+    """Sesja HTTP z pulą połączeń keep-alive do Ollama (OLLAMA_POOL_SIZE połączeń)."""
+    session = requests.Session()
+    pool_size = getattr(settings, 'OLLAMA_POOL_SIZE', 4)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def shared_session() -> requests.Session:
+    """Wspólna sesja procesu dla wywołań spoza importu (np. ponowna kategoryzacja)."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = new_session()
+        return _shared_session
+
+
+def _generate_payload(prompt: str, num_predict: int, stream: bool = False, **extra) -> dict:
+    return {
+        "model": getattr(settings, 'OLLAMA_MODEL', 'neural-chat'),
+        "prompt": prompt,
+        "stream": stream,
+        # Model zostaje w pamięci między importami (bez zimnego startu).
+        "keep_alive": getattr(settings, 'OLLAMA_KEEP_ALIVE', '30m'),
+        "options": {
+            "temperature": 0.3,  # Niższa temperatura = mniej kreatywne, bardziej skupione
+            # Potrzebujemy tylko krótkiego kodu — limit tokenów ucina "wyjaśnienia" modelu.
+            "num_predict": num_predict,
+        },
+        **extra,
+    }
+
+
+def _read_stream(response, timeout: float) -> str:
+    """
+    Czyta strumień NDJSON z /api/generate do końca (chunk z "done").
+    Długość odpowiedzi ogranicza num_predict — przerwanie czytania w połowie
+    zamknęłoby gniazdo zamiast oddać połączenie keep-alive do puli sesji.
+    `timeout` ogranicza łączny czas czytania, nie tylko pojedynczy odczyt.
+    """
+    deadline = time.perf_counter() + timeout
+    text = ""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        text += chunk.get("response", "")
+        if time.perf_counter() > deadline:
+            raise requests.exceptions.Timeout()
+    return text.strip().strip("'\"`.").lower()
+
+
 def categorize_with_ai(
     description: str,
     contractor: str = "",
     amount: float = 0,
-    timeout: int = 30
+    timeout: Optional[float] = None,
+    session: Optional[requests.Session] = None,
 ) -> Tuple[Optional[str], str, str]:
     """
     Kategoryzuje transakcję przy pomocy lokalnego modelu AI (Ollama).
@@ -45,7 +114,8 @@ def categorize_with_ai(
         description: Opis transakcji
         contractor: Kontrahent
         amount: Kwota transakcji
-        timeout: Timeout dla żądania (sekundy)
+        timeout: Timeout dla żądania (sekundy), domyślnie settings.OLLAMA_TIMEOUT
+        session: Sesja HTTP (domyślnie wspólna sesja procesu z pulą połączeń)
     
     Returns:
         Tuple: (category_code, status, log_message)
@@ -53,7 +123,9 @@ def categorize_with_ai(
         - status: "PROCESSED" / "UNPROCESSED" / "ERROR"
         - log_message: Wiadomość dla logu
     """
-    
+    if timeout is None:
+        timeout = getattr(settings, 'OLLAMA_TIMEOUT', 30)
+
     try:
         categories_list = ", ".join([f"{k} ({v})" for k, v in CATEGORY_DISPLAY_MAP.items()])
         
@@ -69,23 +141,20 @@ Dostępne kategorie:
 Zwróć TYLKO kod kategorii (np. 'czynsz', 'energia_klatka', itp.) bez żadnych dodatkowych wyjaśnień.
 Jeśli nie potrafisz jednoznacznie przypisać kategorii, odpowiedz: UNKNOWN"""
 
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "temperature": 0.3,  # Niższa temperatura = mniej kreatywne, bardziej skupione
-            },
-            timeout=timeout
-        )
-        
-        if response.status_code != 200:
-            logger.warning(f"Ollama API error: {response.status_code}")
-            return None, "ERROR", f"Błąd API Ollama: {response.status_code}"
-        
-        result = response.json()
-        ai_response = result.get("response", "").strip().lower()
+        with span("ai.ollama_request"):
+            response = (session or shared_session()).post(
+                ollama_url("/api/generate"),
+                json=_generate_payload(prompt, getattr(settings, 'OLLAMA_NUM_PREDICT', 12), stream=True),
+                timeout=timeout,
+                stream=True,
+            )
+            try:
+                if response.status_code != 200:
+                    logger.warning(f"Ollama API error: {response.status_code}")
+                    return None, "ERROR", f"Błąd API Ollama: {response.status_code}"
+                ai_response = _read_stream(response, timeout)
+            finally:
+                response.close()
         
         # Sprawdzenie czy odpowiedź zawiera kod kategorii
         if ai_response == "unknown":
@@ -107,7 +176,7 @@ Jeśli nie potrafisz jednoznacznie przypisać kategorii, odpowiedz: UNKNOWN"""
         return ai_response, "PROCESSED", log_msg
         
     except requests.exceptions.ConnectionError:
-        logger.error("Nie można połączyć się z Ollama na localhost:11434")
+        logger.error(f"Nie można połączyć się z Ollama ({ollama_url('')})")
         return None, "ERROR", "Ollama niedostępna. Upewnij się że działa: ollama serve"
     except requests.exceptions.Timeout:
         logger.error(f"Timeout Ollama (>{timeout}s)")
@@ -120,12 +189,245 @@ Jeśli nie potrafisz jednoznacznie przypisać kategorii, odpowiedz: UNKNOWN"""
         return None, "ERROR", f"Nieoczekiwany błąd: {str(e)}"
 
 
-def test_ollama_connection() -> bool:
+def _batch_prompt(items) -> str:
+    categories_list = ", ".join([f"{k} ({v})" for k, v in CATEGORY_DISPLAY_MAP.items()])
+    transactions = "\n".join(
+        json.dumps({"id": str(key), "opis": description, "kontrahent": contractor, "kwota": str(amount)}, ensure_ascii=False)
+        for key, description, contractor, amount in items
+    )
+    return f"""Przypisz każdej z poniższych transakcji finansowych najlepszą kategorię.
+
+Transakcje (po jednej na linię, JSON):
+{transactions}
+
+Dostępne kategorie:
+{categories_list}
+
+Zwróć TYLKO obiekt JSON, w którym kluczem jest "id" transakcji, a wartością kod kategorii,
+np. {{"1": "czynsz", "2": "UNKNOWN"}}. Jeśli nie potrafisz jednoznacznie przypisać kategorii, użyj UNKNOWN."""
+
+
+def categorize_batch_with_ai(
+    items,
+    timeout: Optional[float] = None,
+    session: Optional[requests.Session] = None,
+) -> Tuple[dict, Optional[str]]:
+    """
+    Kategoryzuje kilka transakcji jednym zapytaniem (odpowiedź w formacie JSON id -> kod).
+
+    Args:
+        items: lista krotek (klucz, opis, kontrahent, kwota)
+
+    Returns:
+        Tuple: (wyniki, błąd)
+        - wyniki: {klucz: (category_code, status, log_message)} tylko dla poprawnych
+          odpowiedzi — kod z CATEGORY_DISPLAY_MAP albo UNKNOWN; brakujące lub
+          nieznane kody pomijamy, żeby wywołujący mógł je ponowić pojedynczo,
+        - błąd: opis błędu zapytania (wtedy wyniki są puste) lub None.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'OLLAMA_TIMEOUT', 30)
+    try:
+        with span("ai.ollama_batch_request"):
+            response = (session or shared_session()).post(
+                ollama_url("/api/generate"),
+                json=_generate_payload(
+                    _batch_prompt(items),
+                    getattr(settings, 'OLLAMA_NUM_PREDICT', 12) * len(items) + 8,
+                    format="json",
+                ),
+                timeout=timeout
+            )
+        if response.status_code != 200:
+            logger.warning(f"Ollama API error: {response.status_code}")
+            return {}, f"Błąd API Ollama: {response.status_code}"
+        answers = json.loads(response.json().get("response", "") or "{}")
+    except requests.exceptions.ConnectionError:
+        logger.error(f"Nie można połączyć się z Ollama ({ollama_url('')})")
+        return {}, "Ollama niedostępna. Upewnij się że działa: ollama serve"
+    except requests.exceptions.Timeout:
+        logger.error(f"Timeout Ollama (>{timeout}s)")
+        return {}, f"Timeout AI ({timeout}s)"
+    except json.JSONDecodeError as e:
+        logger.error(f"Błąd parsowania JSON od Ollama: {e}")
+        return {}, f"Błąd parsowania odpowiedzi Ollama: {e}"
+    except Exception as e:
+        logger.error(f"Nieoczekiwany błąd AI: {e}")
+        return {}, f"Nieoczekiwany błąd: {str(e)}"
+
+    if not isinstance(answers, dict):
+        return {}, "AI zwrócił JSON innego typu niż obiekt"
+    results = {}
+    for key, description, _, _ in items:
+        answer = answers.get(str(key))
+        if not isinstance(answer, str):
+            continue
+        answer = answer.strip().lower()
+        if answer == "unknown":
+            results[key] = (None, "UNPROCESSED", f"AI nie potrafił kategoryzować transakcji. Opis: {description[:50]}...")
+        elif answer in CATEGORY_DISPLAY_MAP:
+            results[key] = (answer, "PROCESSED", f"AI kategoryzacja (wsadowo): {CATEGORY_DISPLAY_MAP[answer]}")
+    return results, None
+
+
+def test_ollama_connection(timeout: Optional[float] = None) -> bool:
     """
     Testuje dostępność Ollama API.
     """
+    if timeout is None:
+        timeout = getattr(settings, 'OLLAMA_HEALTH_TIMEOUT', 2)
     try:
-        response = requests.get(f"{OLLAMA_API_URL.replace('/api/generate', '')}/api/tags", timeout=5)
+        response = shared_session().get(ollama_url("/api/tags"), timeout=timeout)
         return response.status_code == 200
-    except:
+    except requests.exceptions.RequestException:
         return False
+
+
+class OllamaClient:
+    """
+    Klient Ollama na czas jednego importu: pula połączeń keep-alive,
+    bezpiecznik (circuit breaker) i budżet czasu AI.
+
+    - health_check() przed importem — niedostępna Ollama od razu wyłącza AI,
+    - po OLLAMA_CIRCUIT_FAILURES kolejnych błędach/timeoutach bezpiecznik
+      otwiera się i do końca importu AI jest pomijane,
+    - łączny czas zapytań AI nie przekroczy OLLAMA_IMPORT_BUDGET sekund
+      (timeout pojedynczego zapytania jest przycinany do pozostałego budżetu).
+
+    Po otwarciu bezpiecznika lub wyczerpaniu budżetu import działa dalej
+    jak w trybie "tylko reguły".
+    """
+
+    def __init__(self, failure_threshold: Optional[int] = None, time_budget: Optional[float] = None,
+                 timeout: Optional[float] = None, session: Optional[requests.Session] = None):
+        self.failure_threshold = failure_threshold or getattr(settings, 'OLLAMA_CIRCUIT_FAILURES', 3)
+        self.time_budget = time_budget if time_budget is not None else getattr(settings, 'OLLAMA_IMPORT_BUDGET', 120)
+        self.timeout = timeout or getattr(settings, 'OLLAMA_TIMEOUT', 30)
+        self.session = session or new_session()
+        self.consecutive_failures = 0
+        self.open_reason = None
+        self.calls = 0
+        self.failures = 0
+        self.skipped = 0
+        self.spent = 0.0
+        self.latencies = []  # czas każdego zapytania (pojedynczego lub wsadowego), w sekundach
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    @property
+    def is_open(self) -> bool:
+        return self.open_reason is not None
+
+    def trip(self, reason: str):
+        if not self.is_open:
+            logger.warning(f"AI wyłączone do końca importu: {reason}")
+            self.open_reason = reason
+
+    def health_check(self) -> bool:
+        timeout = getattr(settings, 'OLLAMA_HEALTH_TIMEOUT', 2)
+        started = time.perf_counter()
+        try:
+            ok = self.session.get(ollama_url("/api/tags"), timeout=timeout).status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        self.spent += time.perf_counter() - started
+        if not ok:
+            self.trip(f"Ollama niedostępna ({ollama_url('')})")
+        return ok
+
+    def warm_up(self) -> bool:
+        """
+        Ładuje model do pamięci pustym promptem (Ollama nic nie generuje),
+        żeby zimny start nie obciążał pierwszej transakcji importu.
+        """
+        timeout = self._remaining()
+        if timeout is None:
+            return False
+        started = time.perf_counter()
+        try:
+            with span("ai.warm_up"):
+                ok = self.session.post(
+                    ollama_url("/api/generate"),
+                    json={
+                        "model": getattr(settings, 'OLLAMA_MODEL', 'neural-chat'),
+                        "prompt": "",
+                        "keep_alive": getattr(settings, 'OLLAMA_KEEP_ALIVE', '30m'),
+                    },
+                    timeout=timeout,
+                ).status_code == 200
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Rozgrzewanie modelu Ollama nie powiodło się: {e}")
+            ok = False
+        self.spent += time.perf_counter() - started
+        return ok
+
+    def _remaining(self) -> Optional[float]:
+        """Timeout dla kolejnego zapytania albo None, gdy AI jest wyłączone."""
+        remaining = self.time_budget - self.spent
+        if not self.is_open and remaining <= 0:
+            self.trip(f"wyczerpany budżet czasu AI ({self.time_budget:g} s)")
+        return None if self.is_open else min(self.timeout, remaining)
+
+    def _record(self, started: float, error: Optional[str]):
+        elapsed = time.perf_counter() - started
+        self.spent += elapsed
+        self.latencies.append(elapsed)
+        self.calls += 1
+        if error:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.trip(f"{self.consecutive_failures} kolejnych błędów AI (ostatni: {error})")
+        else:
+            self.consecutive_failures = 0
+
+    def _skipped(self) -> Tuple[Optional[str], str, str]:
+        self.skipped += 1
+        return None, "ERROR", f"AI pominięte: {self.open_reason}"
+
+    def categorize(self, description: str, contractor: str = "", amount: float = 0) -> Tuple[Optional[str], str, str]:
+        """Jak categorize_with_ai(), ale z bezpiecznikiem i budżetem czasu."""
+        timeout = self._remaining()
+        if timeout is None:
+            return self._skipped()
+        started = time.perf_counter()
+        result = categorize_with_ai(description, contractor, amount, timeout=timeout, session=self.session)
+        self._record(started, result[2] if result[1] == "ERROR" else None)
+        return result
+
+    def categorize_batch(self, items) -> dict:
+        """
+        Kategoryzuje listę (klucz, opis, kontrahent, kwota) paczkami po
+        OLLAMA_BATCH_SIZE transakcji. Transakcje bez poprawnej odpowiedzi
+        w paczce są ponawiane pojedynczo. Zwraca {klucz: (kod, status, log)}.
+        """
+        batch_size = getattr(settings, 'OLLAMA_BATCH_SIZE', 10)
+        results = {}
+        for offset in range(0, len(items), batch_size):
+            batch = items[offset:offset + batch_size]
+            timeout = self._remaining() if len(batch) > 1 else None
+            if timeout is not None:
+                started = time.perf_counter()
+                answers, error = categorize_batch_with_ai(batch, timeout=timeout, session=self.session)
+                self._record(started, error)
+                results.update(answers)
+            for key, description, contractor, amount in batch:
+                if key not in results:
+                    results[key] = self.categorize(description, contractor, amount)
+        return results
+
+    def summary(self) -> dict:
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'seconds': round(self.spent, 2),
+            'disabled_reason': self.open_reason,
+        }
@@ -0,0 +1,348 @@
+# core/services/balances.py
+"""
+Księga sald umów (AgreementBalance): jeden wiersz na umowę i miesiąc
+z saldem otwarcia, naliczeniami, wpłatami i saldem zamknięcia.
+
+Saldo liczone jest tak jak w raporcie rocznym: od stycznia roku rozpoczęcia
+umowy, wpłaty to dodatnie transakcje przypisane do lokalu umowy, a naliczenia
+pochodzą z MonthlyCharge. Saldo początkowe z umowy dodawane jest w miesiącu
+balance_start_date (lub start_date).
+
+Księga obejmuje miesiące do grudnia roku zakończenia umowy — jak raport
+roczny, który liczy wpłaty na lokal za cały rok.
+
+Zmiana wpłat (import, przepięcie transakcji na inny lokal) lub naliczeń
+oznacza wiersze od danego miesiąca jako nieaktualne. refresh_balances()
+przelicza umowę dopiero od tego miesiąca (albo od pierwszego nowego miesiąca),
+zapisując wyłącznie zmienione wiersze, a odczyt salda to pojedyncze zapytanie
+po indeksie.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import Max, Min, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from ..models import Agreement, AgreementBalance, FinancialTransaction, MonthlyCharge
+from .charges import billing_period_start, ensure_charges_posted, month_range
+
+ZERO = Decimal("0.00")
+
+
+def ledger_months(agreement, today=None):
+    """
+    Miesiące księgi salda umowy: od stycznia roku rozpoczęcia do grudnia roku
+    zakończenia umowy (nie dalej niż dziś). Jak w raporcie rocznym, wpłaty na
+    lokal do końca roku zakończenia umowy wchodzą do jej salda.
+    """
+    today = today or date.today()
+    end = today
+    if agreement.end_date:
+        end = min(today, date(agreement.end_date.year, 12, 31))
+    return month_range(date(agreement.start_date.year, 1, 1), end)
+
+
+def _initial_balance_month(agreement, first_month):
+    initial_date = agreement.balance_start_date or agreement.start_date
+    return max(initial_date.replace(day=1), first_month)
+
+
+def _ledger_state(ids):
+    """Zakres istniejących wierszy księgi i najwcześniejszy nieaktualny miesiąc każdej umowy."""
+    return {
+        row["agreement_id"]: row
+        for row in AgreementBalance.objects.filter(agreement_id__in=ids)
+        .values("agreement_id")
+        .annotate(
+            first_month=Min("month"),
+            last_month=Max("month"),
+            first_stale=Min("month", filter=Q(is_stale=True)),
+        )
+    }
+
+
+def _post_due_charges(agreements, state, today):
+    """
+    Doksięgowuje naliczenia, które zmieniły się od ostatniego przeliczenia:
+    nieaktualne (is_stale) oraz te z ostatniego okresu dwumiesięcznego księgi,
+    których koszt wody stał się należny z upływem czasu. post_charges oznacza
+    salda od zmienionego miesiąca jako nieaktualne.
+    """
+    ids = [ag.pk for ag in agreements]
+    stale_from = dict(
+        MonthlyCharge.objects.filter(agreement_id__in=ids, is_stale=True, closed_at__isnull=True)
+        .values("agreement_id")
+        .annotate(first=Min("month_year"))
+        .values_list("agreement_id", "first")
+    )
+    window_start = None
+    for agreement in agreements:
+        row = state.get(agreement.pk)
+        start = billing_period_start(row["last_month"]) if row else date(agreement.start_date.year, 1, 1)
+        if agreement.pk in stale_from:
+            start = min(start, stale_from[agreement.pk])
+        window_start = start if window_start is None else min(window_start, start)
+    if window_start is not None:
+        ensure_charges_posted(agreements, window_start, today, today)
+
+
+def _recompute_from(agreement, state, today):
+    """
+    Pierwszy miesiąc księgi umowy do przeliczenia albo None, gdy księga jest
+    aktualna: najwcześniejszy nieaktualny wiersz, miesiąc po ostatnim wierszu
+    (nowe miesiące) lub początek księgi, gdy zmienił się jej zakres.
+    """
+    months = ledger_months(agreement, today)
+    row = state.get(agreement.pk)
+    if row is None or row["first_month"] != months[0]:
+        return months[0]
+    candidates = []
+    if row["first_stale"] is not None:
+        candidates.append(row["first_stale"])
+    if row["last_month"] < months[-1]:
+        candidates.append(month_range(row["last_month"], months[-1])[1])
+    elif row["last_month"] > months[-1]:
+        # Księga się skróciła (np. wcześniejsze zakończenie umowy) — nadmiarowe wiersze do usunięcia.
+        candidates.append(months[-1])
+    return min(candidates) if candidates else None
+
+
+def refresh_balances(agreements=None, today=None):
+    """
+    Aktualizuje księgę sald umów (domyślnie wszystkich aktywnych) przyrostowo:
+    każda umowa przeliczana jest od najwcześniejszego nieaktualnego miesiąca
+    (patrz mark_balances_stale) lub od pierwszego nowego miesiąca, a saldo
+    otwarcia bierze z zapisanego salda zamknięcia miesiąca poprzedniego.
+    Dane wejściowe pobierane są zbiorczo dla wszystkich umów. Zwraca liczbę
+    przeliczonych umów.
+    """
+    today = today or date.today()
+    if agreements is None:
+        agreements = Agreement.objects.filter(is_active=True)
+    agreements = [ag for ag in agreements if ag.start_date and ag.start_date <= today]
+    if not agreements:
+        return 0
+
+    _post_due_charges(agreements, _ledger_state([ag.pk for ag in agreements]), today)
+    state = _ledger_state([ag.pk for ag in agreements])
+    starts = {}
+    for agreement in agreements:
+        from_month = _recompute_from(agreement, state, today)
+        if from_month is not None:
+            starts[agreement.pk] = from_month
+    needing = [ag for ag in agreements if ag.pk in starts]
+    if not needing:
+        return 0
+
+    # Saldo otwarcia: zamknięcie miesiąca poprzedzającego pierwszy przeliczany.
+    first_month = min(starts.values())
+    previous_month = first_month - relativedelta(months=1)
+    charges = defaultdict(dict)
+    for charge in MonthlyCharge.objects.filter(agreement__in=needing, month_year__gte=first_month):
+        charges[charge.agreement_id][charge.month_year] = charge
+
+    payments = defaultdict(dict)
+    for row in (
+        FinancialTransaction.objects.filter(
+            lokal_id__in={ag.lokal_id for ag in needing},
+            amount__gt=0,
+            posting_date__gte=first_month,
+        )
+        .annotate(month=TruncMonth("posting_date"))
+        .values("lokal_id", "month")
+        .annotate(total=Sum("amount"))
+    ):
+        month = row["month"]
+        if hasattr(month, "date"):
+            month = month.date()
+        payments[row["lokal_id"]][month] = row["total"]
+
+    existing = defaultdict(dict)
+    for balance in AgreementBalance.objects.filter(agreement__in=needing, month__gte=previous_month):
+        existing[balance.agreement_id][balance.month] = balance
+
+    to_create, to_update, obsolete = [], [], []
+    for agreement in needing:
+        all_months = ledger_months(agreement, today)
+        from_month = starts[agreement.pk]
+        months = [m for m in all_months if m >= from_month]
+        initial_month = _initial_balance_month(agreement, all_months[0])
+        agreement_charges = charges.get(agreement.pk, {})
+        lokal_payments = payments.get(agreement.lokal_id, {})
+        rows = existing.get(agreement.pk, {})
+
+        running = ZERO
+        if from_month > all_months[0]:
+            running = rows.pop(from_month - relativedelta(months=1)).closing_balance
+        elif agreement.pk in state and state[agreement.pk]["first_month"] < from_month:
+            # Późniejszy początek umowy — wiersze sprzed nowego początku księgi są zbędne.
+            obsolete.extend(
+                AgreementBalance.objects.filter(agreement=agreement, month__lt=from_month)
+                .values_list("pk", flat=True)
+            )
+        for month in months:
+            opening = running
+            if month == initial_month and agreement.initial_balance:
+                opening += agreement.initial_balance
+            charge = agreement_charges.get(month)
+            month_charges = charge.total_charge if charge else ZERO
+            month_payments = lokal_payments.get(month, ZERO)
+            running = opening + month_payments - month_charges
+
+            values = (opening, month_charges, month_payments, running)
+            balance = rows.pop(month, None)
+            if balance is None:
+                to_create.append(AgreementBalance(
+                    agreement=agreement, month=month, opening_balance=opening,
+                    charges=month_charges, payments=month_payments, closing_balance=running,
+                ))
+            elif balance.is_stale or (
+                balance.opening_balance, balance.charges, balance.payments, balance.closing_balance
+            ) != values:
+                (
+                    balance.opening_balance, balance.charges, balance.payments, balance.closing_balance
+                ) = values
+                balance.is_stale = False
+                to_update.append(balance)
+        obsolete.extend(balance.pk for month, balance in rows.items() if month >= from_month)
+
+    with transaction.atomic():
+        AgreementBalance.objects.bulk_create(to_create, batch_size=500)
+        AgreementBalance.objects.bulk_update(
+            to_update,
+            ["opening_balance", "charges", "payments", "closing_balance", "is_stale"],
+            batch_size=500,
+        )
+        if obsolete:
+            AgreementBalance.objects.filter(pk__in=obsolete).delete()
+    return len(needing)
+
+
+def mark_balances_stale(lokal_id, from_date):
+    """Oznacza salda umów lokalu od miesiąca from_date jako wymagające przeliczenia."""
+    AgreementBalance.objects.filter(
+        agreement__lokal_id=lokal_id, month__gte=from_date.replace(day=1), is_stale=False
+    ).update(is_stale=True)
+
+
+def mark_transactions_changed(changes):
+    """
+    Odpowiednik sygnałów post_save FinancialTransaction dla zapisów zbiorczych
+    (bulk_create, QuerySet.update), które sygnałów nie wysyłają: unieważnia cache
+    raportów lokali i oznacza ich salda jako nieaktualne od najwcześniejszej daty.
+    changes — pary (lokal_id, data księgowania), stare i nowe.
+    """
+    from .report_cache import invalidate, lokal_scope
+
+    earliest = {}
+    for lokal_id, posting_date in changes:
+        if lokal_id is not None and posting_date is not None:
+            earliest[lokal_id] = min(posting_date, earliest.get(lokal_id, posting_date))
+    if earliest:
+        invalidate(*(lokal_scope(lokal_id) for lokal_id in earliest))
+    for lokal_id, from_date in earliest.items():
+        mark_balances_stale(lokal_id, from_date)
+
+
+def get_closing_balance(agreement, month, today=None):
+    """Saldo zamknięcia umowy na koniec podanego miesiąca (ostatni wiersz nie późniejszy)."""
+    refresh_balances([agreement], today)
+    balance = (
+        AgreementBalance.objects.filter(agreement=agreement, month__lte=month)
+        .order_by("-month")
+        .values_list("closing_balance", flat=True)
+        .first()
+    )
+    return balance if balance is not None else ZERO
+
+
+def get_current_balance(agreement, today=None):
+    today = today or date.today()
+    return get_closing_balance(agreement, today.replace(day=1), today)
+
+
+def get_current_balances(agreements, today=None):
+    """Bieżące saldo wielu umów: {agreement_id: AgreementBalance} — jedno zapytanie po odświeżeniu."""
+    today = today or date.today()
+    agreements = list(agreements)
+    refresh_balances(agreements, today)
+    last_months = {ag.pk: ledger_months(ag, today)[-1] for ag in agreements if ag.start_date <= today}
+    candidates = AgreementBalance.objects.filter(
+        agreement_id__in=last_months, month__in=set(last_months.values())
+    )
+    return {b.agreement_id: b for b in candidates if b.month == last_months[b.agreement_id]}
+
+
+def get_arrears(agreements=None, today=None):
+    """Lista bieżących sald ujemnych (zaległości) posortowana od największego długu."""
+    if agreements is None:
+        agreements = Agreement.objects.filter(is_active=True).select_related("lokal", "user")
+    balances = get_current_balances(agreements, today)
+    return sorted(
+        (b for b in balances.values() if b.closing_balance < 0),
+        key=lambda b: b.closing_balance,
+    )
+
+
+def get_yearly_statement(agreement, year, today=None):
+    """Wiersze księgi salda dla roku (miesiąc po miesiącu)."""
+    refresh_balances([agreement], today)
+    return list(
+        AgreementBalance.objects.filter(agreement=agreement, month__year=year).order_by("month")
+    )
+
+
+def get_arrears_summary(agreements=None, today=None):
+    """
+    Zestawienie sald wszystkich (domyślnie aktywnych) umów dla panelu zaległości.
+    Po odświeżeniu księgi całość to trzy zapytania niezależnie od liczby umów:
+    wiersze księgi z ostatnich 24 miesięcy, ostatnie wpłaty pogrupowane po lokalu
+    i same umowy. Zwraca listę słowników (bez obiektów modeli — nadaje się do cache).
+    """
+    today = today or date.today()
+    if agreements is None:
+        agreements = Agreement.objects.filter(is_active=True).select_related("lokal", "user")
+    agreements = [ag for ag in agreements if ag.start_date and ag.start_date <= today]
+    refresh_balances(agreements, today)
+
+    # Wiersze od najnowszego: saldo bieżące to pierwszy wiersz, a liczba miesięcy
+    # zaległości to długość nieprzerwanej serii ujemnych sald zamknięcia.
+    ledgers = defaultdict(list)
+    for agreement_id, closing_balance in (
+        AgreementBalance.objects.filter(
+            agreement__in=agreements, month__gte=date(today.year - 2, today.month, 1)
+        )
+        .order_by("agreement_id", "-month")
+        .values_list("agreement_id", "closing_balance")
+    ):
+        ledgers[agreement_id].append(closing_balance)
+
+    last_payments = dict(
+        FinancialTransaction.objects.filter(
+            lokal_id__in={ag.lokal_id for ag in agreements}, amount__gt=0
+        )
+        .values("lokal_id")
+        .annotate(last=Max("posting_date"))
+        .values_list("lokal_id", "last")
+    )
+
+    summary = []
+    for agreement in agreements:
+        closing = ledgers.get(agreement.pk, [])
+        months_in_arrears = 0
+        for balance in closing:
+            if balance >= 0:
+                break
+            months_in_arrears += 1
+        summary.append({
+            "agreement_id": agreement.pk,
+            "lokal": agreement.lokal.unit_number if agreement.lokal else "",
+            "tenant": str(agreement.user),
+            "balance": closing[0] if closing else ZERO,
+            "months_in_arrears": months_in_arrears,
+            "last_payment_date": last_payments.get(agreement.lokal_id),
+        })
+    return summary
@@ -0,0 +1,150 @@
+# core/services/benchmarking.py
+"""
+Narzędzia wspólne dla komend benchmarkowych (core/management/commands/benchmark_*).
+
+- throwaway_sqlite_database() — podmienia domyślną bazę na tymczasowy plik
+  SQLite z zastosowanymi migracjami, aby pomiary nie dotykały danych produkcyjnych,
+- count_queries() — zlicza zapytania SQL i ich łączny czas bez włączania DEBUG,
+- peak_rss_kb() — szczytowe zużycie pamięci procesu (tam, gdzie system je udostępnia),
+- measure_request() / check_budgets() — pomiar widoków klientem testowym
+  i porównanie z budżetami z pliku core/report_budgets.json,
+- quantile() — kwantyl próbki czasów (p50/p95 w raportach komend AI).
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def quantile(values, q):
+    """Kwantyl q (0–1) próbki metodą najbliższej pozycji; 0.0 dla pustej próbki."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _drop_connection(alias):
+    try:
+        connections[alias].close()
+        del connections[alias]
+    except AttributeError:
+        # Połączenie dla aliasu nie zostało jeszcze utworzone.
+        pass
+
+
+@contextmanager
+def throwaway_sqlite_database(path=None):
+    """
+    Na czas bloku kieruje alias "default" do pustej bazy SQLite (plik tymczasowy
+    lub podana ścieżka) po wykonaniu migracji. Po wyjściu przywraca oryginalną
+    konfigurację i usuwa plik tymczasowy.
+    """
+    tmpdir = None
+    if path is None:
+        tmpdir = tempfile.mkdtemp(prefix="kamienica-bench-")
+        path = os.path.join(tmpdir, "bench.sqlite3")
+
+    original = connections.settings[DEFAULT_DB_ALIAS]
+    _drop_connection(DEFAULT_DB_ALIAS)
+    connections.settings[DEFAULT_DB_ALIAS] = {
+        **original,
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": path,
+        "USER": "",
+        "PASSWORD": "",
+        "HOST": "",
+        "PORT": "",
+        "OPTIONS": {},
+    }
+    try:
+        call_command("migrate", verbosity=0, interactive=False)
+        yield path
+    finally:
+        _drop_connection(DEFAULT_DB_ALIAS)
+        connections.settings[DEFAULT_DB_ALIAS] = original
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+@contextmanager
+def count_queries(alias=DEFAULT_DB_ALIAS):
+    """Zlicza zapytania wykonane w bloku: `with count_queries() as counter: ...; counter.count`."""
+    counter = QueryCounter()
+    with connections[alias].execute_wrapper(counter):
+        yield counter
+
+
+def peak_rss_kb():
+    """Szczytowe RSS procesu w KB lub None, gdy moduł resource jest niedostępny."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS raportuje bajty, Linux kilobajty.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure_request(client, url):
+    """Wykonuje GET klientem testowym; zwraca status, czas [ms], liczbę i czas [ms] zapytań SQL."""
+    started = time.perf_counter()
+    with count_queries() as counter:
+        response = client.get(url)
+        # Odpowiedzi strumieniowe (PDF) renderują się dopiero przy odczycie treści.
+        if response.streaming:
+            b"".join(response.streaming_content)
+    return {
+        "status": response.status_code,
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+        "queries": counter.count,
+        "sql_ms": round(counter.seconds * 1000, 2),
+    }
+
+
+def load_budgets(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def check_budgets(results, budgets):
+    """
+    Porównuje wyniki {widok: pomiar} z budżetami {widok: {"max_queries", "max_ms"}}.
+    Zwraca listę opisów przekroczeń (pusta lista = wszystko w budżecie).
+    """
+    violations = []
+    for view, budget in budgets.items():
+        result = results.get(view)
+        if result is None:
+            violations.append(f"{view}: brak pomiaru")
+            continue
+        if result["status"] != 200:
+            violations.append(f"{view}: status HTTP {result['status']}")
+        for metric, limit_key in (("queries", "max_queries"), ("ms", "max_ms")):
+            limit = budget.get(limit_key)
+            if limit is not None and result[metric] > limit:
+                violations.append(f"{view}: {metric} {result[metric]} > {limit_key} {limit}")
+    return violations
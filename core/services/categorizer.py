@@ -0,0 +1,163 @@
+# core/services/categorizer.py
+"""
+Lokalny klasyfikator tytułów transakcji — warstwa między regułami a Ollamą.
+
+Wielomianowy naiwny klasyfikator Bayesa na cechach tekstowych opisu
+i kontrahenta (słowa oraz n-gramy znakowe 3–4, liczby sprowadzone do "0"),
+trenowany na transakcjach zweryfikowanych ręcznie lub edytowanych ręcznie
+(komenda `train_categorizer`). Model zapisywany jest jako JSON
+w CATEGORIZER_MODEL_PATH i ładowany ponownie tylko po zmianie pliku.
+
+Predykcja to kilkadziesiąt odczytów ze słowników — pojedyncze milisekundy
+w czystym Pythonie, bez NumPy. Odpowiedzi z pewnością poniżej
+CATEGORIZER_MIN_CONFIDENCE są przekazywane dalej do Ollamy.
+"""
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+
+from ..models import FinancialTransaction
+
+MODEL_VERSION = 1
+
+_WORD = re.compile(r"[^\W\d_]{2,}|\d+")
+_model_cache = {"key": None, "model": None}
+_model_lock = threading.Lock()
+
+
+def features(description, contractor=""):
+    """Cechy tekstu: słowa opisu (w:), słowa kontrahenta (c:) i n-gramy znakowe opisu (g:)."""
+    result = []
+    for prefix, text in (("w", description or ""), ("c", contractor or "")):
+        for word in _WORD.findall(text.lower()):
+            if word.isdigit():
+                word = "0"
+            result.append(f"{prefix}:{word}")
+            if prefix == "w" and len(word) > 3:
+                padded = f" {word} "
+                result.extend(f"g:{padded[i:i + n]}" for n in (3, 4) for i in range(len(padded) - n + 1))
+    return result
+
+
+class NaiveBayesCategorizer:
+    def __init__(self, alpha=0.5):
+        self.alpha = alpha
+        self.class_counts = {}
+        self.feature_counts = {}
+        self.feature_totals = {}
+        self.vocabulary_size = 0
+
+    def fit(self, samples):
+        """samples: iterowalne (opis, kontrahent, tytuł)."""
+        class_counts = Counter()
+        feature_counts = defaultdict(Counter)
+        vocabulary = set()
+        for description, contractor, label in samples:
+            tokens = features(description, contractor)
+            class_counts[label] += 1
+            feature_counts[label].update(tokens)
+            vocabulary.update(tokens)
+        self.class_counts = dict(class_counts)
+        self.feature_counts = {label: dict(counts) for label, counts in feature_counts.items()}
+        self.feature_totals = {label: sum(counts.values()) for label, counts in feature_counts.items()}
+        self.vocabulary_size = len(vocabulary)
+        return self
+
+    def predict(self, description, contractor=""):
+        """Zwraca (tytuł, pewność 0–1) albo (None, 0.0), gdy model jest pusty."""
+        if not self.class_counts:
+            return None, 0.0
+        tokens = features(description, contractor)
+        total = sum(self.class_counts.values())
+        scores = {}
+        for label, count in self.class_counts.items():
+            counts = self.feature_counts[label]
+            denominator = self.feature_totals[label] + self.alpha * (self.vocabulary_size + 1)
+            score = math.log(count / total)
+            for token in tokens:
+                score += math.log((counts.get(token, 0) + self.alpha) / denominator)
+            scores[label] = score
+        best = max(scores, key=scores.get)
+        # Softmax log-prawdopodobieństw -> prawdopodobieństwo a posteriori najlepszej klasy.
+        normaliser = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / normaliser
+
+    def to_dict(self):
+        return {
+            "version": MODEL_VERSION,
+            "alpha": self.alpha,
+            "class_counts": self.class_counts,
+            "feature_counts": self.feature_counts,
+            "vocabulary_size": self.vocabulary_size,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != MODEL_VERSION:
+            raise ValueError(f"Nieobsługiwana wersja modelu: {data.get('version')}")
+        model = cls(alpha=data["alpha"])
+        model.class_counts = data["class_counts"]
+        model.feature_counts = data["feature_counts"]
+        model.feature_totals = {label: sum(counts.values()) for label, counts in model.feature_counts.items()}
+        model.vocabulary_size = data["vocabulary_size"]
+        return model
+
+
+def training_queryset(include_processed=False):
+    """Transakcje z pewnym tytułem: zweryfikowane lub edytowane ręcznie (opcjonalnie też auto-przetworzone)."""
+    trusted = Q(verified=True) | Q(status='MANUALLY_EDITED')
+    if include_processed:
+        trusted |= Q(status='PROCESSED')
+    return FinancialTransaction.objects.filter(trusted, title__isnull=False).exclude(title="")
+
+
+def model_path():
+    return str(getattr(settings, "CATEGORIZER_MODEL_PATH", os.path.join(settings.BASE_DIR, "categorizer_model.json")))
+
+
+def save_model(model, path=None):
+    """Zapis atomowy (plik tymczasowy + rename), żeby import nie wczytał połowy pliku."""
+    path = path or model_path()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(model.to_dict(), fh, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_model(path=None):
+    """Model z pliku (w pamięci do czasu zmiany pliku) albo None, gdy nie został wytrenowany."""
+    path = path or model_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _model_lock:
+        if _model_cache["key"] == key:
+            return _model_cache["model"]
+    with open(path, encoding="utf-8") as fh:
+        model = NaiveBayesCategorizer.from_dict(json.load(fh))
+    with _model_lock:
+        _model_cache.update(key=key, model=model)
+    return model
+
+
+def classify(model, description, contractor=""):
+    """
+    Wynik w formacie categorize_with_ai — (kod, status, log) — jeśli pewność
+    przekracza próg, w przeciwnym razie None (transakcja idzie do Ollamy).
+    """
+    title, confidence = model.predict(description, contractor)
+    if title is None or confidence < getattr(settings, "CATEGORIZER_MIN_CONFIDENCE", 0.9):
+        return None
+    display = dict(FinancialTransaction.TITLE_CHOICES).get(title, title)
+    return title, "PROCESSED", f"Klasyfikator lokalny ({confidence:.0%}): {display}"
@@ -0,0 +1,407 @@
+# core/services/charges.py
+"""
+Księgowanie naliczeń miesięcznych (MonthlyCharge).
+
+Każdy wiersz to naliczenie dla jednej umowy za jeden miesiąc:
+- rent        — czynsz miesiąca (harmonogram czynszu lub historia stawek umowy),
+- fixed_fees  — wywóz śmieci za miesiąc (stawka × liczba osób), jak w
+                dawnym rozliczeniu końcowym,
+- water_cost  — koszt wody okresu dwumiesięcznego w części przypadającej na
+                miesiące objęte umową.
+
+Koszt wody księgowany jest na pierwszy miesiąc okresu (np. styczeń dla okresu
+styczeń-luty) po zakończeniu okresu albo — gdy umowa kończy się w trakcie
+okresu — po zakończeniu umowy, z odczytów dostępnych w tej chwili. Wiersz
+zaksięgowany przed końcem okresu przeliczany jest ponownie po jego zakończeniu.
+
+Księgowanie jest idempotentne: ponowne wywołanie aktualizuje tylko wiersze,
+których wartości się zmieniły. Zmiany danych wejściowych oznaczają wiersze
+jako nieaktualne (is_stale, patrz core/signals.py), a odczyt przez
+get_agreement_charges() przelicza wyłącznie brakujące lub nieaktualne miesiące.
+Zamknięte naliczenie (closed_at) nie jest już przeliczane. Zamknięcie dotyczy
+wiersza (umowa, miesiąc), a nie całego miesiąca: umowa wprowadzona później
+dostaje naliczenie także za miesiąc już zamknięty.
+"""
+import datetime
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from ..models import (
+    Agreement,
+    AgreementBalance,
+    FixedCost,
+    Meter,
+    MonthlyCharge,
+    RentSchedule,
+    WaterCostOverride,
+)
+from .reporting import _get_period_start, get_building_water_consumptions
+
+CENT = Decimal("0.01")
+
+
+def month_range(start, end):
+    """Zwraca listę pierwszych dni miesięcy od start do end (włącznie)."""
+    months = []
+    current = start.replace(day=1)
+    while current <= end:
+        months.append(current)
+        current += relativedelta(months=1)
+    return months
+
+
+def billing_period_start(month):
+    """Pierwszy miesiąc okresu dwumiesięcznego, do którego należy dany miesiąc."""
+    return date(month.year, ((month.month - 1) // 2) * 2 + 1, 1)
+
+
+def billing_period_end(period_start):
+    return period_start + relativedelta(months=2, days=-1)
+
+
+def _covers(agreement, start, end, end_date=None):
+    """
+    Czy umowa obejmuje choć część przedziału [start, end]. end_date zastępuje
+    datę zakończenia umowy (rozliczenie na dany dzień bez zmiany obiektu).
+    """
+    end_date = end_date or agreement.end_date
+    if agreement.start_date and end < agreement.start_date:
+        return False
+    if end_date and start > end_date:
+        return False
+    return True
+
+
+def _covers_month(agreement, month, end_date=None):
+    return _covers(agreement, month, month + relativedelta(months=1, days=-1), end_date)
+
+
+def covered_months(agreement, period_start, end_date=None):
+    """Liczba miesięcy okresu dwumiesięcznego objętych umową (0, 1 lub 2)."""
+    return sum(
+        _covers_month(agreement, period_start + relativedelta(months=i), end_date)
+        for i in range(2)
+    )
+
+
+def water_due(agreement, period_start, today, end_date=None):
+    """
+    Czy koszt wody za okres należy już zaksięgować: okres się zakończył albo
+    umowa zakończyła się w jego trakcie (rozliczenie końcowe).
+    """
+    period_end = billing_period_end(period_start)
+    if period_end <= today:
+        return True
+    end_date = end_date or agreement.end_date
+    return end_date is not None and period_start <= end_date <= today
+
+
+def expected_months(agreement, months, today=None, end_date=None):
+    """
+    Z podanych miesięcy wybiera te, dla których umowa powinna mieć naliczenie:
+    miesiące objęte umową (czynsz i śmieci) oraz pierwsze miesiące okresów
+    dwumiesięcznych, które umowa choć częściowo obejmuje i za które należy
+    się już koszt wody (patrz water_due).
+    """
+    today = today or date.today()
+    result = []
+    for month in months:
+        if month > today:
+            continue
+        has_water = (
+            month == billing_period_start(month)
+            and water_due(agreement, month, today, end_date)
+            and _covers(agreement, month, billing_period_end(month), end_date)
+        )
+        if _covers_month(agreement, month, end_date) or has_water:
+            result.append(month)
+    return result
+
+
+class _ChargeInputs:
+    """
+    Dane wejściowe naliczeń pobrane jednorazowo dla zbioru umów i miesięcy,
+    aby obliczenia w pętli nie generowały zapytań do bazy.
+    """
+
+    def __init__(self, agreements, months):
+        agreement_ids = [ag.pk for ag in agreements]
+        period_starts = {billing_period_start(m) for m in months}
+
+        self.waste_rules = list(
+            FixedCost.objects.filter(category="waste", calculation_method="per_person")
+            .order_by("-effective_date")
+        )
+        self.overrides = {
+            o.period_start_date: o
+            for o in WaterCostOverride.objects.filter(period_start_date__in=period_starts)
+        }
+        self.building_consumptions = get_building_water_consumptions(period_starts)
+
+        self.rent_schedule = {
+            (rs.agreement_id, rs.year_month): rs.due_amount
+            for rs in RentSchedule.objects.filter(
+                agreement_id__in=agreement_ids, year_month__in=months
+            )
+        }
+
+        self.history = defaultdict(list)
+        for record in Agreement.history.filter(id__in=agreement_ids).order_by("history_date"):
+            self.history[record.id].append(record)
+
+        self.lokal_consumptions = defaultdict(lambda: defaultdict(Decimal))
+        lokal_ids = {ag.lokal_id for ag in agreements}
+        lokal_meters = Meter.objects.filter(
+            lokal_id__in=lokal_ids, type__in=["hot_water", "cold_water"], status="aktywny"
+        ).prefetch_related("readings")
+        for meter in lokal_meters:
+            readings = sorted(meter.readings.all(), key=lambda r: r.reading_date)
+            for i in range(1, len(readings)):
+                period_key = _get_period_start(readings[i].reading_date)
+                if period_key in period_starts:
+                    self.lokal_consumptions[period_key][meter.lokal_id] += (
+                        readings[i].value - readings[i - 1].value
+                    )
+
+    def rent(self, agreement, month, end_date=None):
+        if not _covers_month(agreement, month, end_date):
+            return Decimal("0.00")
+
+        scheduled = self.rent_schedule.get((agreement.pk, month))
+        if scheduled is not None:
+            return scheduled
+
+        # Stawka obowiązująca w połowie miesiąca według historii umowy.
+        date_in_month = timezone.make_aware(datetime.datetime(month.year, month.month, 15))
+        records = self.history.get(agreement.pk, [])
+        historical = [r for r in records if r.history_date <= date_in_month]
+        if historical:
+            return historical[-1].rent_amount
+        if agreement.start_date <= date_in_month.date():
+            return records[0].rent_amount if records else agreement.rent_amount
+        return Decimal("0.00")
+
+    def waste(self, agreement, month, end_date=None):
+        if not _covers_month(agreement, month, end_date):
+            return Decimal("0.00")
+        rule = next((r for r in self.waste_rules if r.effective_date <= month), None)
+        if not rule:
+            return Decimal("0.00")
+        return (rule.amount * agreement.number_of_occupants).quantize(CENT)
+
+    def water(self, agreement, period_start, end_date=None):
+        override = self.overrides.get(period_start)
+        total_building_consumption = sum(self.building_consumptions[period_start].values())
+        if not (override and override.overridden_bill_amount and total_building_consumption > 0):
+            return Decimal("0.00")
+        unit_price = override.overridden_bill_amount / total_building_consumption
+        lokal_consumption = self.lokal_consumptions[period_start].get(agreement.lokal_id, Decimal("0.00"))
+        # Umowa obejmująca jeden miesiąc okresu płaci połowę kosztu wody lokalu.
+        share = Decimal(covered_months(agreement, period_start, end_date)) / 2
+        return (lokal_consumption * unit_price * share).quantize(CENT)
+
+    def values(self, agreement, month, today, end_date=None):
+        """Naliczenie (czynsz, śmieci, woda) umowy za miesiąc."""
+        rent = self.rent(agreement, month, end_date)
+        fixed_fees = self.waste(agreement, month, end_date)
+        water_cost = Decimal("0.00")
+        if month == billing_period_start(month) and water_due(agreement, month, today, end_date):
+            water_cost = self.water(agreement, month, end_date)
+        return rent, fixed_fees, water_cost
+
+
+def agreements_in_months(months, manager=None):
+    """Umowy obejmujące choć część zakresu miesięcy (domyślnie tylko aktywne)."""
+    manager = manager or Agreement.objects
+    return manager.filter(
+        start_date__lte=months[-1] + relativedelta(months=1, days=-1)
+    ).filter(Q(end_date__isnull=True) | Q(end_date__gte=months[0]))
+
+
+def post_charges(months, agreements=None, today=None):
+    """
+    Księguje naliczenia dla podanych miesięcy (pierwsze dni miesięcy).
+    Domyślnie dla wszystkich aktywnych umów. Zamknięte naliczenia (umowa,
+    miesiąc) są pomijane — ani przeliczane, ani usuwane.
+    Zwraca słownik z liczbą utworzonych, zaktualizowanych i usuniętych wierszy.
+    """
+    today = today or date.today()
+    months = sorted({m.replace(day=1) for m in months})
+    summary = {"created": 0, "updated": 0, "deleted": 0}
+    if not months:
+        return summary
+
+    if agreements is None:
+        agreements = agreements_in_months(months)
+    agreements = list(agreements)
+    if not agreements:
+        return summary
+
+    inputs = _ChargeInputs(agreements, months)
+    existing, closed = {}, set()
+    for c in MonthlyCharge.objects.filter(agreement__in=agreements, month_year__in=months):
+        if c.closed_at is None:
+            existing[(c.agreement_id, c.month_year)] = c
+        else:
+            closed.add((c.agreement_id, c.month_year))
+
+    now = timezone.now()
+    to_create, to_update, seen, changed = [], [], set(), []
+    for agreement in agreements:
+        for month in expected_months(agreement, months, today):
+            if (agreement.pk, month) in closed:
+                continue
+            rent, fixed_fees, water_cost = inputs.values(agreement, month, today)
+
+            key = (agreement.pk, month)
+            seen.add(key)
+            charge = existing.get(key)
+            if charge is None:
+                to_create.append(MonthlyCharge(
+                    agreement=agreement, month_year=month, rent=rent,
+                    fixed_fees=fixed_fees, water_cost=water_cost, posted_at=now,
+                ))
+                changed.append(key)
+            elif (
+                (charge.rent, charge.fixed_fees, charge.water_cost) != (rent, fixed_fees, water_cost)
+                or _needs_posting(charge, today)
+            ):
+                if (charge.rent, charge.fixed_fees, charge.water_cost) != (rent, fixed_fees, water_cost):
+                    changed.append(key)
+                charge.rent, charge.fixed_fees, charge.water_cost = rent, fixed_fees, water_cost
+                charge.is_stale = False
+                charge.posted_at = now
+                to_update.append(charge)
+
+    obsolete = {key: c.pk for key, c in existing.items() if key not in seen}
+    changed.extend(obsolete)
+
+    with transaction.atomic():
+        MonthlyCharge.objects.bulk_create(to_create, batch_size=500)
+        MonthlyCharge.objects.bulk_update(
+            to_update, ["rent", "fixed_fees", "water_cost", "is_stale", "posted_at"], batch_size=500
+        )
+        if obsolete:
+            MonthlyCharge.objects.filter(pk__in=obsolete.values()).delete()
+
+        # Zmienione naliczenia unieważniają saldo umowy od najwcześniejszego zmienionego miesiąca.
+        first_changed = {}
+        for agreement_id, month in changed:
+            first_changed[agreement_id] = min(month, first_changed.get(agreement_id, month))
+        for agreement_id, month in first_changed.items():
+            AgreementBalance.objects.filter(
+                agreement_id=agreement_id, month__gte=month, is_stale=False
+            ).update(is_stale=True)
+
+    summary["created"] = len(to_create)
+    summary["updated"] = len(to_update)
+    summary["deleted"] = len(obsolete)
+    return summary
+
+
+def _needs_posting(charge, today):
+    if charge.closed_at is not None:
+        return False
+    if charge.is_stale:
+        return True
+    # Wiersz zaksięgowany przed końcem swojego okresu dwumiesięcznego jest tymczasowy.
+    period_start = billing_period_start(charge.month_year)
+    return charge.month_year == period_start and charge.posted_at.date() < billing_period_end(period_start) <= today
+
+
+def ensure_charges_posted(agreements, start, end, today=None):
+    """
+    Zwraca naliczenia umów z zakresu miesięcy [start, end] jako słownik
+    {agreement_id: {miesiąc: MonthlyCharge}}, doksięgowując wcześniej tylko
+    brakujące lub nieaktualne miesiące (jednym wywołaniem post_charges).
+    """
+    today = today or date.today()
+    agreements = list(agreements)
+    months = month_range(start, min(end, today))
+
+    def load():
+        result = defaultdict(dict)
+        for charge in MonthlyCharge.objects.filter(
+            agreement__in=agreements, month_year__range=(start, end)
+        ):
+            result[charge.agreement_id][charge.month_year] = charge
+        return result
+
+    charges = load()
+    to_post, needing = set(), []
+    for agreement in agreements:
+        existing = charges.get(agreement.pk, {})
+        missing = [
+            m for m in expected_months(agreement, months, today)
+            if m not in existing or _needs_posting(existing[m], today)
+        ]
+        if missing:
+            to_post.update(missing)
+            needing.append(agreement)
+    if to_post:
+        post_charges(to_post, agreements=needing, today=today)
+        charges = load()
+    return charges
+
+
+def get_agreement_charges(agreement, start, end, today=None):
+    """
+    Zwraca naliczenia umowy z zakresu miesięcy [start, end] jako słownik
+    {miesiąc: MonthlyCharge}, doksięgowując wcześniej tylko brakujące
+    lub nieaktualne miesiące.
+    """
+    return ensure_charges_posted([agreement], start, end, today).get(agreement.pk, {})
+
+
+def settlement_charge_totals(agreement, start, end_date):
+    """
+    Sumy naliczeń umowy od miesiąca start do dnia end_date, liczone tak, jakby
+    umowa kończyła się w end_date — bez zapisu do bazy (rozliczenie końcowe
+    można podejrzeć dla umowy, która jeszcze trwa). Ostatni, niezakończony
+    okres dwumiesięczny wchodzi z częścią kosztu wody z dostępnych odczytów.
+    Zamknięte naliczenia brane są z księgi bez przeliczania.
+    """
+    months = month_range(start, end_date)
+    closed = {
+        charge.month_year: charge
+        for charge in MonthlyCharge.objects.filter(
+            agreement=agreement, month_year__in=months, closed_at__isnull=False
+        )
+    }
+    inputs = _ChargeInputs([agreement], months)
+    totals = {"rent": Decimal("0.00"), "fixed_fees": Decimal("0.00"), "water_cost": Decimal("0.00")}
+    for month in expected_months(agreement, months, end_date, end_date):
+        charge = closed.get(month)
+        if charge is not None:
+            values = (charge.rent, charge.fixed_fees, charge.water_cost)
+        else:
+            values = inputs.values(agreement, month, end_date, end_date)
+        for key, value in zip(("rent", "fixed_fees", "water_cost"), values):
+            totals[key] += value
+    return totals
+
+
+def mark_charges_stale(**filters):
+    """Oznacza otwarte naliczenia spełniające filtry jako wymagające przeliczenia."""
+    MonthlyCharge.objects.filter(closed_at__isnull=True, is_stale=False, **filters).update(is_stale=True)
+
+
+def close_period(months):
+    """
+    Księguje i zamraża naliczenia podanych miesięcy — dla wszystkich umów
+    obejmujących te miesiące, także nieaktywnych (zakończonych lub
+    zarchiwizowanych). Zwraca liczbę zamkniętych wierszy.
+    """
+    months = sorted({m.replace(day=1) for m in months})
+    if not months:
+        return 0
+    post_charges(months, agreements_in_months(months, Agreement.all_objects))
+    return MonthlyCharge.objects.filter(
+        month_year__in=months, closed_at__isnull=True
+    ).update(closed_at=timezone.now(), is_stale=False)
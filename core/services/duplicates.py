@@ -0,0 +1,141 @@
+# core/services/duplicates.py
+"""
+Wykrywanie zdublowanych transakcji między importami.
+
+Bank potrafi wystawić tę samą operację ponownie z innym transaction_id,
+a ręczny import potrafi powielić część podzielonej wpłaty — takie duplikaty
+zawyżają salda. Każda transakcja ma odcisk (FinancialTransaction.fingerprint)
+z daty księgowania, kwoty i znormalizowanego opisu/kontrahenta, zapisywany
+przy zapisie (sygnał pre_save) i przy zbiorczym imporcie. Kolumna jest
+zaindeksowana, więc sprawdzenie wiersza to jedno wyszukiwanie w indeksie
+zamiast porównywania każdej transakcji z każdą.
+
+Pary o tym samym odcisku trafiają do DuplicateCandidate i czekają na
+przegląd (strona duplicate_review): usunięcie jednej z transakcji albo
+oznaczenie pary jako „to nie duplikat”.
+"""
+import hashlib
+import re
+import unicodedata
+from decimal import Decimal
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import Count
+
+from ..models import DuplicateCandidate, FinancialTransaction
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(value):
+    """Małe litery bez polskich znaków, tylko litery i cyfry oddzielone spacją."""
+    value = unicodedata.normalize("NFKD", (value or "").lower().replace("ł", "l"))
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", value).strip()
+
+
+def transaction_fingerprint(posting_date, amount, description, contractor):
+    """Odcisk transakcji: data księgowania, kwota i znormalizowany opis z kontrahentem."""
+    if posting_date is None or amount is None:
+        return ""
+    content = "|".join((
+        posting_date.isoformat(),
+        str(Decimal(amount).quantize(Decimal("0.01"))),
+        normalize_text(description),
+        normalize_text(contractor),
+    ))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def fingerprint_of(ft):
+    return transaction_fingerprint(ft.posting_date, ft.amount, ft.description, ft.contractor)
+
+
+def record_candidates(fingerprints):
+    """
+    Zapisuje pary transakcji o wspólnym odcisku (dla podanych odcisków) jako
+    DuplicateCandidate. Części jednej podzielonej wpłaty (ten sam split_group)
+    nie są parą.
+    Pary już znane (także odrzucone) nie są dodawane ponownie.
+    Zwraca liczbę nowych kandydatów.
+    """
+    fingerprints = [fp for fp in set(fingerprints) if fp]
+    groups = {}
+    for offset in range(0, len(fingerprints), 500):
+        for pk, fingerprint, split_group in (
+            FinancialTransaction.objects
+            .filter(fingerprint__in=fingerprints[offset:offset + 500])
+            .order_by("fingerprint", "pk")
+            .values_list("pk", "fingerprint", "split_group")
+        ):
+            groups.setdefault(fingerprint, []).append((pk, split_group))
+
+    candidates = [
+        DuplicateCandidate(first_id=first[0], second_id=second[0], fingerprint=fingerprint)
+        for fingerprint, members in groups.items()
+        if len(members) > 1
+        for first, second in combinations(members, 2)
+        if first[1] is None or first[1] != second[1]
+    ]
+    if not candidates:
+        return 0
+    before = DuplicateCandidate.objects.count()
+    DuplicateCandidate.objects.bulk_create(candidates, ignore_conflicts=True)
+    return DuplicateCandidate.objects.count() - before
+
+
+def scan_duplicates():
+    """Przegląd całej historii: odciski występujące więcej niż raz (GROUP BY po indeksie)."""
+    shared = (
+        FinancialTransaction.objects.exclude(fingerprint="")
+        .order_by()
+        .values("fingerprint")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("fingerprint", flat=True)
+    )
+    return record_candidates(list(shared))
+
+
+def backfill_fingerprints(queryset=None, batch_size=2000):
+    """Uzupełnia brakujące odciski (np. wiersze z bulk_create spoza importu). Zwraca liczbę wierszy."""
+    queryset = FinancialTransaction.objects.filter(fingerprint="") if queryset is None else queryset
+    batch = []
+    updated = 0
+    for ft in queryset.only("pk", "posting_date", "amount", "description", "contractor").iterator(chunk_size=batch_size):
+        ft.fingerprint = fingerprint_of(ft)
+        batch.append(ft)
+        if len(batch) >= batch_size:
+            updated += FinancialTransaction.objects.bulk_update(batch, ["fingerprint"])
+            batch = []
+    if batch:
+        updated += FinancialTransaction.objects.bulk_update(batch, ["fingerprint"])
+    return updated
+
+
+def open_candidates():
+    return DuplicateCandidate.objects.filter(status="OPEN").select_related(
+        "first", "first__lokal", "second", "second__lokal",
+    )
+
+
+def dismiss_candidate(candidate):
+    candidate.status = "DISMISSED"
+    candidate.save(update_fields=["status"])
+
+
+def delete_duplicate(candidate, transaction_pk):
+    """
+    Usuwa jedną z transakcji pary (przez delete(), żeby sygnały przeliczyły
+    salda i raporty). Pozostałe pary z tą transakcją znikają kaskadowo.
+    Transakcje należące do podziału nie są usuwane — kwotę części przywraca
+    się scaleniem lub cofnięciem podziału.
+    """
+    if transaction_pk not in (candidate.first_id, candidate.second_id):
+        raise ValueError("Ta transakcja nie należy do wskazanej pary.")
+    with transaction.atomic():
+        ft = FinancialTransaction.objects.get(pk=transaction_pk)
+        if ft.split_group is not None:
+            raise ValueError("Transakcja należy do podziału — scal lub cofnij podział zamiast ją usuwać.")
+        ft.delete()
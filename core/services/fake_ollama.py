@@ -0,0 +1,325 @@
+# core/services/fake_ollama.py
+"""
+Atrapa serwera Ollama do testów obciążeniowych i benchmarków ścieżki AI
+na maszynie bez zainstalowanego modelu.
+
+Obsługuje GET /api/tags i POST /api/generate — strumieniowo (NDJSON, token
+po tokenie) lub jednym JSON-em; przy "format": "json" odpowiedzią jest obiekt
+{id: kod} dla promptu wsadowego. Respektuje options.num_predict i keep_alive
+(pusty prompt tylko ładuje model).
+Zachowanie sterowane jest przez FakeOllamaConfig:
+
+- opóźnienie odpowiedzi: stałe, jednostajne (latency ± jitter) albo
+  log-normalne (mediana latency, rozrzut jitter) — ten ostatni rozkład
+  najlepiej oddaje długi ogon czasów prawdziwego modelu,
+- czas generowania tokenu, "gadatliwość" modelu po kodzie kategorii
+  i czas ładowania modelu (zimny start po wygaśnięciu keep_alive),
+- odsetek błędów HTTP 500 i odsetek odpowiedzi "UNKNOWN",
+- deterministyczne odpowiedzi: ten sam prompt zawsze daje tę samą kategorię
+  (słowa kluczowe z opisu, a w ostateczności skrót promptu).
+
+Uruchomienie: `python manage.py fake_ollama` albo w wątku przez
+running_fake_ollama() — tak robi komenda benchmark_ai.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .ai_categorization import CATEGORY_DISPLAY_MAP
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# Słowa kluczowe opisu -> kategoria zwracana przez atrapę (pierwsze dopasowanie wygrywa).
+KEYWORD_ANSWERS = [
+    ("czynsz", "czynsz"),
+    ("odpad", "wywoz_smieci"),
+    ("śmieci", "wywoz_smieci"),
+    ("sprzątanie", "sprzatanie"),
+    ("ogrod", "ogrodnik"),
+    ("napraw", "naprawy_remonty"),
+    ("remont", "naprawy_remonty"),
+    ("wod", "oplata_za_wode"),
+    ("tauron", "energia_klatka"),
+    ("ubezpiecz", "ubezpieczenie"),
+    ("podatek", "podatek"),
+    ("kominiar", "kominiarz"),
+]
+
+# "Wyjaśnienie", którym model uzupełnia odpowiedź, gdy nie ograniczy go num_predict.
+CHATTER = [" —", " wybrano", " tę", " kategorię", " na", " podstawie", " opisu", " i", " kontrahenta", "."] * 5
+
+_DESCRIPTION = re.compile(r"^Opis:(.*)$", re.MULTILINE)
+_CONTRACTOR = re.compile(r"^Kontrahent:(.*)$", re.MULTILINE)
+
+
+@dataclass
+class FakeOllamaConfig:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    distribution: str = "lognormal"
+    error_rate: float = 0.0
+    unknown_rate: float = 0.1
+    token_ms: float = 10.0
+    chatter_tokens: int = 20
+    load_ms: float = 0.0
+    model: str = "neural-chat"
+    seed: int = 0
+
+
+def parse_keep_alive(value, default=300.0):
+    """keep_alive Ollamy ("30m", "90s", "1h", liczba sekund) w sekundach."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", str(value))
+    if not match:
+        return default
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+def answer_for_prompt(prompt, unknown_rate=0.0):
+    """Deterministyczna odpowiedź na prompt kategoryzacji."""
+    description = _DESCRIPTION.search(prompt)
+    contractor = _CONTRACTOR.search(prompt)
+    text = " ".join(m.group(1) for m in (description, contractor) if m).lower() or prompt.lower()
+    for keyword, code in KEYWORD_ANSWERS:
+        if keyword in text:
+            return code
+    digest = int(hashlib.md5(prompt.encode("utf-8")).hexdigest(), 16)
+    if (digest % 1000) / 1000 < unknown_rate:
+        return "UNKNOWN"
+    codes = sorted(CATEGORY_DISPLAY_MAP)
+    return codes[digest % len(codes)]
+
+
+def answer_for_batch_prompt(prompt, unknown_rate=0.0):
+    """Odpowiedź JSON {id: kod} na prompt wsadowy (transakcje jako linie JSON)."""
+    answers = {}
+    for line in prompt.splitlines():
+        if not line.startswith("{"):
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(item, dict) and "id" in item:
+            text = f"Opis: {item.get('opis', '')}\nKontrahent: {item.get('kontrahent', '')}"
+            answers[item["id"]] = answer_for_prompt(text, unknown_rate)
+    return json.dumps(answers, ensure_ascii=False)
+
+
+class FakeOllamaStats:
+    """Liczniki atrapy — czytane przez benchmark po każdym przebiegu."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.prompts = {}
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.cold_starts = 0
+            self.connections = 0
+
+    def connected(self):
+        with self._lock:
+            self.connections += 1
+
+    def started(self, prompt):
+        with self._lock:
+            self.requests += 1
+            self.prompts[prompt] = self.prompts.get(prompt, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors += 1
+
+    def cold_start(self):
+        with self._lock:
+            self.cold_starts += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "unique_prompts": len(self.prompts),
+                # Zapytania, których uniknąłby cache odpowiedzi po treści promptu.
+                "repeated_prompts": self.requests - len(self.prompts),
+                "max_in_flight": self.max_in_flight,
+                "cold_starts": self.cold_starts,
+                # Mniej połączeń niż zapytań = klient używa keep-alive z puli.
+                "connections": self.connections,
+            }
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config=None):
+        self.config = config or FakeOllamaConfig()
+        self.stats = FakeOllamaStats()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._loaded_until = 0.0
+        super().__init__(address, FakeOllamaHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def load_model(self, keep_alive=None):
+        """Symuluje ładowanie modelu: load_ms, jeśli nie jest w pamięci; przedłuża keep_alive."""
+        with self._rng_lock:
+            cold = time.monotonic() >= self._loaded_until
+            self._loaded_until = time.monotonic() + parse_keep_alive(keep_alive)
+        if cold and self.config.load_ms:
+            self.stats.cold_start()
+            time.sleep(self.config.load_ms / 1000)
+
+    def draw(self):
+        """Losuje (opóźnienie w sekundach, czy błąd) dla kolejnego zapytania."""
+        config = self.config
+        with self._rng_lock:
+            if config.distribution == "fixed":
+                latency = config.latency_ms
+            elif config.distribution == "uniform":
+                latency = self._rng.uniform(config.latency_ms - config.jitter_ms, config.latency_ms + config.jitter_ms)
+            else:
+                sigma = config.jitter_ms / config.latency_ms if config.latency_ms else 0
+                latency = config.latency_ms * self._rng.lognormvariate(0, sigma)
+            failed = self._rng.random() < config.error_rate
+        return max(latency, 0) / 1000, failed
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOllama/1.0"
+    # HTTP/1.1: połączenia keep-alive z puli klienta są ponownie używane.
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.stats.connected()
+
+    def log_message(self, format, *args):
+        # Cisza — przy tysiącach zapytań log na stderr zafałszowałby pomiar.
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Klient zrezygnował (timeout) — tak jak przy prawdziwym Ollama.
+            self.close_connection = True
+
+    def _stream(self, model, tokens, token_seconds):
+        """Odpowiedź NDJSON (Transfer-Encoding: chunked), token po tokenie."""
+        def chunk(payload):
+            data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(token_seconds)
+                chunk({"model": model, "response": token, "done": False})
+            chunk({"model": model, "response": "", "done": True, "eval_count": len(tokens)})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Klient zamknął połączenie przed końcem strumienia (timeout).
+            self.close_connection = True
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/api/tags":
+            return self._send_json(404, {"error": "not found"})
+        self._send_json(200, {"models": [{"name": f"{self.server.config.model}:latest", "model": self.server.config.model}]})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/api/generate":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": "invalid JSON"})
+
+        config = self.server.config
+        model = payload.get("model", config.model)
+        prompt = payload.get("prompt", "")
+        self.server.load_model(payload.get("keep_alive"))
+        if not prompt:
+            # Pusty prompt = tylko załadowanie modelu (rozgrzewka).
+            return self._send_json(200, {"model": model, "response": "", "done": True, "done_reason": "load"})
+
+        stats = self.server.stats
+        stats.started(prompt)
+        latency, failed = self.server.draw()
+        time.sleep(latency)
+        if failed:
+            stats.finished(error=True)
+            return self._send_json(500, {"error": "simulated failure"})
+
+        if payload.get("format") == "json":
+            tokens = [answer_for_batch_prompt(prompt, config.unknown_rate)]
+        else:
+            answer = answer_for_prompt(prompt, config.unknown_rate)
+            # Model "gada" dalej po kodzie — to właśnie ucina num_predict.
+            tokens = [answer[i:i + 4] for i in range(0, len(answer), 4)] + CHATTER[:config.chatter_tokens]
+        num_predict = (payload.get("options") or {}).get("num_predict")
+        if num_predict and num_predict > 0:
+            tokens = tokens[:num_predict]
+        token_seconds = config.token_ms / 1000
+
+        if payload.get("stream", True):
+            self._stream(model, tokens, token_seconds)
+            stats.finished()
+            return None
+
+        time.sleep(token_seconds * len(tokens))
+        stats.finished()
+        self._send_json(200, {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": "".join(tokens),
+            "done": True,
+            "total_duration": int((latency + token_seconds * len(tokens)) * 1e9),
+            "eval_count": len(tokens),
+        })
+
+
+@contextmanager
+def running_fake_ollama(config=None, host="127.0.0.1", port=0):
+    """Uruchamia atrapę w wątku tła na czas bloku (port 0 = dowolny wolny port)."""
+    server = FakeOllamaServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,147 @@
+# core/services/import_staging.py
+"""
+Import etapowy — podgląd przed zatwierdzeniem.
+
+stage_import() wykonuje całą kosztowną część importu (parsowanie, reguły,
+lokalny klasyfikator, Ollama) dokładnie raz i zapisuje wynik w tabeli
+StagedTransaction powiązanej z ImportJob. Strona podglądu czyta tylko
+staging (wiersze niezmienione i edytowane ręcznie są pomijane już przy
+parsowaniu), a commit_import() przenosi wiersze do FinancialTransaction jednym
+zbiorczym upsertem (write_transactions) — bez ponownego dopasowania i AI.
+Transakcje edytowane ręcznie lub zweryfikowane w czasie, gdy podgląd czekał,
+są przy zatwierdzeniu pomijane, a statystyki reguł (hit_count) rosną dopiero
+przy zatwierdzeniu — odrzucony lub wygasły podgląd ich nie zmienia.
+
+Niezatwierdzone podglądy starsze niż IMPORT_STAGING_TTL_HOURS są usuwane
+przy tworzeniu kolejnego.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import ImportJob, StagedTransaction
+from .transaction_processing import (
+    RuleHits,
+    import_summary,
+    parse_statement,
+    resolve_titles,
+    write_transactions,
+)
+
+# Pola rekordu importu przechowywane w StagedTransaction.
+STAGED_FIELDS = [
+    "transaction_id", "posting_date", "description", "amount", "contractor", "title", "lokal",
+    "status", "provenance", "ai_source", "ai_title",
+]
+
+
+def expire_staged_jobs(now=None):
+    """Usuwa (kaskadowo z wierszami) podglądy niezatwierdzone w ciągu IMPORT_STAGING_TTL_HOURS."""
+    hours = getattr(settings, 'IMPORT_STAGING_TTL_HOURS', 24)
+    cutoff = (now or timezone.now()) - timedelta(hours=hours)
+    deleted, _ = ImportJob.objects.filter(status='STAGED', created_at__lt=cutoff).delete()
+    return deleted
+
+
+def stage_import(file, ai_mode='conflict_and_unprocessed', user=None, file_name="", timings=None):
+    """
+    Parsuje i kategoryzuje wyciąg, zapisując wynik w stagingu.
+    Zwraca (ImportJob, None) albo (None, słownik z kluczem 'error'), gdy pliku
+    nie da się odczytać — w tym samym formacie co process_csv_file().
+    """
+    expire_staged_jobs()
+    statement = parse_statement(file, timings, skip_known=True)
+    if statement.get("error"):
+        return None, statement
+
+    rows = statement["rows"]
+    ai_summary, classified_count = resolve_titles(rows, ai_mode, timings)
+    with transaction.atomic():
+        job = ImportJob.objects.create(
+            file_name=file_name[:255],
+            ai_mode=ai_mode,
+            created_by=user if user is not None and user.is_authenticated else None,
+            summary={
+                "skipped_rows": statement["skipped_rows"],
+                "encoding_warning": statement["encoding_warning"],
+                "unchanged_count": statement["unchanged_count"],
+                "protected_count": statement["protected_count"],
+                "ai": ai_summary,
+                "classified_count": classified_count,
+            },
+        )
+        StagedTransaction.objects.bulk_create(
+            StagedTransaction(
+                job=job,
+                action='UPDATE' if row["exists"] else 'NEW',
+                **{field: row[field] for field in STAGED_FIELDS},
+            )
+            for row in rows
+        )
+    return job, None
+
+
+def preview_stats(job):
+    """Liczby wierszy w podglądzie: według operacji, statusu i źródła tytułu."""
+    staged = job.staged_rows.order_by()
+    return {
+        "total": staged.count(),
+        **{
+            key: dict(staged.values_list(field).annotate(count=Count("id")))
+            for key, field in (("actions", "action"), ("statuses", "status"), ("sources", "ai_source"))
+        },
+    }
+
+
+def commit_import(job):
+    """
+    Przenosi wiersze podglądu do FinancialTransaction jednym zbiorczym upsertem
+    i oznacza import jako zatwierdzony. Wiersze transakcji, które od przygotowania
+    podglądu stały się chronione (edycja ręczna, podział, weryfikacja), są
+    pomijane; dopasowania reguł zapisanych wierszy trafiają do statystyk reguł.
+    Zwraca podsumowanie jak process_csv_file(); ValueError, gdy import nie czeka
+    już na zatwierdzenie.
+    """
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().get(pk=job.pk)
+        if job.status != 'STAGED':
+            raise ValueError(f"Import jest już {job.get_status_display().lower()}.")
+        rows = [
+            {"exists": staged.action == 'UPDATE', **{field: getattr(staged, field) for field in STAGED_FIELDS}}
+            for staged in job.staged_rows.select_related("lokal")
+        ]
+        statuses, created_rules, duplicates, protected = write_transactions(rows)
+        rows = [row for row in rows if row["transaction_id"] not in protected]
+        job.status = 'COMMITTED'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at'])
+        job.staged_rows.all().delete()
+    hits = RuleHits()
+    for row in rows:
+        hits.add_provenance(row["provenance"])
+    hits.flush()
+    statement = {
+        "rows": rows,
+        "skipped_rows": job.summary.get("skipped_rows", []),
+        "encoding_warning": job.summary.get("encoding_warning", False),
+        "unchanged_count": job.summary.get("unchanged_count", 0),
+        "protected_count": job.summary.get("protected_count", 0) + len(protected),
+    }
+    return import_summary(
+        statement, statuses, job.summary.get("ai"), job.summary.get("classified_count", 0), created_rules, duplicates,
+    )
+
+
+def discard_import(job):
+    """Odrzuca podgląd — wiersze stagingu są usuwane, zadanie zostaje jako ślad."""
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().get(pk=job.pk)
+        if job.status != 'STAGED':
+            raise ValueError(f"Import jest już {job.get_status_display().lower()}.")
+        job.staged_rows.all().delete()
+        job.status = 'DISCARDED'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at'])
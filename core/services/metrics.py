@@ -0,0 +1,146 @@
+# core/services/metrics.py
+"""
+Nazwane pomiary czasu (spany) etapów importu, raportów i PDF agregowane
+w histogramy w pamięci procesu.
+
+    with span("annual_report.payments"):
+        ...
+
+Dla każdej nazwy trzymamy dokładną liczbę i sumę czasów oraz próbkę
+ostatnich METRICS_RESERVOIR_SIZE pomiarów, z której liczone są percentyle
+p50/p95/p99. Dane są eksportowane w formacie tekstowym Prometheusa
+(widok /metrics/) i pokazywane przez komendę `stage_metrics`.
+Koszt pomiaru to dwa odczyty zegara i jedna blokada — można go zostawić
+włączonego na produkcji.
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+METRIC_NAME = "kamienica_stage_seconds"
+QUANTILES = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+_histograms = {}
+
+
+class Histogram:
+    def __init__(self, reservoir_size):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=reservoir_size)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        """Percentyl metodą najbliższej rangi z próbki ostatnich pomiarów."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def record(name, seconds):
+    """Dopisuje pomiar (w sekundach) do histogramu o podanej nazwie."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(getattr(settings, "METRICS_RESERVOIR_SIZE", 1000))
+        histogram.observe(seconds)
+
+
+@contextmanager
+def span(name):
+    """Mierzy czas bloku i zapisuje go pod nazwą `name` (również gdy blok rzuci wyjątek)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+class Stopwatch:
+    """
+    Pomiar kolejnych etapów jednej operacji bez zagnieżdżania kodu w blokach with:
+    sw = Stopwatch("pdf"); ...; sw.lap("layout"); ...; sw.lap("build").
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        record(f"{self.prefix}.{stage}", now - self.last)
+        self.last = now
+
+
+def snapshot():
+    """Migawka wszystkich histogramów: lista słowników posortowana po nazwie."""
+    with _lock:
+        items = sorted(_histograms.items())
+        rows = []
+        for name, histogram in items:
+            row = {
+                "name": name,
+                "count": histogram.count,
+                "sum": histogram.total,
+                "max": histogram.max,
+            }
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}"] = histogram.quantile(q)
+            rows.append(row)
+    return rows
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def render_prometheus(rows=None):
+    """Eksport w formacie tekstowym Prometheusa (typ summary, etykieta stage)."""
+    rows = snapshot() if rows is None else rows
+    lines = [
+        f"# HELP {METRIC_NAME} Czas etapów importu, raportów i generowania PDF.",
+        f"# TYPE {METRIC_NAME} summary",
+    ]
+    for row in rows:
+        label = row["name"].replace("\\", "\\\\").replace('"', '\\"')
+        for q in QUANTILES:
+            lines.append(f'{METRIC_NAME}{{stage="{label}",quantile="{q}"}} {row[f"p{int(q * 100)}"]:.6f}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{label}"}} {row["sum"]:.6f}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{label}"}} {row["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def parse_prometheus(text):
+    """Odwrotność render_prometheus() — używana przez komendę stage_metrics przy --url."""
+    rows = {}
+    for line in text.splitlines():
+        if not line.startswith(METRIC_NAME):
+            continue
+        series, value = line.rsplit(" ", 1)
+        metric, _, labels = series.partition("{")
+        labels = dict(
+            part.split("=", 1) for part in labels.rstrip("}").split(",") if "=" in part
+        )
+        name = labels.get("stage", "").strip('"')
+        row = rows.setdefault(name, {"name": name, "count": 0, "sum": 0.0, "max": None})
+        if metric.endswith("_sum"):
+            row["sum"] = float(value)
+        elif metric.endswith("_count"):
+            row["count"] = int(float(value))
+        elif "quantile" in labels:
+            q = float(labels["quantile"].strip('"'))
+            row[f"p{int(q * 100)}"] = float(value)
+    return [rows[name] for name in sorted(rows)]
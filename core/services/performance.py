@@ -0,0 +1,114 @@
+# core/services/performance.py
+"""
+Pomiary wydajności żądań HTTP zbierane przez core.middleware.PerformanceMiddleware.
+
+Dla każdego żądania zapisywany jest czas całkowity, liczba i czas zapytań SQL,
+najwolniejsze zapytania oraz "odciski" powtarzających się zapytań (N+1).
+Dane trzymane są w pamięci procesu:
+
+- bufor cykliczny ostatnich wolnych żądań (PERF_RING_SIZE wpisów),
+- agregaty per nazwa URL (liczba żądań, suma/maksimum czasu i zapytań).
+
+Przy kilku procesach serwera (gunicorn) każdy ma własne statystyki —
+to narzędzie diagnostyczne, a nie system monitoringu.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+_lock = threading.Lock()
+_slow_requests = deque(maxlen=getattr(settings, "PERF_RING_SIZE", 200))
+_endpoint_stats = {}
+
+
+def fingerprint_sql(sql):
+    """Normalizuje SQL do postaci niezależnej od parametrów (listy IN, liczby, napisy)."""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _STRING.sub("?", sql)
+    return _NUMBER.sub("?", sql)
+
+
+class QueryRecorder:
+    """execute_wrapper zbierający (fingerprint, sql, czas) wszystkich zapytań żądania."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(duration for _, duration in self.queries) * 1000
+
+    def slowest(self, limit=5):
+        ranked = sorted(self.queries, key=lambda q: q[1], reverse=True)[:limit]
+        return [{"sql": sql[:500], "ms": round(duration * 1000, 2)} for sql, duration in ranked]
+
+    def duplicates(self, threshold):
+        """Odciski zapytań wykonanych co najmniej `threshold` razy — kandydaci na N+1."""
+        counts = Counter(fingerprint_sql(sql) for sql, _ in self.queries)
+        return [
+            {"fingerprint": fingerprint[:500], "count": count}
+            for fingerprint, count in counts.most_common()
+            if count >= threshold
+        ]
+
+
+def record_request(entry):
+    """Dolicza żądanie do agregatów i — jeśli jest wolne — dopisuje je do bufora."""
+    with _lock:
+        stats = _endpoint_stats.setdefault(entry["endpoint"], {
+            "endpoint": entry["endpoint"],
+            "count": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "total_queries": 0,
+            "max_queries": 0,
+            "slow_count": 0,
+        })
+        stats["count"] += 1
+        stats["total_ms"] += entry["ms"]
+        stats["max_ms"] = max(stats["max_ms"], entry["ms"])
+        stats["total_queries"] += entry["queries"]
+        stats["max_queries"] = max(stats["max_queries"], entry["queries"])
+        if entry["slow"]:
+            stats["slow_count"] += 1
+            _slow_requests.append(entry)
+
+
+def get_slow_requests():
+    """Ostatnie wolne żądania, od najnowszego."""
+    with _lock:
+        return list(reversed(_slow_requests))
+
+
+def get_endpoint_stats(order_by="avg_ms"):
+    """Agregaty per endpoint ze średnimi, posortowane malejąco po wybranej kolumnie."""
+    with _lock:
+        rows = [dict(stats) for stats in _endpoint_stats.values()]
+    for row in rows:
+        row["avg_ms"] = row["total_ms"] / row["count"]
+        row["avg_queries"] = row["total_queries"] / row["count"]
+    return sorted(rows, key=lambda row: row.get(order_by, 0), reverse=True)
+
+
+def reset():
+    with _lock:
+        _slow_requests.clear()
+        _endpoint_stats.clear()
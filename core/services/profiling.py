@@ -0,0 +1,122 @@
+# core/services/profiling.py
+"""
+Profilowanie cProfile na żądanie, bez restartu serwera.
+
+Superużytkownik dodaje w adminie ProfilingRule dla widoku (nazwa URL lub
+prefiks ścieżki) albo komendy zarządzania. Pasujące wykonania są profilowane,
+ale profil zapisywany jest tylko, gdy czas przekroczy próg reguły — plik .prof
+(pstats; otwiera go snakeviz, flameprof lub `python -m pstats`) trafia do
+MEDIA_ROOT/profiles/, a w bazie powstaje CapturedProfile ze skrótem
+najkosztowniejszych funkcji. Przechowywanych jest najwyżej PROFILING_MAX_PROFILES
+profili — najstarsze są usuwane.
+
+Reguły są czytane z bazy najwyżej raz na PROFILING_RULES_TTL sekund na proces,
+więc żądania bez pasującej reguły nie płacą za profilowanie prawie nic.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import CapturedProfile, ProfilingRule
+
+_lock = threading.Lock()
+_rules_cache = {"expires": 0.0, "rules": []}
+
+
+def active_rules():
+    """Aktywne, niewygasłe reguły — z pamięci procesu, odświeżane co PROFILING_RULES_TTL s."""
+    now = time.monotonic()
+    with _lock:
+        if now < _rules_cache["expires"]:
+            return _rules_cache["rules"]
+    rules = list(
+        ProfilingRule.objects.filter(is_active=True)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+    )
+    with _lock:
+        _rules_cache["rules"] = rules
+        _rules_cache["expires"] = now + getattr(settings, "PROFILING_RULES_TTL", 30)
+    return rules
+
+
+def clear_rules_cache():
+    with _lock:
+        _rules_cache["expires"] = 0.0
+
+
+def match_rule(kind, name, path=""):
+    """Pierwsza reguła danego rodzaju pasująca do nazwy widoku/komendy lub prefiksu ścieżki."""
+    for rule in active_rules():
+        if rule.kind != kind:
+            continue
+        if rule.target == name or (rule.target.startswith("/") and path.startswith(rule.target)):
+            return rule
+    return None
+
+
+def _summary(profiler, limit=30):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+def _rotate():
+    keep = getattr(settings, "PROFILING_MAX_PROFILES", 50)
+    for profile in CapturedProfile.objects.order_by("-created_at", "-pk")[keep:]:
+        profile.delete()  # plik usuwa sygnał post_delete
+
+
+def save_profile(rule, profiler, duration_ms, kind, target, path=""):
+    """Zapisuje profil (.prof + skrót) i usuwa najstarsze ponad limit."""
+    profiler.create_stats()
+    # Ten sam format co pstats.Stats.dump_stats(), ale bez pliku tymczasowego.
+    data = marshal.dumps(profiler.stats)
+
+    slug = re.sub(r"[^\w.-]+", "_", target)[:60]
+    profile = CapturedProfile(
+        rule=rule, kind=kind, target=target, path=path[:500],
+        duration_ms=int(duration_ms), summary=_summary(profiler),
+    )
+    profile.file.save(f"{timezone.now():%Y%m%d-%H%M%S}_{slug}.prof", ContentFile(data), save=False)
+    profile.save()
+    _rotate()
+    return profile
+
+
+def run_profiled(rule, kind, target, path, func, *args, **kwargs):
+    """Wykonuje func pod cProfile; zapisuje profil, jeśli trwało dłużej niż próg reguły."""
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= rule.threshold_ms:
+            save_profile(rule, profiler, duration_ms, kind, target, path)
+
+
+class ProfiledCommand(BaseCommand):
+    """
+    BaseCommand profilowany według reguł rodzaju "command" (nazwa komendy
+    = nazwa modułu). Komendy dziedziczą po nim zamiast po BaseCommand.
+    """
+
+    def execute(self, *args, **options):
+        name = self.__module__.rsplit(".", 1)[-1]
+        rule = match_rule("command", name)
+        if rule is None:
+            return super().execute(*args, **options)
+        return run_profiled(rule, "command", name, " ".join(sys.argv[2:]), super().execute, *args, **options)
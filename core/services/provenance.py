@@ -0,0 +1,158 @@
+# core/services/provenance.py
+"""
+Pochodzenie dopasowania transakcji (FinancialTransaction.provenance).
+
+Import i ponowne przetwarzanie zapisują zamiast długiego zdania w
+processing_log mały słownik kodów:
+
+- "t"  — wynik reguł tytułu: "P" dopasowano, "C" konflikt, "U" brak,
+- "tr" — pk dopasowanych reguł kategoryzacji (CategorizationRule),
+- "tb" — słowo kluczowe reguły wbudowanej,
+- "ai" — tytuł z AI: "AI" (Ollama) albo "ML" (lokalny klasyfikator);
+  przy "t" = "C" to rozstrzygnięcie konfliktu,
+- "ae" — powód, dla którego AI nie rozstrzygnęło wiersza,
+- "l"  — wynik przypisania lokalu: "P", "C", "U" albo "B" (koszt kamienicy),
+- "lx" — brak lokalu kamienicy dla transakcji kosztowej,
+- "lr" — pk dopasowanych reguł przypisania lokalu (LokalAssignmentRule),
+- "lt" — pk lokali znalezionych po numerze w tekście,
+- "lu" — pary [pk najemcy, pk lokalu] dopasowane po nazwisku,
+- "lc" — pk lokali-kandydatów przy konflikcie.
+
+Czytelny opis powstaje dopiero przy wyświetlaniu transakcji
+(attach_processing_details — jedno zapytanie na rodzaj obiektu dla całej
+strony), a matched_by_rule() odpowiada na pytanie „które transakcje
+dopasowała reguła X”.
+"""
+from django.db import connection
+
+from ..models import (
+    BUILDING_LOKAL_NUMBER,
+    CategorizationRule,
+    FinancialTransaction,
+    Lokal,
+    LokalAssignmentRule,
+    User,
+)
+
+RULE_KEYS = {CategorizationRule: "tr", LokalAssignmentRule: "lr"}
+AI_SOURCES = {"AI": "AI", "ML": "Klasyfikator lokalny"}
+
+
+def _lokal_name(refs, pk):
+    lokal = refs["lokals"].get(pk)
+    return f"Lokal {lokal.unit_number}" if lokal else f"lokal #{pk} (usunięty)"
+
+
+def _title_rule(refs, pk):
+    rule = refs["title_rules"].get(pk)
+    return f"'{rule.keywords}' -> {rule.get_title_display()}" if rule else f"reguła #{pk} (usunięta)"
+
+
+def _lokal_rule(refs, pk):
+    rule = refs["lokal_rules"].get(pk)
+    if rule is None:
+        return f"reguła #{pk} (usunięta)"
+    return f"'{rule.keywords}' -> {_lokal_name(refs, rule.lokal_id)}"
+
+
+def _describe_title(provenance, refs, title_display):
+    status = provenance.get("t", "U")
+    if provenance.get("tb"):
+        text = f"Dopasowano regułę wbudowaną dla '{provenance['tb']}'."
+    elif status == "P":
+        text = f"Dopasowano regułę: {', '.join(_title_rule(refs, pk) for pk in provenance.get('tr', []))}."
+    elif status == "C":
+        text = f"Konflikt reguł tytułu: {', '.join(_title_rule(refs, pk) for pk in provenance.get('tr', []))}."
+    else:
+        text = "Nie znaleziono pasującej reguły."
+
+    source = provenance.get("ai")
+    if not source:
+        return text
+    if provenance.get("ae"):
+        return f"[{source}] {provenance['ae']}"
+    label = f"[{source} FALLBACK]" if status == "C" else f"[{source}]"
+    return f"{label} {AI_SOURCES.get(source, source)}: {title_display or '?'}" + (
+        f" ({text})" if status == "C" else ""
+    )
+
+
+def _describe_lokal(provenance, refs):
+    status = provenance.get("l", "U")
+    if status == "B":
+        return f"Automatycznie przypisano do '{BUILDING_LOKAL_NUMBER}' (transakcja kosztowa)."
+    parts = []
+    if provenance.get("lx"):
+        parts.append(f"Nie znaleziono lokalu '{BUILDING_LOKAL_NUMBER}' dla transakcji kosztowej.")
+    if status == "C":
+        candidates = ", ".join(_lokal_name(refs, pk) for pk in provenance.get("lc", []))
+        parts.append(f"Konflikt: Znaleziono wiele pasujących lokali ({candidates}).")
+    parts.extend(f"Dopasowano regułę przypisania lokalu: {_lokal_rule(refs, pk)}." for pk in provenance.get("lr", []))
+    parts.extend(f"Dopasowano numer lokalu w tekście -> {_lokal_name(refs, pk)}." for pk in provenance.get("lt", []))
+    for user_pk, lokal_pk in provenance.get("lu", []):
+        user = refs["users"].get(user_pk)
+        name = f"{user.name} {user.lastname}" if user else f"najemca #{user_pk}"
+        parts.append(f"Dopasowano najemcę: '{name}' -> {_lokal_name(refs, lokal_pk)}.")
+    if status == "U":
+        parts.append("Nie znaleziono pasującego lokalu.")
+    return " ".join(parts)
+
+
+def describe(provenance, refs, title_display=None):
+    """Czytelny log dopasowania (w formacie dawnego processing_log)."""
+    return (
+        f"Kategoryzacja Tytułu: {_describe_title(provenance, refs, title_display)} | "
+        f"Przypisanie Lokalu: {_describe_lokal(provenance, refs)}"
+    )
+
+
+def load_refs(provenances):
+    """Reguły, lokale i najemcy wskazani w słownikach pochodzenia — jedno zapytanie na model."""
+    ids = {"title_rules": set(), "lokal_rules": set(), "lokals": set(), "users": set()}
+    for provenance in provenances:
+        ids["title_rules"].update(provenance.get("tr", []))
+        ids["lokal_rules"].update(provenance.get("lr", []))
+        ids["lokals"].update(provenance.get("lt", []))
+        ids["lokals"].update(provenance.get("lc", []))
+        for user_pk, lokal_pk in provenance.get("lu", []):
+            ids["users"].add(user_pk)
+            ids["lokals"].add(lokal_pk)
+    refs = {
+        "title_rules": CategorizationRule.objects.in_bulk(ids["title_rules"]),
+        "lokal_rules": LokalAssignmentRule.objects.in_bulk(ids["lokal_rules"]),
+        "users": User.objects.in_bulk(ids["users"]),
+    }
+    ids["lokals"].update(rule.lokal_id for rule in refs["lokal_rules"].values())
+    refs["lokals"] = Lokal.objects.in_bulk(ids["lokals"])
+    return refs
+
+
+def attach_processing_details(transactions):
+    """
+    Ustawia `processing_details` (czytelny log) na każdej transakcji z listy
+    (także StagedTransaction). Wiersze sprzed zapisu pochodzenia pokazują
+    swój tekstowy processing_log.
+    """
+    transactions = list(transactions)
+    refs = load_refs(ft.provenance for ft in transactions if ft.provenance)
+    for ft in transactions:
+        ft.processing_details = (
+            describe(ft.provenance, refs, ft.get_title_display()) if ft.provenance
+            else getattr(ft, "processing_log", None)
+        )
+    return transactions
+
+
+def matched_by_rule(rule, queryset=None):
+    """Transakcje, które dopasowała reguła kategoryzacji lub przypisania lokalu."""
+    queryset = FinancialTransaction.objects.all() if queryset is None else queryset
+    key = RULE_KEYS[type(rule)]
+    if connection.features.supports_json_field_contains:
+        # JSON_CONTAINS / @> — lista w provenance zawiera pk reguły.
+        return queryset.filter(provenance__contains={key: [rule.pk]})
+    # SQLite (testy, lokalny rozwój) nie ma JSON_CONTAINS — filtr w Pythonie.
+    pks = [
+        pk for pk, provenance in queryset.order_by().values_list("pk", "provenance").iterator()
+        if rule.pk in (provenance or {}).get(key, [])
+    ]
+    return queryset.filter(pk__in=pks)
@@ -0,0 +1,139 @@
+# core/services/report_cache.py
+"""
+Wersjonowany cache raportów oparty o framework cache Django.
+
+Raporty są czystymi funkcjami stanu bazy, więc wynik można bezpiecznie
+trzymać w cache pod kluczem (typ raportu, lokal/umowa, rok, wersja danych).
+Wersje danych to liczniki w tym samym cache, podbijane przez sygnały
+(core/signals.py) po zatwierdzeniu transakcji bazodanowej:
+
+- zakres "building" — dane wspólne dla całej kamienicy (odczyty liczników,
+  reguły opłat, rozliczenia wody), wpływające na raporty wszystkich lokali,
+- zakres "lokal:<id>" — dane jednego lokalu (umowy, harmonogram czynszu, wpłaty).
+
+Stare wpisy nie są kasowane — po podbiciu wersji po prostu przestają być
+odczytywane i wygasają po REPORT_CACHE_TIMEOUT.
+"""
+import hashlib
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .balances import get_arrears_summary
+from .reporting import (
+    get_annual_report_context,
+    get_bimonthly_report_context,
+    get_water_cost_table_data,
+)
+
+BUILDING_SCOPE = "building"
+KEY_PREFIX = "kamienica:report"
+
+
+def _cache():
+    return caches[getattr(settings, "REPORT_CACHE_ALIAS", "default")]
+
+
+def lokal_scope(lokal_id):
+    return f"lokal:{lokal_id}"
+
+
+def _version_key(scope):
+    return f"{KEY_PREFIX}:version:{scope}"
+
+
+def get_data_versions(scopes):
+    """Zwraca aktualne wersje danych dla podanych zakresów (jednym odczytem z cache)."""
+    keys = [_version_key(scope) for scope in scopes]
+    stored = _cache().get_many(keys)
+    return [stored.get(key, 0) for key in keys]
+
+
+def bump_data_version(scope):
+    """Podbija wersję danych zakresu, unieważniając wszystkie zależne raporty."""
+    cache = _cache()
+    key = _version_key(scope)
+    # add() jest no-op, gdy klucz istnieje; incr() na brakującym kluczu rzuca ValueError.
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def invalidate(*scopes):
+    """
+    Unieważnia raporty zależne od podanych zakresów.
+    Wersja jest podbijana od razu oraz ponownie po zatwierdzeniu transakcji —
+    inaczej równoległe żądanie mogłoby zapisać raport z danych sprzed commitu
+    pod już nową wersją. Zbędne podbicie po wycofanej transakcji jest nieszkodliwe.
+    """
+    for scope in dict.fromkeys(scopes):
+        bump_data_version(scope)
+        transaction.on_commit(lambda scope=scope: bump_data_version(scope))
+
+
+def cached_report(report_type, key_parts, scopes, compute):
+    """
+    Zwraca wynik compute() z cache lub oblicza go i zapisuje.
+    Klucz składa się z typu raportu, identyfikatorów (key_parts) i wersji
+    wszystkich zakresów danych, od których raport zależy.
+    """
+    versions = get_data_versions(scopes)
+    key = ":".join(
+        [KEY_PREFIX, report_type]
+        + [str(part) for part in key_parts]
+        + [f"v{'.'.join(str(v) for v in versions)}"]
+    )
+    cache = _cache()
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, timeout=getattr(settings, "REPORT_CACHE_TIMEOUT", None))
+    return result
+
+
+def get_cached_bimonthly_report_context(lokal, selected_year):
+    return dict(cached_report(
+        "bimonthly",
+        [lokal.pk, selected_year],
+        [BUILDING_SCOPE, lokal_scope(lokal.pk)],
+        lambda: get_bimonthly_report_context(lokal, selected_year),
+    ))
+
+
+def get_cached_annual_report_context(agreement, selected_year):
+    # Raport roczny zależy od bieżącej daty (miesiące do dziś), stąd dzień w kluczu.
+    return dict(cached_report(
+        "annual",
+        [agreement.pk, selected_year, date.today().isoformat()],
+        [BUILDING_SCOPE, lokal_scope(agreement.lokal_id)],
+        lambda: get_annual_report_context(agreement, selected_year, _cache={}),
+    ))
+
+
+def get_cached_water_cost_table_data(lokals, selected_year, include_all_lokals):
+    lokals = list(lokals)
+    lokal_ids = ",".join(str(lokal.pk) for lokal in lokals)
+    lokals_digest = hashlib.md5(lokal_ids.encode()).hexdigest()[:16]
+    return cached_report(
+        "water_cost_table",
+        [lokals_digest, selected_year, int(include_all_lokals)],
+        [BUILDING_SCOPE],
+        lambda: get_water_cost_table_data(lokals, selected_year, include_all_lokals),
+    )
+
+
+def get_cached_arrears_summary(agreements):
+    # Saldo zależy od naliczeń (dane kamienicy) i wpłat każdego lokalu z umową.
+    agreements = list(agreements)
+    agreement_ids = ",".join(str(ag.pk) for ag in agreements)
+    agreements_digest = hashlib.md5(agreement_ids.encode()).hexdigest()[:16]
+    return cached_report(
+        "arrears",
+        [agreements_digest, date.today().isoformat()],
+        [BUILDING_SCOPE] + sorted({lokal_scope(ag.lokal_id) for ag in agreements}),
+        lambda: get_arrears_summary(agreements),
+    )
@@ -3,7 +3,6 @@ from collections import defaultdict
 from datetime import date
 from decimal import Decimal
 from dateutil.relativedelta import relativedelta
-import datetime
 
 from ..models import (
     Agreement,
@@ -14,6 +13,7 @@ from ..models import (
     Meter,
     WaterCostOverride,
 )
+from .metrics import Stopwatch
 
 
 def _get_period_start(end_date):
@@ -30,6 +30,35 @@ def _get_period_start(end_date):
     return date(effective_date.year, period_start_month, 1)
 
 
+def get_building_water_consumptions(period_starts=None):
+    """
+    Zwraca zużycie wody wszystkich aktywnych lokali (bez "kamienicy")
+    w układzie {początek okresu: {lokal_id: zużycie}}.
+    Opcjonalny zbiór period_starts ogranicza wynik do wybranych okresów.
+    """
+    all_lokals_consumptions = defaultdict(lambda: defaultdict(Decimal))
+    all_active_lokals = Lokal.objects.filter(is_active=True).exclude(
+        unit_number__iexact=BUILDING_LOKAL_NUMBER
+    )
+    all_water_meters = Meter.objects.filter(
+        lokal__in=all_active_lokals,
+        type__in=["hot_water", "cold_water"],
+        status="aktywny",
+    ).select_related("lokal").prefetch_related("readings")
+
+    for meter in all_water_meters:
+        readings = sorted(meter.readings.all(), key=lambda r: r.reading_date)
+        for i in range(1, len(readings)):
+            start_reading, end_reading = readings[i - 1], readings[i]
+            period_key = _get_period_start(end_reading.reading_date)
+            if period_starts is not None and period_key not in period_starts:
+                continue
+            consumption = end_reading.value - start_reading.value
+            all_lokals_consumptions[period_key][meter.lokal_id] += consumption
+
+    return all_lokals_consumptions
+
+
 def get_bimonthly_report_context(lokal, selected_year):
     agreement = Agreement.objects.filter(lokal=lokal, is_active=True).first()
 
@@ -49,10 +78,10 @@ def get_bimonthly_report_context(lokal, selected_year):
 
     water_meters = Meter.objects.filter(
         lokal=lokal, type__in=["hot_water", "cold_water"], status="aktywny"
-    )
+    ).prefetch_related("readings")
 
     for meter in water_meters:
-        readings = list(meter.readings.all().order_by("reading_date"))
+        readings = sorted(meter.readings.all(), key=lambda r: r.reading_date)
         for i in range(1, len(readings)):
             start_reading, end_reading = readings[i - 1], readings[i]
             consumption = end_reading.value - start_reading.value
@@ -75,26 +104,7 @@ def get_bimonthly_report_context(lokal, selected_year):
             ] = end_reading
 
     # --- Pre-calculate consumptions for ALL lokals (for unit price calculation) ---
-    all_lokals_consumptions = defaultdict(lambda: defaultdict(Decimal))
-    all_active_lokals = Lokal.objects.filter(is_active=True).exclude(
-        unit_number__iexact=BUILDING_LOKAL_NUMBER
-    )
-    all_water_meters = Meter.objects.filter(
-        lokal__in=all_active_lokals,
-        type__in=["hot_water", "cold_water"],
-        status="aktywny",
-    ).select_related("lokal").prefetch_related("readings")
-
-    for meter in all_water_meters:
-        readings = list(meter.readings.all().order_by("reading_date"))
-        for i in range(1, len(readings)):
-            start_reading, end_reading = readings[i - 1], readings[i]
-            consumption = end_reading.value - start_reading.value
-
-            end_date = end_reading.reading_date
-            period_key = _get_period_start(end_date)
-
-            all_lokals_consumptions[period_key][meter.lokal_id] += consumption
+    all_lokals_consumptions = get_building_water_consumptions()
 
     # --- Assemble final report data for the selected year ---
     report_data = []
@@ -181,6 +191,10 @@ def get_bimonthly_report_context(lokal, selected_year):
 
 
 def get_annual_report_context(agreement, selected_year, _cache=None):
+    # Import lokalny: moduły charges i balances korzystają z funkcji pomocniczych tego modułu.
+    from .balances import get_closing_balance
+    from .charges import get_agreement_charges
+
     if _cache is None:
         _cache = {}
     if selected_year in _cache:
@@ -215,24 +229,22 @@ def get_annual_report_context(agreement, selected_year, _cache=None):
 
     year_start = date(selected_year, 1, 1)
     year_end = date(selected_year, 12, 31)
+    stopwatch = Stopwatch("annual_report")
 
     # --- CARRY-OVER BALANCE ---
     previous_year_balance = Decimal("0.00")
     previous_year_initial_balance = Decimal("0.00")
     if agreement.start_date and selected_year > agreement.start_date.year:
-        prev_year_context = get_annual_report_context(
-            agreement, selected_year - 1, _cache
-        )
-        previous_year_balance = prev_year_context.get("final_balance", Decimal("0.00"))
+        # Saldo zamknięcia grudnia z księgi sald zamiast rekurencji po latach.
+        previous_year_balance = get_closing_balance(agreement, date(selected_year - 1, 12, 1))
         previous_year_initial_balance = previous_year_balance
+    stopwatch.lap("carry_over")
+
+    # --- CHARGES (czynsz, śmieci, woda) z zaksięgowanych naliczeń miesięcznych ---
+    charges = get_agreement_charges(agreement, year_start, year_end)
 
-    # --- RENT SCHEDULE CALCULATION ---
     rent_schedule = []
     total_rent = Decimal("0.00")
-    rent_schedule_map = {
-        schedule.year_month: schedule
-        for schedule in agreement.rent_schedule.filter(year_month__year=selected_year)
-    }
     month_names = [
         "Styczeń",
         "Luty",
@@ -253,39 +265,11 @@ def get_annual_report_context(agreement, selected_year, _cache=None):
         limit_month = current_date.month
 
     for i, month_name in enumerate(month_names[:limit_month], 1):
-        current_month = date(selected_year, i, 1)
-        month_end = current_month + relativedelta(months=1, days=-1)
-        monthly_rent = Decimal("0.00")
-
-        agreement_starts_before_month_end = agreement.start_date <= month_end
-        agreement_ends_after_month_start = (
-            agreement.end_date is None or agreement.end_date >= current_month
-        )
-
-        if agreement_starts_before_month_end and agreement_ends_after_month_start:
-            month_start_date = date(selected_year, i, 1)
-            rent_schedule_entry = rent_schedule_map.get(month_start_date)
-            if rent_schedule_entry is not None:
-                monthly_rent = rent_schedule_entry.due_amount
-            else:
-                date_in_month = datetime.datetime(selected_year, i, 15)
-                historical_record = (
-                    agreement.history.filter(history_date__lte=date_in_month)
-                    .order_by("-history_date")
-                    .first()
-                )
-
-                if historical_record:
-                    monthly_rent = historical_record.rent_amount
-                elif agreement.start_date <= date_in_month.date():
-                    earliest_record = agreement.history.order_by("history_date").first()
-                    if earliest_record:
-                        monthly_rent = earliest_record.rent_amount
-                    else:
-                        monthly_rent = agreement.rent_amount
-
+        charge = charges.get(date(selected_year, i, 1))
+        monthly_rent = charge.rent if charge else Decimal("0.00")
         rent_schedule.append({"month_name": month_name, "rent": monthly_rent})
         total_rent += monthly_rent
+    stopwatch.lap("rent")
 
     # --- PAYMENTS ---
     payments = FinancialTransaction.objects.filter(
@@ -335,29 +319,9 @@ def get_annual_report_context(agreement, selected_year, _cache=None):
         )
 
     total_payments = running_total
+    stopwatch.lap("payments")
 
     # --- BIMONTHLY CALCULATIONS (Waste & Water) ---
-    all_lokals_consumptions = defaultdict(lambda: defaultdict(Decimal))
-    all_active_lokals = Lokal.objects.filter(is_active=True).exclude(
-        unit_number__iexact=BUILDING_LOKAL_NUMBER
-    )
-    all_water_meters = Meter.objects.filter(
-        lokal__in=all_active_lokals,
-        type__in=["hot_water", "cold_water"],
-        status="aktywny",
-    ).select_related("lokal").prefetch_related("readings")
-
-    for meter in all_water_meters:
-        readings = list(meter.readings.all().order_by("reading_date"))
-        for i in range(1, len(readings)):
-            start_reading, end_reading = readings[i - 1], readings[i]
-            end_date = end_reading.reading_date
-            period_key = _get_period_start(end_date)
-
-            if period_key.year == selected_year:
-                consumption = end_reading.value - start_reading.value
-                all_lokals_consumptions[period_key][meter.lokal_id] += consumption
-
     def agreement_covers_period(period_start, period_end):
         if agreement.start_date and period_end < agreement.start_date:
             return False
@@ -379,7 +343,8 @@ def get_annual_report_context(agreement, selected_year, _cache=None):
         period_start_date = date(selected_year, month_start_num, 1)
         period_end_date = period_start_date + relativedelta(months=2, days=-1)
 
-        if period_end_date > current_date:
+        # Bieżący okres też jest pokazywany: śmieci księgowane są co miesiąc.
+        if period_start_date > current_date:
             break
         if not agreement_covers_period(period_start_date, period_end_date):
             month_start_num += 2
@@ -400,9 +365,9 @@ def get_annual_report_context(agreement, selected_year, _cache=None):
 
     lokal_meters = Meter.objects.filter(
         lokal=lokal, type__in=["hot_water", "cold_water"], status="aktywny"
-    )
+    ).prefetch_related("readings")
     for meter in lokal_meters:
-        readings = list(meter.readings.all().order_by("reading_date"))
+        readings = sorted(meter.readings.all(), key=lambda r: r.reading_date)
         for i in range(1, len(readings)):
             start_r, end_r = readings[i - 1], readings[i]
             end_date = end_r.reading_date
@@ -425,44 +390,23 @@ def get_annual_report_context(agreement, selected_year, _cache=None):
                     )
                     break
 
+    stopwatch.lap("consumption")
+
     (
         total_water_cost_year,
         total_waste_cost_year,
         total_water_consumption_year,
     ) = (Decimal("0.00"), Decimal("0.00"), Decimal("0.00"))
     for period in bimonthly_data:
-        waste_rule = (
-            FixedCost.objects.filter(
-                category="waste",
-                calculation_method="per_person",
-                effective_date__lte=period["period_start"],
-            )
-            .order_by("-effective_date")
-            .first()
-        )
-        if waste_rule:
-            period["waste_cost"] = waste_rule.amount * agreement.number_of_occupants * 2
-
-        total_building_consumption = sum(
-            all_lokals_consumptions[period["period_start"]].values()
-        )
-        water_cost_override = WaterCostOverride.objects.filter(
-            period_start_date=period["period_start"]
-        ).first()
-        unit_price = Decimal("0.00")
-        if (
-            water_cost_override
-            and water_cost_override.overridden_bill_amount
-            and total_building_consumption > 0
-        ):
-            unit_price = (
-                water_cost_override.overridden_bill_amount / total_building_consumption
-            )
-
-        period["water_cost"] = period["water_consumption"] * unit_price
+        for month in (period["period_start"], period["period_start"] + relativedelta(months=1)):
+            charge = charges.get(month)
+            if charge:
+                period["waste_cost"] += charge.fixed_fees
+                period["water_cost"] += charge.water_cost
         total_waste_cost_year += period["waste_cost"]
         total_water_cost_year += period["water_cost"]
         total_water_consumption_year += period["water_consumption"]
+    stopwatch.lap("water")
 
     total_costs = total_rent + total_waste_cost_year + total_water_cost_year
     final_balance = total_payments - total_costs
@@ -486,4 +430,62 @@ def get_annual_report_context(agreement, selected_year, _cache=None):
         "agreement_initial_balance": agreement.initial_balance if initial_balance_year == selected_year else Decimal("0.00"),
     }
     _cache[selected_year] = context
-    return context
\ No newline at end of file
+    return context
+
+
+def get_water_cost_table_data(lokals, selected_year, include_all_lokals):
+    """
+    Buduje wiersze tabeli kosztów wody (od najnowszego okresu) dla podanych lokali.
+    Przy include_all_lokals=True suma zużycia w wierszu obejmuje wszystkie
+    liczniki z obliczeń, w przeciwnym razie tylko lokale z tabeli.
+    """
+    consumptions = defaultdict(lambda: defaultdict(Decimal))
+    all_water_meters = Meter.objects.filter(
+        lokal__in=lokals,
+        type__in=["hot_water", "cold_water"],
+        status="aktywny",
+    ).select_related("lokal").prefetch_related("readings")
+
+    for meter in all_water_meters:
+        readings = sorted(meter.readings.all(), key=lambda r: r.reading_date)
+        for i in range(1, len(readings)):
+            start_reading, end_reading = readings[i - 1], readings[i]
+            consumption = end_reading.value - start_reading.value
+            period_key = _get_period_start(end_reading.reading_date)
+            consumptions[period_key][meter.lokal_id] += consumption
+
+    period_names = [
+        "styczeń-luty", "marzec-kwiecień", "maj-czerwiec",
+        "lipiec-sierpień", "wrzesień-październik", "listopad-grudzień"
+    ]
+
+    table_data = []
+    month_start_num = 1
+    for name in period_names:
+        period_start_date = date(selected_year, month_start_num, 1)
+
+        override_obj = WaterCostOverride.objects.filter(period_start_date=period_start_date).first()
+        unit_price = Decimal("0.00")
+        total_period_consumption = sum(consumptions[period_start_date].values())
+        if override_obj and override_obj.overridden_bill_amount and total_period_consumption > 0:
+            unit_price = override_obj.overridden_bill_amount / total_period_consumption
+
+        row = {"report": {"name": f"{name} {selected_year}", "unit_price": unit_price}, "details": []}
+        total_row_cost = Decimal("0.00")
+
+        for lokal in lokals:
+            lokal_consumption = consumptions[period_start_date].get(lokal.id, Decimal("0.00"))
+            cost = lokal_consumption * unit_price
+            row["details"].append({"consumption": lokal_consumption, "cost": cost})
+            total_row_cost += cost
+
+        row["total_cost"] = total_row_cost
+        row["total_consumption"] = (
+            total_period_consumption if include_all_lokals
+            else sum(d["consumption"] for d in row["details"])
+        )
+        table_data.append(row)
+        month_start_num += 2
+
+    table_data.reverse()
+    return table_data
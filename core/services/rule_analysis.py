@@ -0,0 +1,345 @@
+# core/services/rule_analysis.py
+"""
+Analiza zestawu reguł kategoryzacji (CategorizationRule) i przypisania lokalu
+(LokalAssignmentRule).
+
+Wiersze CONFLICT — kosztowne, bo trafiają do AI albo do ręcznej kategoryzacji —
+biorą się z fraz, które pasują do tej samej transakcji, a prowadzą do różnych
+tytułów (lokali). Analiza kompiluje wszystkie frazy, dopasowuje je do
+historycznych transakcji (tak jak import: całe słowa, opis + kontrahent) i zgłasza:
+
+- conflict  — frazy różnych celów, z których jedna zawiera drugą jako całe
+  słowa (konflikt przy każdym dopasowaniu dłuższej) albo które pasowały
+  razem do transakcji z historii,
+- substring — fraza zawarta w innej wewnątrz słowa (np. "gaz" i "gazownia");
+  dziś bez konfliktu, ale o krok od niego,
+- duplicate — ta sama fraza w kilku regułach tego samego celu,
+- redundant — dłuższa fraza tego samego celu zawierająca krótszą
+  (krótsza i tak pasuje),
+- dead      — reguła, której żadna fraza nie pasuje do żadnej transakcji.
+
+Reguły przypisania lokalu są analizowane tylko na wpływach — koszty import
+przypisuje do kamienicy, zanim sprawdzi reguły.
+"""
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import CategorizationRule, FinancialTransaction, LokalAssignmentRule
+from .rule_suggestions import TextIndex
+
+FINDING_KINDS = ('conflict', 'substring', 'duplicate', 'redundant', 'dead')
+FINDING_LABELS = {
+    'conflict': 'Konflikty',
+    'substring': 'Podciągi',
+    'duplicate': 'Duplikaty',
+    'redundant': 'Nadmiarowe frazy',
+    'dead': 'Martwe reguły',
+}
+
+
+@dataclass(eq=False)
+class Phrase:
+    rule_kind: str  # 'title' / 'lokal'
+    rule: object
+    text: str
+    target: object  # kod tytułu / lokal
+    rows: set = field(default_factory=set)
+
+    @property
+    def key(self):
+        """Identyfikator reguły w formularzach: 'title:<pk>' / 'lokal:<pk>'."""
+        return f"{self.rule_kind}:{self.rule.pk}"
+
+    @property
+    def target_display(self):
+        if self.rule_kind == 'title':
+            return self.rule.get_title_display()
+        return f"Lokal {self.target.unit_number}"
+
+
+@dataclass
+class Finding:
+    kind: str
+    rule_kind: str
+    phrases: tuple
+    affected: int = 0
+    structural: bool = False  # konflikt wynika z samych fraz (zawieranie), nie tylko z historii
+
+    @property
+    def kind_display(self):
+        return FINDING_LABELS[self.kind]
+
+    @property
+    def rules(self):
+        return list({id(p.rule): p.rule for p in self.phrases}.values())
+
+    @property
+    def message(self):
+        first, *rest = self.phrases
+        if self.kind == 'dead':
+            return f"Reguła '{first.rule.keywords}' nie pasuje do żadnej transakcji w historii."
+        second = rest[0]
+        if self.kind == 'conflict':
+            reason = "zawiera frazę" if self.structural else "pasuje razem z"
+            return (
+                f"'{second.text}' ({second.target_display}) {reason} "
+                f"'{first.text}' ({first.target_display})."
+            )
+        if self.kind == 'substring':
+            return (
+                f"'{first.text}' ({first.target_display}) występuje wewnątrz słowa w "
+                f"'{second.text}' ({second.target_display})."
+            )
+        if self.kind == 'duplicate':
+            return f"Fraza '{first.text}' powtarza się w {len(self.rules)} regułach ({first.target_display})."
+        return (
+            f"'{second.text}' jest nadmiarowa — zawiera frazę '{first.text}' "
+            f"tego samego celu ({first.target_display})."
+        )
+
+
+@dataclass
+class RuleAnalysis:
+    title_rules: int
+    lokal_rules: int
+    phrases: int
+    ledger_size: int
+    findings: list
+    seconds: float
+
+    def counts(self):
+        counts = dict.fromkeys(FINDING_KINDS, 0)
+        for finding in self.findings:
+            counts[finding.kind] += 1
+        return counts
+
+    @property
+    def conflict_rows(self):
+        rows = set()
+        for finding in self.findings:
+            if finding.kind == 'conflict':
+                first, second = finding.phrases
+                rows |= first.rows & second.rows
+        return len(rows)
+
+
+def compile_phrases(title_rules, lokal_rules):
+    """Frazy reguł w postaci, w jakiej dopasowuje je import (małe litery)."""
+    phrases = []
+    for rule in title_rules:
+        for text in dict.fromkeys(p.strip().lower() for p in rule.keywords.split(",") if p.strip()):
+            phrases.append(Phrase('title', rule, text, rule.title))
+    for rule in lokal_rules:
+        # match_lokal_for_transaction() traktuje całe pole keywords jako jedną frazę.
+        phrases.append(Phrase('lokal', rule, rule.keywords.lower(), rule.lokal))
+    return phrases
+
+
+def _contains(short, long):
+    """'word' gdy short występuje w long jako całe słowa, 'substring' gdy tylko wewnątrz słowa."""
+    if short == long or short not in long:
+        return None
+    return 'word' if re.search(r"(?<!\w)" + re.escape(short) + r"(?!\w)", long) else 'substring'
+
+
+def _pairwise(phrases, findings):
+    by_text = defaultdict(list)
+    for phrase in phrases:
+        by_text[phrase.text].append(phrase)
+
+    for text, same in by_text.items():
+        targets = defaultdict(list)
+        for phrase in same:
+            targets[phrase.target].append(phrase)
+        for group in targets.values():
+            if len(group) > 1:
+                findings.append(Finding('duplicate', group[0].rule_kind, tuple(group), len(group[0].rows)))
+        groups = list(targets.values())
+        for i, first in enumerate(groups):
+            for second in groups[i + 1:]:
+                findings.append(Finding(
+                    'conflict', first[0].rule_kind, (first[0], second[0]), len(first[0].rows), structural=True,
+                ))
+
+    reported = set()
+    texts = sorted(by_text, key=len)
+    for i, short in enumerate(texts):
+        for long in texts[i + 1:]:
+            relation = _contains(short, long)
+            if relation is None:
+                continue
+            for a in by_text[short]:
+                for b in by_text[long]:
+                    affected = len(a.rows & b.rows)
+                    if a.target == b.target:
+                        if relation == 'word':
+                            findings.append(Finding('redundant', a.rule_kind, (a, b), len(b.rows)))
+                    elif relation == 'word':
+                        reported.add((id(a), id(b)))
+                        findings.append(Finding('conflict', a.rule_kind, (a, b), affected, structural=True))
+                    else:
+                        findings.append(Finding('substring', a.rule_kind, (a, b), affected))
+
+    # Konflikty widoczne tylko w historii: frazy różnych celów pasujące do tej samej transakcji.
+    firing = defaultdict(list)
+    for phrase in phrases:
+        for row in phrase.rows:
+            firing[row].append(phrase)
+    pairs = {}
+    for row_phrases in firing.values():
+        if len({p.target for p in row_phrases}) < 2:
+            continue
+        for i, a in enumerate(row_phrases):
+            for b in row_phrases[i + 1:]:
+                if a.target == b.target or a.text == b.text:
+                    continue
+                if (id(a), id(b)) in reported or (id(b), id(a)) in reported:
+                    continue
+                pairs[(id(a), id(b))] = (a, b)
+    for a, b in pairs.values():
+        findings.append(Finding('conflict', a.rule_kind, (a, b), len(a.rows & b.rows)))
+
+
+def analyze_rules(transactions=None):
+    """
+    Pełna analiza reguł na tle historii (domyślnie wszystkich transakcji).
+    Zwraca RuleAnalysis z listą Finding posortowaną od najbardziej kosztownych.
+    """
+    started = time.perf_counter()
+    if transactions is None:
+        transactions = FinancialTransaction.objects.all()
+    ledger = list(transactions.values_list("description", "contractor", "amount"))
+    index = TextIndex([f"{description or ''} {contractor or ''}".lower() for description, contractor, _ in ledger])
+    income = {i for i, (_, _, amount) in enumerate(ledger) if amount is not None and amount >= 0}
+
+    title_rules = list(CategorizationRule.objects.order_by('pk'))
+    lokal_rules = list(LokalAssignmentRule.objects.select_related('lokal').order_by('pk'))
+    phrases = compile_phrases(title_rules, lokal_rules)
+    for phrase in phrases:
+        phrase.rows = set(index.matching(phrase.text))
+        if phrase.rule_kind == 'lokal':
+            phrase.rows &= income
+
+    findings = []
+    for rule_kind in ('title', 'lokal'):
+        _pairwise([p for p in phrases if p.rule_kind == rule_kind], findings)
+
+    by_rule = defaultdict(list)
+    for phrase in phrases:
+        by_rule[(phrase.rule_kind, phrase.rule.pk)].append(phrase)
+    for (rule_kind, _), rule_phrases in by_rule.items():
+        if not any(p.rows for p in rule_phrases):
+            findings.append(Finding('dead', rule_kind, (rule_phrases[0],)))
+
+    findings.sort(key=lambda f: (FINDING_KINDS.index(f.kind), -f.affected, f.phrases[0].text))
+    return RuleAnalysis(
+        title_rules=len(title_rules),
+        lokal_rules=len(lokal_rules),
+        phrases=len(phrases),
+        ledger_size=len(ledger),
+        findings=findings,
+        seconds=round(time.perf_counter() - started, 3),
+    )
+
+
+def delete_rules(title_rule_ids=(), lokal_rule_ids=()):
+    """Usuwa wskazane reguły; zwraca liczbę usuniętych."""
+    with transaction.atomic():
+        deleted, _ = CategorizationRule.objects.filter(pk__in=title_rule_ids).delete()
+        deleted_lokal, _ = LokalAssignmentRule.objects.filter(pk__in=lokal_rule_ids).delete()
+    return deleted + deleted_lokal
+
+
+def merge_rules(title_rule_ids):
+    """
+    Scala reguły kategoryzacji o tym samym tytule w jedną (pierwszą), łącząc
+    frazy bez powtórzeń. Zwraca scaloną regułę; ValueError przy różnych
+    tytułach lub zbyt długiej liście fraz.
+    """
+    rules = list(CategorizationRule.objects.filter(pk__in=title_rule_ids).order_by('pk'))
+    if len(rules) < 2:
+        raise ValueError("Do scalenia potrzebne są co najmniej dwie reguły kategoryzacji.")
+    if len({rule.title for rule in rules}) > 1:
+        raise ValueError("Można scalać tylko reguły prowadzące do tego samego tytułu.")
+    phrases = dict.fromkeys(
+        p.strip() for rule in rules for p in rule.keywords.split(",") if p.strip()
+    )
+    unique = {}
+    for phrase in phrases:
+        unique.setdefault(phrase.lower(), phrase)
+    keywords = ", ".join(unique.values())
+    max_length = CategorizationRule._meta.get_field('keywords').max_length
+    if len(keywords) > max_length:
+        raise ValueError(f"Scalone słowa kluczowe przekraczają {max_length} znaków.")
+    target, *others = rules
+    with transaction.atomic():
+        target.keywords = keywords
+        target.save(update_fields=['keywords'])
+        CategorizationRule.objects.filter(pk__in=[rule.pk for rule in others]).delete()
+    return target
+
+
+def drop_phrase(rule, phrase):
+    """
+    Usuwa frazę z reguły kategoryzacji (regułę bez fraz — w całości).
+    Reguła przypisania lokalu ma jedną frazę, więc jest usuwana. Zwraca True,
+    gdy reguła została usunięta.
+    """
+    if rule.pk is None:  # usunięta wcześniej w tej samej operacji zbiorczej
+        return True
+    if isinstance(rule, LokalAssignmentRule):
+        rule.delete()
+        return True
+    remaining = [p.strip() for p in rule.keywords.split(",") if p.strip() and p.strip().lower() != phrase.lower()]
+    if not remaining:
+        rule.delete()
+        return True
+    rule.keywords = ", ".join(remaining)
+    rule.save(update_fields=['keywords'])
+    return False
+
+
+def resolve_rule(key):
+    """Reguła dla identyfikatora 'title:<pk>' / 'lokal:<pk>' albo None."""
+    kind, _, pk = key.partition(":")
+    model = {'title': CategorizationRule, 'lokal': LokalAssignmentRule}.get(kind)
+    if model is None or not pk.isdigit():
+        return None
+    return model.objects.filter(pk=pk).first()
+
+
+def split_rule_keys(keys):
+    """Rozdziela identyfikatory reguł na (pk reguł kategoryzacji, pk reguł lokalu)."""
+    title_ids, lokal_ids = [], []
+    for key in keys:
+        kind, _, pk = key.partition(":")
+        if pk.isdigit():
+            {'title': title_ids, 'lokal': lokal_ids}.get(kind, []).append(int(pk))
+    return title_ids, lokal_ids
+
+
+def stale_rule_filter(days=None, now=None):
+    """
+    Warunek na reguły nieaktualne: bez dopasowania od RULE_STALE_DAYS dni
+    (reguły nigdy nie dopasowane — licząc od utworzenia).
+    """
+    days = days if days is not None else getattr(settings, 'RULE_STALE_DAYS', 365)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return Q(last_hit_at__lt=cutoff) | Q(last_hit_at__isnull=True, created_at__lt=cutoff)
+
+
+def prune_stale_rules(days=None):
+    """Usuwa nieaktualne reguły obu rodzajów; zwraca (usunięte kategoryzacji, usunięte lokalu)."""
+    condition = stale_rule_filter(days)
+    with transaction.atomic():
+        deleted_title, _ = CategorizationRule.objects.filter(condition).delete()
+        deleted_lokal, _ = LokalAssignmentRule.objects.filter(condition).delete()
+    return deleted_title, deleted_lokal
@@ -0,0 +1,180 @@
+# core/services/rule_suggestions.py
+"""
+Sugestie reguł kategoryzacji z powtarzalnych decyzji AI.
+
+Każda odpowiedź Ollamy z importu trafia do dziennika AIDecision. Jeśli model
+wielokrotnie przypisuje ten sam tytuł transakcjom tego samego kontrahenta
+(albo z tym samym charakterystycznym słowem w opisie), zamiana tego wzorca
+na CategorizationRule przenosi ruch ze ścieżki AI (sekundy) na reguły
+(mikrosekundy).
+
+Kandydatem na słowa kluczowe jest:
+- klucz kontrahenta zapisany w dzienniku (AIDecision.contractor_key, początek
+  nazwy do trzech słów, bez form prawnych) — grupowanie po zaindeksowanej
+  kolumnie, kandydatami są tylko klucze z co najmniej RULE_SUGGESTION_MIN_COUNT
+  decyzjami,
+- pojedyncze słowo opisu (min. 4 litery, bez słów pospolitych i nazw miesięcy).
+
+Kandydat zostaje zaproponowany, gdy pasuje do co najmniej
+RULE_SUGGESTION_MIN_COUNT decyzji, a najczęstszy tytuł stanowi co najmniej
+RULE_SUGGESTION_MIN_AGREEMENT z nich, nie przeczy mu żadna transakcja
+zweryfikowana ręcznie i nie ma jeszcze reguły z takim słowem kluczowym.
+Automatycznie po imporcie (RULE_SUGGESTION_AUTO_CREATE) tworzone są tylko
+sugestie ze słowem kluczowym o długości co najmniej
+RULE_SUGGESTION_AUTO_MIN_LENGTH znaków (auto_create_suggestions).
+"""
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import Count
+
+from ..models import AIDecision, CategorizationRule, FinancialTransaction
+from .categorizer import training_queryset
+
+# Formy prawne i skróty adresowe — kończą klucz kontrahenta.
+LEGAL_WORDS = {"sp", "z", "o", "oo", "sa", "sc", "spółka", "spolka", "ul", "al", "os", "pl"}
+DESCRIPTION_STOPWORDS = {
+    "przelew", "faktura", "fakturę", "fakture", "opłata", "oplata", "płatność", "platnosc", "zapłata",
+    "zaplata", "usługa", "usluga", "usługi", "uslugi", "numer", "tytułem", "tytulem", "środków", "srodkow",
+    "okres", "miesiąc", "miesiac", "rachunek", "rachunku", "zgodnie", "umowy", "umowa",
+    # Nazwy miesięcy występują w opisach wpłat każdego rodzaju.
+    "styczeń", "styczen", "stycznia", "luty", "lutego", "marzec", "marca", "kwiecień", "kwiecien",
+    "kwietnia", "maja", "czerwiec", "czerwca", "lipiec", "lipca", "sierpień", "sierpien", "sierpnia",
+    "wrzesień", "wrzesien", "września", "wrzesnia", "październik", "pazdziernik", "października",
+    "pazdziernika", "listopad", "listopada", "grudzień", "grudzien", "grudnia",
+}
+_LETTERS = re.compile(r"^[^\W\d_]+$")
+_WORD = re.compile(r"[^\W\d_]{4,}")
+
+
+@dataclass
+class RuleSuggestion:
+    keywords: str
+    title: str
+    support: int
+    agreement: float
+    source: str  # 'kontrahent' / 'opis'
+
+    @property
+    def title_display(self):
+        return dict(FinancialTransaction.TITLE_CHOICES).get(self.title, self.title)
+
+
+def contractor_key(contractor):
+    """Początkowe słowa nazwy kontrahenta (tylko litery, do 3, do pierwszej formy prawnej/adresu)."""
+    words = []
+    for token in (contractor or "").lower().split():
+        if not _LETTERS.match(token) or token in LEGAL_WORDS:
+            break
+        words.append(token)
+        if len(words) == 3:
+            break
+    return " ".join(words)
+
+
+def _pattern(phrase):
+    # To samo dopasowanie całych słów co w get_title_from_description().
+    return re.compile(r"(?<!\w)" + re.escape(phrase) + r"(?!\w)")
+
+
+class TextIndex:
+    """
+    Odwrócony indeks słów -> numery tekstów, żeby nie sprawdzać regexem każdego
+    tekstu. Dopasowanie jak w get_title_from_description() (całe słowa).
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.words = defaultdict(set)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text):
+                self.words[word].add(i)
+
+    def matching(self, phrase):
+        words = re.findall(r"\w+", phrase)
+        if words:
+            candidates = set.intersection(*(self.words.get(w, set()) for w in words))
+        else:
+            candidates = range(len(self.texts))
+        pattern = _pattern(phrase)
+        return [i for i in candidates if pattern.search(self.texts[i])]
+
+
+def suggest_rules(decisions=None, min_count=None, min_agreement=None):
+    """
+    Lista RuleSuggestion (od najczęściej potwierdzonych) dla decyzji AI
+    (domyślnie całego dziennika).
+    """
+    min_count = min_count or getattr(settings, "RULE_SUGGESTION_MIN_COUNT", 3)
+    min_agreement = min_agreement if min_agreement is not None else getattr(settings, "RULE_SUGGESTION_MIN_AGREEMENT", 0.9)
+    if decisions is None:
+        decisions = AIDecision.objects.all()
+    rows = list(decisions.values_list("description", "contractor", "title"))
+    texts = [f"{description} {contractor}".lower() for description, contractor, _ in rows]
+    index = TextIndex(texts)
+
+    candidates = {
+        key: "kontrahent"
+        for key in decisions.exclude(contractor_key="")
+        .order_by()
+        .values("contractor_key")
+        .annotate(support=Count("id"))
+        .filter(support__gte=min_count)
+        .values_list("contractor_key", flat=True)
+    }
+    for description, _, _ in rows:
+        for word in _WORD.findall(description.lower()):
+            if word not in DESCRIPTION_STOPWORDS:
+                candidates.setdefault(word, "opis")
+
+    existing_phrases = {
+        phrase.strip().lower()
+        for rule in CategorizationRule.objects.all()
+        for phrase in rule.keywords.split(",") if phrase.strip()
+    }
+    verified = list(training_queryset().values_list("description", "contractor", "title"))
+    verified_index = TextIndex([f"{d} {c or ''}".lower() for d, c, _ in verified])
+
+    suggestions = []
+    covered = []
+    # Najpierw kontrahenci (dokładniejsze), potem słowa opisu.
+    for phrase, source in sorted(candidates.items(), key=lambda item: (item[1] != "kontrahent", item[0])):
+        if phrase in existing_phrases:
+            continue
+        matched = index.matching(phrase)
+        if len(matched) < min_count:
+            continue
+        titles = Counter(rows[i][2] for i in matched)
+        title, count = titles.most_common(1)[0]
+        agreement = count / len(matched)
+        if title is None or agreement < min_agreement:
+            continue
+        if any(verified[i][2] != title for i in verified_index.matching(phrase)):
+            continue
+        matched = set(matched)
+        # Słowo opisu, które nie wnosi nic ponad już zaproponowanego kontrahenta, pomijamy.
+        if any(matched <= other and other_title == title for other, other_title in covered):
+            continue
+        covered.append((matched, title))
+        suggestions.append(RuleSuggestion(phrase, title, len(matched), round(agreement, 3), source))
+    return sorted(suggestions, key=lambda s: (-s.support, s.keywords))
+
+
+def auto_create_suggestions(suggestions, min_length=None):
+    """
+    Sugestie, które wolno utworzyć bez przeglądu (po imporcie): słowo kluczowe
+    ma co najmniej RULE_SUGGESTION_AUTO_MIN_LENGTH znaków. Krótsze, pospolite
+    słowa trafiają tylko do przeglądu (komenda suggest_rules, panel admina).
+    """
+    min_length = min_length or getattr(settings, "RULE_SUGGESTION_AUTO_MIN_LENGTH", 6)
+    return [s for s in suggestions if len(s.keywords) >= min_length]
+
+
+def create_rules(suggestions):
+    """Zapisuje sugestie jako CategorizationRule; zwraca liczbę utworzonych reguł."""
+    rules = CategorizationRule.objects.bulk_create(
+        CategorizationRule(keywords=s.keywords, title=s.title) for s in suggestions
+    )
+    return len(rules)
@@ -0,0 +1,158 @@
+# core/services/splits.py
+"""
+Podział wpłaty na kilka lokali i jego cofanie.
+
+Część wydzielona wskazuje transakcję, z której ją wydzielono (parent), a cała
+rodzina podziału — również podziału zagnieżdżonego — ma wspólny split_group
+równy pk transakcji źródłowej. Rodzic, dzieci i cała rodzina to zapytania
+po indeksie (równość), a nie skan prefiksu transaction_id. Identyfikatory
+części ("<id>_split", "<id>_split_2", ...) pozostają tylko etykietą.
+
+Podział na N części to jeden INSERT (bulk_create) i jeden UPDATE kwoty
+transakcji źródłowej; scalenie to jeden odczyt rodziny, jeden UPDATE i jeden
+DELETE. Zapisy zbiorcze nie wysyłają sygnałów post_save, więc salda i cache
+raportów lokali oznacza mark_transactions_changed().
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from ..models import FinancialTransaction
+from .balances import mark_transactions_changed
+from .duplicates import transaction_fingerprint
+
+
+def _part_ids(ft, count):
+    """Wolne identyfikatory dla `count` nowych części (None, gdy transakcja nie ma ID)."""
+    if not ft.transaction_id:
+        return [None] * count
+    taken = set()
+    if ft.split_group is not None:
+        taken = set(
+            FinancialTransaction.objects.filter(split_group=ft.split_group).values_list("transaction_id", flat=True)
+        )
+    ids = []
+    n = 1
+    while len(ids) < count:
+        candidate = f"{ft.transaction_id}_split" if n == 1 else f"{ft.transaction_id}_split_{n}"
+        if candidate not in taken:
+            ids.append(candidate)
+        n += 1
+    return ids
+
+
+def split_transaction(ft, parts):
+    """
+    Wydziela z transakcji części; parts to lista (kwota, lokal_id, tytuł albo None).
+    Kwota transakcji źródłowej maleje o sumę części (instancja `ft` też jest
+    aktualizowana). Części są oznaczane jako MANUALLY_EDITED — import
+    i ponowne przetwarzanie ich nie nadpiszą. Zwraca listę utworzonych części.
+    """
+    parts = [(Decimal(amount), lokal_id, title) for amount, lokal_id, title in parts]
+    if not parts:
+        raise ValueError("Podaj co najmniej jedną część do wydzielenia.")
+    group = ft.split_group if ft.split_group is not None else ft.pk
+    description = f"{ft.description} (część wydzielona)"
+    with transaction.atomic():
+        children = FinancialTransaction.objects.bulk_create([
+            FinancialTransaction(
+                parent=ft,
+                split_group=group,
+                transaction_id=transaction_id,
+                posting_date=ft.posting_date,
+                amount=amount,
+                description=description,
+                contractor=ft.contractor,
+                title=title or ft.title,
+                lokal_id=lokal_id,
+                status='MANUALLY_EDITED',
+                fingerprint=transaction_fingerprint(ft.posting_date, amount, description, ft.contractor),
+            )
+            for (amount, lokal_id, title), transaction_id in zip(parts, _part_ids(ft, len(parts)))
+        ])
+        ft.amount -= sum(amount for amount, _, _ in parts)
+        ft.split_group = group
+        FinancialTransaction.objects.filter(pk=ft.pk).update(amount=ft.amount, split_group=group)
+    mark_transactions_changed(
+        [(ft.lokal_id, ft.posting_date)] + [(child.lokal_id, child.posting_date) for child in children]
+    )
+    return children
+
+
+def _descendants(ft):
+    """pk i kwoty wszystkich części wydzielonych z `ft` (także pośrednio) — jedno zapytanie po split_group."""
+    if ft.split_group is None:
+        return {}
+    family = list(
+        FinancialTransaction.objects.filter(split_group=ft.split_group).values_list("pk", "parent_id", "amount")
+    )
+    children = {}
+    for pk, parent_id, amount in family:
+        children.setdefault(parent_id, []).append((pk, amount))
+    found = {}
+    stack = [ft.pk]
+    while stack:
+        for pk, amount in children.get(stack.pop(), []):
+            found[pk] = amount
+            stack.append(pk)
+    return found
+
+
+def _delete_parts(pks):
+    """
+    Usuwa podane transakcje. parent ma on_delete=PROTECT, więc powiązania
+    wewnątrz usuwanego zbioru są najpierw zrywane.
+    """
+    FinancialTransaction.objects.filter(pk__in=pks, parent__isnull=False).update(parent=None)
+    FinancialTransaction.objects.filter(pk__in=pks).delete()
+
+
+def _fold_into(target, removed_pks, total):
+    """Dolicza kwotę usuwanych części do `target` i usuwa je (UPDATE + DELETE)."""
+    with transaction.atomic():
+        FinancialTransaction.objects.filter(pk=target.pk).update(amount=F("amount") + total)
+        _delete_parts(removed_pks)
+        # Transakcja źródłowa bez części przestaje tworzyć grupę podziału.
+        if target.parent_id is None and not FinancialTransaction.objects.filter(parent=target).exists():
+            FinancialTransaction.objects.filter(pk=target.pk).update(split_group=None)
+            target.split_group = None
+    target.amount += total
+    mark_transactions_changed([(target.lokal_id, target.posting_date)])
+
+
+def merge_split(ft):
+    """
+    Scala z powrotem do `ft` wszystkie wydzielone z niej części (również
+    zagnieżdżone). Zwraca (liczba scalonych części, przywrócona kwota).
+    """
+    descendants = _descendants(ft)
+    total = sum(descendants.values(), Decimal("0.00"))
+    if descendants:
+        _fold_into(ft, list(descendants), total)
+    return len(descendants), total
+
+
+def delete_split_family(ft):
+    """
+    Usuwa transakcję razem ze wszystkimi wydzielonymi z niej częściami
+    (również zagnieżdżonymi). Zwraca liczbę usuniętych części.
+    """
+    descendants = _descendants(ft)
+    with transaction.atomic():
+        _delete_parts([ft.pk, *descendants])
+    return len(descendants)
+
+
+def undo_split(part):
+    """
+    Cofa wydzielenie części: jej kwota (razem z częściami wydzielonymi z niej)
+    wraca do transakcji, z której ją wydzielono. Zwraca transakcję nadrzędną.
+    """
+    if part.parent_id is None:
+        raise ValueError("Ta transakcja nie jest wydzieloną częścią.")
+    parent = FinancialTransaction.objects.get(pk=part.parent_id)
+    subtree = _descendants(part)
+    subtree[part.pk] = part.amount
+    _fold_into(parent, list(subtree), sum(subtree.values(), Decimal("0.00")))
+    return parent
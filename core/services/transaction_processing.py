@@ -3,13 +3,18 @@
 import csv
 import io
 import datetime
+import hashlib
 import re
-from collections import defaultdict
+import time
+from collections import Counter, defaultdict
 from decimal import Decimal, InvalidOperation
-from django.db import transaction
-from django.db.models import Q
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from ..models import (
     BUILDING_LOKAL_NUMBER,
+    AIDecision,
     FinancialTransaction,
     CategorizationRule,
     LokalAssignmentRule,
@@ -17,7 +22,12 @@ from ..models import (
     User,
     Agreement,
 )
-from .ai_categorization import categorize_with_ai, test_ollama_connection
+from . import metrics
+from .ai_categorization import OllamaClient, categorize_with_ai
+from .balances import mark_transactions_changed
+from .categorizer import classify, load_model as load_categorizer
+from .duplicates import record_candidates, transaction_fingerprint
+from .rule_suggestions import auto_create_suggestions, contractor_key, create_rules, suggest_rules
 
 AI_MODES = [
     'rule_only',
@@ -34,24 +44,79 @@ def _should_use_ai(title_status, ai_mode):
     return False
 
 
-def get_title_from_description(description, contractor="", categorization_rules=None, ai_mode='rule_only'):
+def apply_ai_result(title_status, rule_provenance, ai_result, source="AI"):
+    """
+    Łączy wynik reguł (CONFLICT/UNPROCESSED) z odpowiedzią AI (lub lokalnego
+    klasyfikatora, source="ML") w (tytuł, status, pochodzenie) — wspólne dla
+    wywołań pojedynczych i wsadowych. Pochodzenie to słownik kodów
+    (patrz core/services/provenance.py); tekst błędu AI trafia do niego
+    tylko, gdy AI nie rozstrzygnęło wiersza bez konfliktu.
+    """
+    ai_title, ai_status, ai_log = ai_result
+    provenance = dict(rule_provenance or {"t": "U"})
+    if ai_title:
+        return ai_title, "PROCESSED", {**provenance, "ai": source}
+    if title_status == 'CONFLICT':
+        return None, "CONFLICT", provenance
+    return None, "UNPROCESSED", {**provenance, "ai": source, "ae": ai_log}
+
+
+class RuleHits:
+    """
+    Liczniki dopasowań reguł (pk -> liczba) zbierane w pamięci podczas importu
+    lub ponownego przetwarzania i zapisywane zbiorczo przez flush() — kilka
+    zapytań UPDATE na koniec zamiast zapisu przy każdym wierszu.
+    """
+
+    def __init__(self):
+        self.title = Counter()
+        self.lokal = Counter()
+
+    def flush(self, now=None):
+        now = now or timezone.now()
+        for model, counter in ((CategorizationRule, self.title), (LokalAssignmentRule, self.lokal)):
+            by_count = defaultdict(list)
+            for pk, count in counter.items():
+                by_count[count].append(pk)
+            for count, pks in by_count.items():
+                model.objects.filter(pk__in=pks).update(hit_count=F('hit_count') + count, last_hit_at=now)
+            counter.clear()
+
+    def add_provenance(self, provenance):
+        """Dolicza reguły zapisane w pochodzeniu wiersza (kody "tr" i "lr")."""
+        self.title.update((provenance or {}).get("tr", []))
+        self.lokal.update((provenance or {}).get("lr", []))
+
+
+def _early_exit():
+    return getattr(settings, 'RULE_MATCH_EARLY_EXIT', True)
+
+
+def get_title_from_description(description, contractor="", categorization_rules=None, ai_mode='rule_only', ai_client=None,
+                               hits=None):
     """
     Kategoryzuje transakcję na podstawie opisu i kontrahenta.
     Opcjonalny parametr `categorization_rules` pozwala przekazać wstępnie pobrane
     reguły (list), eliminując zapytanie do bazy przy przetwarzaniu wsadowym.
-    
+    Sprawdzane są wszystkie reguły, także po dwóch sprzecznych dopasowaniach:
+    wynik to wtedy CONFLICT, ale każda pasująca reguła trafia do `hits`
+    i do pochodzenia ("tr") — inaczej reguła za dwiema sprzecznymi nie miałaby
+    nigdy dopasowań i wyglądałaby na martwą.
+
     Args:
         description: Opis transakcji
         contractor: Kontrahent
         categorization_rules: Wstępnie pobrane reguły
         ai_mode: AI categorization mode: rule_only, conflict_only, or conflict_and_unprocessed
+        ai_client: OllamaClient importu (bezpiecznik, budżet czasu); bez niego pojedyncze wywołanie AI
+        hits: Counter (pk reguły -> dopasowania), np. RuleHits.title
     """
+    categorize = ai_client.categorize if ai_client is not None else categorize_with_ai
     search_text = (description + " " + (contractor or "")).lower()
     if categorization_rules is None:
         categorization_rules = CategorizationRule.objects.all()
-
     matching_titles = []
-    matched_rule_descriptions = []
+    matched_rules = []
 
     for rule in categorization_rules:
         # Keywords are comma-separated phrases. We check each phrase using regex for whole-word matching.
@@ -59,22 +124,20 @@ def get_title_from_description(description, contractor="", categorization_rules=
         for phrase in phrases:
             if re.search(r"(?<!\w)" + re.escape(phrase) + r"(?!\w)", search_text):
                 matching_titles.append(rule.title)
-                matched_rule_descriptions.append(f"'{rule.keywords}' -> {rule.get_title_display()}")
+                matched_rules.append(rule.pk)
+                if hits is not None:
+                    hits[rule.pk] += 1
                 break  # A rule matches if any of its phrases match. Move to next rule.
 
     unique_matches = list(dict.fromkeys(matching_titles))
-    unique_rule_descriptions = list(dict.fromkeys(matched_rule_descriptions))
 
     if len(unique_matches) == 1 and unique_matches[0] is not None:
-        log = f"Dopasowano regułę: {', '.join(unique_rule_descriptions)}."
-        return unique_matches[0], "PROCESSED", log
+        return unique_matches[0], "PROCESSED", {"t": "P", "tr": matched_rules}
     elif len(unique_matches) > 1:
-        log = f"Konflikt reguł tytułu: {', '.join(unique_rule_descriptions)}."
+        provenance = {"t": "C", "tr": matched_rules}
         if _should_use_ai('CONFLICT', ai_mode):
-            ai_title, ai_status, ai_log = categorize_with_ai(description, contractor)
-            if ai_title:
-                return ai_title, "PROCESSED", f"[AI FALLBACK] {ai_log}"
-        return None, "CONFLICT", log
+            return apply_ai_result('CONFLICT', provenance, categorize(description, contractor))
+        return None, "CONFLICT", provenance
 
     # Fallback to the old logic if no rule is found
     description_lower = description.lower()
@@ -91,16 +154,13 @@ def get_title_from_description(description, contractor="", categorization_rules=
     }
     for keyword, title in fallback_map.items():
         if keyword in description_lower:
-            return title, "PROCESSED", f"Dopasowano regułę wbudowaną dla '{keyword}'."
+            return title, "PROCESSED", {"t": "P", "tb": keyword}
 
     # Jeśli żadna reguła nie pasuje i mamy AI, pytamy AI
     if _should_use_ai('UNPROCESSED', ai_mode):
-        ai_title, ai_status, ai_log = categorize_with_ai(description, contractor)
-        if ai_title:
-            return ai_title, "PROCESSED", f"[AI] {ai_log}"
-        return None, "UNPROCESSED", ai_log
+        return apply_ai_result('UNPROCESSED', None, categorize(description, contractor))
 
-    return None, "UNPROCESSED", "Nie znaleziono pasującej reguły."
+    return None, "UNPROCESSED", {"t": "U"}
 
 
 def match_lokal_for_transaction(
@@ -112,14 +172,18 @@ def match_lokal_for_transaction(
     lokals_by_number=None,
     active_users=None,
     agreements_by_user=None,
+    hits=None,
 ):
     """
     Przypisuje lokal do transakcji na podstawie opisu, kontrahenta, kwoty i daty.
     Opcjonalne parametry pozwalają przekazać wstępnie pobrane dane (listy/słowniki),
     eliminując wielokrotne zapytania do bazy przy przetwarzaniu wsadowym.
     Bez tych parametrów funkcja działa samodzielnie i pobiera dane sama.
+    `hits` (Counter, np. RuleHits.lokal) zlicza dopasowane reguły przypisania.
+    Trzeci element wyniku to pochodzenie dopasowania (kody "l*", patrz
+    core/services/provenance.py): reguły, lokale z tekstu, najemcy i kandydaci.
     """
-    log_messages = []
+    provenance = {}
 
     # Reguła nadrzędna: Ujemne kwoty (koszty) są przypisywane do "kamienicy"
     if amount < 0:
@@ -132,22 +196,31 @@ def match_lokal_for_transaction(
                 kamienica_lokal = None
 
         if kamienica_lokal:
-            return kamienica_lokal, "PROCESSED", f"Automatycznie przypisano do '{BUILDING_LOKAL_NUMBER}' (transakcja kosztowa)."
-        log_messages.append(f"Nie znaleziono lokalu '{BUILDING_LOKAL_NUMBER}' dla transakcji kosztowej.")
+            return kamienica_lokal, "PROCESSED", {"l": "B"}
+        provenance["lx"] = 1
         # Kontynuujemy, może inna reguła coś znajdzie
 
     search_text = (description + " " + (contractor or "")).lower()
     found_lokals = []
 
+    def result(status, lokal=None):
+        candidates = list(dict.fromkeys(l.pk for l in found_lokals))
+        if len(candidates) > 1:
+            provenance["lc"] = candidates
+        return lokal, status, {"l": status[0], **provenance}
+
     # 1. Sprawdzenie Reguł (Słowa kluczowe / Nr konta)
     if assignment_rules is None:
         assignment_rules = LokalAssignmentRule.objects.select_related("lokal").all()
     for rule in assignment_rules:
         if re.search(r"(?<!\w)" + re.escape(rule.keywords.lower()) + r"(?!\w)", search_text):
             found_lokals.append(rule.lokal)
-            log_messages.append(
-                f"Dopasowano regułę przypisania lokalu: '{rule.keywords}' -> Lokal {rule.lokal.unit_number}."
-            )
+            provenance.setdefault("lr", []).append(rule.pk)
+            if hits is not None:
+                hits[rule.pk] += 1
+    if _early_exit() and len(set(found_lokals)) > 1:
+        # Dwa różne lokale z reguł — wynik to CONFLICT niezależnie od dalszych kroków.
+        return result("CONFLICT")
 
     # 2. Analiza tekstowa (Regex) - szukanie "lok/m/nr" + liczba
     # Poprawiona reguła, aby 'm.' nie było mylone z 'mieszkanie' w adresach
@@ -167,9 +240,7 @@ def match_lokal_for_transaction(
                     lokal = None
             if lokal:
                 found_lokals.append(lokal)
-                log_messages.append(
-                    f"Dopasowano numer lokalu w tekście: '{match.group(0)}' -> Lokal {lokal.unit_number}."
-                )
+                provenance.setdefault("lt", []).append(lokal.pk)
 
     # 3. Analiza Umów (Osoby)
     if active_users is None:
@@ -198,25 +269,261 @@ def match_lokal_for_transaction(
                 )
             if agreement:
                 found_lokals.append(agreement.lokal)
-                log_messages.append(
-                    f"Dopasowano najemcę: '{user.name} {user.lastname}' -> Lokal {agreement.lokal.unit_number}."
-                )
+                provenance.setdefault("lu", []).append([user.pk, agreement.lokal_id])
 
     unique_lokals = list(set(found_lokals))
 
     if len(unique_lokals) == 1:
-        final_log = " ".join(log_messages)
-        return unique_lokals[0], "PROCESSED", final_log
+        return result("PROCESSED", unique_lokals[0])
     elif len(unique_lokals) > 1:
-        final_log = (
-            "Konflikt: Znaleziono wiele pasujących lokali. " + " ".join(log_messages)
-        )
-        return None, "CONFLICT", final_log
+        return result("CONFLICT")
     else:
-        return None, "UNPROCESSED", "Nie znaleziono pasującego lokalu."
+        return result("UNPROCESSED")
+
+
+def _record_stage(timings, stage, started):
+    """
+    Zapisuje czas etapu w metrykach (import.<etap>), dolicza go do słownika
+    timings (jeśli przekazano) i zwraca nowy punkt startu.
+    """
+    now = time.perf_counter()
+    metrics.record(f"import.{stage}", now - started)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (now - started)
+    return now
+
+
+def final_status(title_status, lokal_status):
+    """Status transakcji wynikający ze statusów kategoryzacji tytułu i przypisania lokalu."""
+    if title_status == "CONFLICT" or lokal_status == "CONFLICT":
+        return "CONFLICT"
+    if title_status == "UNPROCESSED":
+        return "UNPROCESSED"
+    return "PROCESSED"
+
+
+# Pola nadpisywane przy ponownym imporcie transakcji o tym samym transaction_id.
+IMPORT_UPDATE_FIELDS = [
+    "posting_date", "description", "amount", "contractor", "title", "lokal", "status", "provenance",
+    "processing_log", "content_hash", "fingerprint",
+]
+
+
+def write_transactions(rows):
+    """
+    Zapisuje rozstrzygnięte rekordy (po resolve_titles) jednym zbiorczym
+    INSERT ... ON CONFLICT (transaction_id) DO UPDATE zamiast update_or_create
+    dla każdego wiersza, po czym loguje decyzje Ollamy w AIDecision
+    i sprawdza odciski zapisanych wierszy w indeksie duplikatów.
+    bulk_create nie wysyła sygnałów, więc salda i cache raportów lokali
+    (stare i nowe przypisanie) oznacza mark_transactions_changed().
+    Przy powtórzonym transaction_id w pliku wygrywa ostatni wiersz
+    (row["exists"] = False pozwala pominąć odczyt poprzedniego przypisania).
+    Ochrona wierszy (is_protected) jest sprawdzana ponownie pod blokadą
+    istniejących wierszy — między skip_known_rows a zapisem (kategoryzacja AI,
+    podgląd importu) ktoś mógł transakcję edytować lub zweryfikować.
+    Zwraca (Counter statusów zapisanych wierszy, liczba reguł utworzonych
+    z sugestii, liczba nowych kandydatów na duplikaty, zbiór transaction_id
+    pominiętych jako chronione).
+    """
+    with transaction.atomic():
+        protected = protected_transaction_ids({row["transaction_id"] for row in rows}, lock=True)
+        rows = [row for row in rows if row["transaction_id"] not in protected]
+        latest = {row["transaction_id"]: row for row in rows}
+        updated = [transaction_id for transaction_id, row in latest.items() if row.get("exists", True)]
+        changes = [(getattr(row["lokal"], "pk", None), row["posting_date"]) for row in latest.values()]
+        for offset in range(0, len(updated), 500):
+            changes.extend(FinancialTransaction.objects.filter(
+                transaction_id__in=updated[offset:offset + 500]
+            ).order_by().values_list("lokal_id", "posting_date"))
+        written = FinancialTransaction.objects.bulk_create(
+            [
+                FinancialTransaction(
+                    transaction_id=row["transaction_id"],
+                    posting_date=row["posting_date"],
+                    description=row["description"],
+                    amount=row["amount"],
+                    contractor=row["contractor"],
+                    title=row["title"],
+                    lokal=row["lokal"],
+                    status=row["status"],
+                    provenance=row["provenance"],
+                    # Tekstowy log starszych importów jest zastępowany przez provenance.
+                    processing_log=None,
+                    content_hash=row_content_hash(row),
+                    fingerprint=transaction_fingerprint(
+                        row["posting_date"], row["amount"], row["description"], row["contractor"],
+                    ),
+                )
+                for row in latest.values()
+            ],
+            update_conflicts=True,
+            # MySQL (produkcja) nie przyjmuje celu konfliktu — ON DUPLICATE KEY UPDATE działa na każdym kluczu unikalnym.
+            unique_fields=["transaction_id"] if connection.features.supports_update_conflicts_with_target else None,
+            update_fields=IMPORT_UPDATE_FIELDS,
+        )
+        duplicates = record_candidates(ft.fingerprint for ft in written)
+        decided = [row for row in latest.values() if row.get("ai_source") == "AI"]
+        ids = {}
+        for offset in range(0, len(decided), 500):
+            ids.update(FinancialTransaction.objects.filter(
+                transaction_id__in=[row["transaction_id"] for row in decided[offset:offset + 500]]
+            ).values_list("transaction_id", "id"))
+        decisions = AIDecision.objects.bulk_create(
+            AIDecision(
+                transaction_id=ids.get(row["transaction_id"]),
+                description=row["description"],
+                contractor=row["contractor"],
+                contractor_key=contractor_key(row["contractor"]),
+                title=row["ai_title"],
+            )
+            for row in decided
+        )
+    mark_transactions_changed(changes)
+
+    created_rules = 0
+    if decisions and getattr(settings, 'RULE_SUGGESTION_AUTO_CREATE', False):
+        created_rules = create_rules(auto_create_suggestions(suggest_rules()))
+    return Counter(row["status"] for row in rows), created_rules, duplicates, protected
+
+
+def load_matching_context():
+    """
+    Jednorazowy prefetch wszystkich danych potrzebnych do dopasowania reguł —
+    bez tego każda transakcja generowałaby oddzielne zapytania do bazy.
+    Zwraca słownik z kluczem 'categorization_rules' (dla
+    get_title_from_description) i 'lokal' (argumenty match_lokal_for_transaction).
+    """
+    categorization_rules = list(CategorizationRule.objects.all())
+    assignment_rules = list(
+        LokalAssignmentRule.objects.select_related("lokal").all()
+    )
+    lokals_by_number = {
+        lokal.unit_number.lower(): lokal
+        for lokal in Lokal.objects.all()
+    }
+    active_users = list(
+        User.objects.filter(is_active=True, role__in=["lokator", "wlasciciel"])
+    )
+    active_agreements = list(
+        Agreement.objects.filter(
+            user__in=active_users, is_active=True
+        ).select_related("user", "lokal")
+    )
+    agreements_by_user = defaultdict(list)
+    for ag in active_agreements:
+        agreements_by_user[ag.user_id].append(ag)
+    return {
+        "categorization_rules": categorization_rules,
+        "lokal": {
+            "assignment_rules": assignment_rules,
+            "lokals_by_number": lokals_by_number,
+            "active_users": active_users,
+            "agreements_by_user": agreements_by_user,
+        },
+    }
+
+
+def row_content_hash(row):
+    """
+    Skrót treści wiersza wyciągu (data, kwota, opis, kontrahent) — zapisywany
+    w FinancialTransaction.content_hash, żeby ponowny import rozpoznał
+    niezmienione transakcje bez dopasowywania reguł.
+    """
+    content = "\x1f".join((
+        row["posting_date"].isoformat(),
+        str(Decimal(row["amount"]).quantize(Decimal("0.01"))),
+        row["description"] or "",
+        row["contractor"] or "",
+    ))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def is_protected(status, verified):
+    """Transakcje edytowane ręcznie (także podzielone) lub zweryfikowane nie są nadpisywane importem."""
+    return status == "MANUALLY_EDITED" or verified
 
 
-def process_csv_file(file, ai_mode='conflict_and_unprocessed'):
+def protected_transaction_ids(transaction_ids, lock=False):
+    """
+    Które z podanych transaction_id należą do transakcji chronionych (is_protected) — paczkami po 500.
+    lock=True (wewnątrz transaction.atomic) blokuje wszystkie istniejące wiersze do końca
+    transakcji, żeby nie stały się chronione między sprawdzeniem a zapisem.
+    """
+    transaction_ids = list(transaction_ids)
+    protected = set()
+    for offset in range(0, len(transaction_ids), 500):
+        queryset = FinancialTransaction.objects.filter(transaction_id__in=transaction_ids[offset:offset + 500])
+        if lock:
+            queryset = queryset.select_for_update()
+        protected.update(
+            transaction_id
+            for transaction_id, status, verified in queryset.order_by().values_list("transaction_id", "status", "verified")
+            if is_protected(status, verified)
+        )
+    return protected
+
+
+def skip_known_rows(rows):
+    """
+    Etap deduplikacji przed dopasowaniem reguł. Jednym zapytaniem (zakres dat
+    z pliku) ładuje transaction_id, content_hash i status istniejących transakcji;
+    pomija wiersze niezmienione oraz edytowane ręcznie lub zweryfikowane
+    (MANUALLY_EDITED / verified — ich nie nadpisujemy). Identyfikatory spoza
+    zakresu dat (bank zmienił datę księgowania) są doczytywane paczkami.
+    Zwraca (wiersze nowe lub zmienione, liczba niezmienionych, liczba chronionych);
+    wiersze już istniejące dostają row["exists"] = True.
+    """
+    if not rows:
+        return rows, 0, 0
+    known = {
+        transaction_id: (content_hash, status, verified)
+        for transaction_id, content_hash, status, verified in FinancialTransaction.objects.filter(
+            posting_date__range=(min(r["posting_date"] for r in rows), max(r["posting_date"] for r in rows)),
+            transaction_id__isnull=False,
+        ).order_by().values_list("transaction_id", "content_hash", "status", "verified")
+    }
+    missing = list({r["transaction_id"] for r in rows} - known.keys())
+    for offset in range(0, len(missing), 500):
+        known.update(
+            (transaction_id, (content_hash, status, verified))
+            for transaction_id, content_hash, status, verified in FinancialTransaction.objects.filter(
+                transaction_id__in=missing[offset:offset + 500]
+            ).order_by().values_list("transaction_id", "content_hash", "status", "verified")
+        )
+
+    fresh = []
+    unchanged = protected = 0
+    for row in rows:
+        existing = known.get(row["transaction_id"])
+        if existing is None:
+            row["exists"] = False
+            fresh.append(row)
+            continue
+        content_hash, status, verified = existing
+        if is_protected(status, verified):
+            protected += 1
+        elif content_hash == row_content_hash(row):
+            unchanged += 1
+        else:
+            row["exists"] = True
+            fresh.append(row)
+    return fresh, unchanged, protected
+
+
+def parse_statement(file, timings=None, hits=None, skip_known=False):
+    """
+    Dekoduje wyciąg CSV, parsuje wiersze i dopasowuje reguły tytułu i lokalu
+    — bez zapisu do bazy i bez AI. Zwraca słownik z kluczami 'rows' (rekordy
+    z polami title/title_status/title_provenance i lokal/lokal_status/
+    lokal_provenance), 'skipped_rows', 'encoding_warning',
+    'unchanged_count', 'protected_count' i ewentualnie 'error'. Wspólne dla
+    importu i komendy compare_ai_modes.
+    Przy skip_known=True (import) wiersze już zapisane i niezmienione albo
+    edytowane ręcznie są odrzucane przed dopasowaniem (skip_known_rows).
+    Dopasowania reguł są doliczane do `hits` (RuleHits), jeśli go przekazano.
+    """
+    started = time.perf_counter()
     encoding_warning = False
     try:
         decoded_file = file.read().decode("windows-1250")
@@ -233,6 +540,8 @@ def process_csv_file(file, ai_mode='conflict_and_unprocessed'):
             header_found = True
             break
 
+    started = _record_stage(timings, 'decode', started)
+
     if not header_found:
         return {
             "error": 'Nie znaleziono nagłówka "Data transakcji" w pliku CSV.',
@@ -245,122 +554,202 @@ def process_csv_file(file, ai_mode='conflict_and_unprocessed'):
         if row and row[0] == "Data transakcji":
             break
 
-    # --- Jednorazowy prefetch wszystkich danych potrzebnych w pętli ---
-    # Bez tego każda transakcja generowałaby oddzielne zapytania do bazy.
-    categorization_rules = list(CategorizationRule.objects.all())
-    assignment_rules = list(
-        LokalAssignmentRule.objects.select_related("lokal").all()
-    )
-    lokals_by_number = {
-        lokal.unit_number.lower(): lokal
-        for lokal in Lokal.objects.all()
-    }
-    active_users = list(
-        User.objects.filter(is_active=True, role__in=["lokator", "wlasciciel"])
-    )
-    active_agreements = list(
-        Agreement.objects.filter(
-            user__in=active_users, is_active=True
-        ).select_related("user", "lokal")
-    )
-    agreements_by_user = defaultdict(list)
-    for ag in active_agreements:
-        agreements_by_user[ag.user_id].append(ag)
-
-    processed_count = 0
+    rows = []
     skipped_rows = []
-    has_manual_work = False
-    conflict_count = 0
-    unprocessed_count = 0
     row_num = 1
+    for row in reader:
+        row_num += 1
+        if not row or (row and row[0].startswith("Dokument ma charakter informacyjny")):
+            break
 
-    with transaction.atomic():
-        for row in reader:
-            row_num += 1
-            if not row or (row and row[0].startswith("Dokument ma charakter informacyjny")):
-                break
+        if len(row) > 8:
+            try:
+                date_str = row[0].strip()
+                parsed_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
 
-            if len(row) > 8:
-                try:
-                    date_str = row[0].strip()
-                    parsed_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-
-                    amount_str = row[8].replace(",", ".").strip()
-                    if not amount_str:
-                        skipped_rows.append((row_num, "Pusta kwota"))
-                        continue
-
-                    amount = Decimal(amount_str)
-                    description = row[3].strip()
-                    contractor = row[2].strip()
-                    transaction_id = row[7].strip()
-
-                    if not transaction_id:
-                        skipped_rows.append((row_num, "Pusty numer transakcji"))
-                        continue
-
-                    title, title_status, title_log = get_title_from_description(
-                        description, contractor,
-                        categorization_rules=categorization_rules,
-                        ai_mode=ai_mode,
-                    )
-                    (
-                        suggested_lokal,
-                        lokal_status,
-                        lokal_log,
-                    ) = match_lokal_for_transaction(
-                        description, contractor, amount, parsed_date,
-                        assignment_rules=assignment_rules,
-                        lokals_by_number=lokals_by_number,
-                        active_users=active_users,
-                        agreements_by_user=agreements_by_user,
-                    )
+                amount_str = row[8].replace(",", ".").strip()
+                if not amount_str:
+                    skipped_rows.append((row_num, "Pusta kwota"))
+                    continue
 
-                    final_status = "PROCESSED"
-                    if title_status == "CONFLICT" or lokal_status == "CONFLICT":
-                        final_status = "CONFLICT"
-                    elif title_status == "UNPROCESSED":
-                        final_status = "UNPROCESSED"
+                amount = Decimal(amount_str)
+                description = row[3].strip()
+                contractor = row[2].strip()
+                transaction_id = row[7].strip()
 
-                    if final_status != "PROCESSED":
-                        has_manual_work = True
+                if not transaction_id:
+                    skipped_rows.append((row_num, "Pusty numer transakcji"))
+                    continue
 
-                    if final_status == "CONFLICT":
-                        conflict_count += 1
-                    elif final_status == "UNPROCESSED":
-                        unprocessed_count += 1
+                rows.append({
+                    "transaction_id": transaction_id,
+                    "posting_date": parsed_date,
+                    "description": description,
+                    "amount": amount,
+                    "contractor": contractor,
+                })
+
+            except (ValueError, InvalidOperation, IndexError) as e:
+                skipped_rows.append((row_num, str(e)))
+                continue
+        else:
+            skipped_rows.append((row_num, "Nieprawidłowa liczba kolumn"))
+    started = _record_stage(timings, 'parse', started)
+
+    unchanged = protected = 0
+    if skip_known:
+        rows, unchanged, protected = skip_known_rows(rows)
+    # Przy ponownym imporcie samych znanych wierszy nie ma czego dopasowywać.
+    context = load_matching_context() if rows else None
+    _record_stage(timings, 'prefetch', started)
+
+    for record in rows:
+        started = time.perf_counter()
+        record["title"], record["title_status"], record["title_provenance"] = get_title_from_description(
+            record["description"], record["contractor"],
+            categorization_rules=context["categorization_rules"],
+            hits=hits.title if hits is not None else None,
+        )
+        started = _record_stage(timings, 'title_match', started)
+        record["lokal"], record["lokal_status"], record["lokal_provenance"] = match_lokal_for_transaction(
+            record["description"], record["contractor"], record["amount"], record["posting_date"],
+            hits=hits.lokal if hits is not None else None,
+            **context["lokal"],
+        )
+        _record_stage(timings, 'lokal_match', started)
 
-                    # Połączenie logów z obu funkcji
-                    full_log = (
-                        f"Kategoryzacja Tytułu: {title_log} | Przypisanie Lokalu: {lokal_log}"
-                    )
+    return {
+        "rows": rows,
+        "skipped_rows": skipped_rows,
+        "encoding_warning": encoding_warning,
+        "unchanged_count": unchanged,
+        "protected_count": protected,
+    }
 
-                    FinancialTransaction.objects.update_or_create(
-                        transaction_id=transaction_id,
-                        defaults={
-                            "posting_date": parsed_date,
-                            "description": description,
-                            "amount": amount,
-                            "contractor": contractor,
-                            "title": title,
-                            "lokal": suggested_lokal,
-                            "status": final_status,
-                            "processing_log": full_log,
-                        },
-                    )
-                    processed_count += 1
 
-                except (ValueError, InvalidOperation, IndexError) as e:
-                    skipped_rows.append((row_num, str(e)))
-                    continue
-            else:
-                skipped_rows.append((row_num, "Nieprawidłowa liczba kolumn"))
+def categorize_pending(items, ai_client, classifier=None, timings=None):
+    """
+    Tytuły dla wierszy odłożonych do AI; items to lista (klucz, rekord).
+    Najpierw lokalny klasyfikator (milisekundy), do Ollamy — wsadowo — trafia
+    tylko to, czego nie jest pewien. Zwraca ({klucz: (kod, status, log)},
+    zbiór kluczy rozstrzygniętych przez klasyfikator).
+    """
+    started = time.perf_counter()
+    results = {}
+    for key, record in items:
+        result = classify(classifier, record["description"], record["contractor"]) if classifier else None
+        if result is not None:
+            results[key] = result
+    classified = set(results)
+    started = _record_stage(timings, 'classifier', started)
+    results.update(ai_client.categorize_batch([
+        (key, record["description"], record["contractor"], record["amount"])
+        for key, record in items
+        if key not in classified
+    ]))
+    _record_stage(timings, 'title_match', started)
+    return results, classified
+
+
+def resolve_titles(rows, ai_mode, timings=None):
+    """
+    Ostateczny wynik kategoryzacji rekordów z parse_statement(). Przy trybie
+    z AI korzysta z jednego OllamaClient: najpierw sprawdza dostępność Ollama,
+    a po serii błędów lub wyczerpaniu budżetu czasu kontynuuje bez AI.
+    Wiersze wymagające AI trafiają do categorize_pending() — lokalny
+    klasyfikator, potem wsadowo Ollama.
+
+    Każdy rekord dostaje pola: title/title_status/title_provenance (po AI),
+    status, provenance, ai_source ('AI' — odpowiedź Ollamy do dziennika
+    AIDecision, 'ML' — klasyfikator, '' — same reguły) i ai_title.
+    Zwraca (statystyki OllamaClient albo None, liczba rozstrzygnięć klasyfikatora).
+    """
+    started = time.perf_counter()
+    ai_client = None
+    if ai_mode != 'rule_only':
+        ai_client = OllamaClient()
+        if ai_client.health_check():
+            ai_client.warm_up()
+        _record_stage(timings, 'prefetch', started)
+
+    pending_ai = [
+        row for row in rows
+        if ai_client is not None and _should_use_ai(row["title_status"], ai_mode)
+    ]
+    for row in rows:
+        row["ai_source"], row["ai_title"] = "", None
+    classified = set()  # indeksy pending_ai rozstrzygnięte przez lokalny klasyfikator
+    if pending_ai:
+        ai_results, classified = categorize_pending(
+            list(enumerate(pending_ai)), ai_client, load_categorizer(), timings,
+        )
+        for index, row in enumerate(pending_ai):
+            source = "ML" if index in classified else "AI"
+            row["title"], row["title_status"], row["title_provenance"] = apply_ai_result(
+                row["title_status"], row["title_provenance"], ai_results[index], source=source,
+            )
+            if index in classified or ai_results[index][1] != "ERROR":
+                row["ai_source"], row["ai_title"] = source, ai_results[index][0]
+
+    for row in rows:
+        row["status"] = final_status(row["title_status"], row["lokal_status"])
+        # Pochodzenie tytułu (kody "t*", "a*") i lokalu ("l*") — rozłączne klucze.
+        row["provenance"] = {**row["title_provenance"], **row["lokal_provenance"]}
 
+    if ai_client is None:
+        return None, 0
+    ai_client.close()
+    return ai_client.summary(), len(classified)
+
+
+def process_csv_file(file, ai_mode='conflict_and_unprocessed', timings=None):
+    """
+    Importuje wyciąg bankowy CSV. Opcjonalny słownik `timings` jest uzupełniany
+    sumarycznym czasem (w sekundach) etapów: decode, prefetch, parse,
+    title_match, lokal_match, classifier, write — używa go komenda benchmark_import.
+
+    parse_statement() -> resolve_titles() -> write_transactions(): tytuły
+    z reguł, klasyfikatora i Ollamy, a zapis jednym zbiorczym upsertem.
+    Wiersze już zaimportowane (ten sam content_hash) i edytowane ręcznie
+    są pomijane przed dopasowaniem — ponowny import nakładającego się
+    wyciągu praktycznie nic nie kosztuje.
+    Odpowiedzi Ollamy są zapisywane w dzienniku AIDecision (źródło sugestii reguł).
+    Statystyki AI trafiają do klucza 'ai' wyniku, a liczniki dopasowań
+    reguł zapisanych wierszy są zapisywane jednym flush() po zapisaniu transakcji.
+    Podgląd przed zapisem: core/services/import_staging.py.
+    """
+    statement = parse_statement(file, timings, skip_known=True)
+    if statement.get("error"):
+        return statement
+
+    ai_summary, classified_count = resolve_titles(statement["rows"], ai_mode, timings)
+    started = time.perf_counter()
+    statuses, created_rules, duplicates, protected = write_transactions(statement["rows"])
+    if protected:
+        statement["rows"] = [row for row in statement["rows"] if row["transaction_id"] not in protected]
+        statement["protected_count"] = statement.get("protected_count", 0) + len(protected)
+    hits = RuleHits()
+    for row in statement["rows"]:
+        hits.add_provenance(row["provenance"])
+    hits.flush()
+    _record_stage(timings, 'write', started)
+
+    return import_summary(statement, statuses, ai_summary, classified_count, created_rules, duplicates)
+
+
+def import_summary(statement, statuses, ai_summary, classified_count, created_rules=0, duplicates=0):
+    """Słownik wyniku importu (wspólny dla importu bezpośredniego i zatwierdzenia podglądu)."""
     return {
-        'processed_count': processed_count,
-        'skipped_rows': skipped_rows,
-        'has_manual_work': has_manual_work,
-        'conflict_count': conflict_count,
-        'unprocessed_count': unprocessed_count,
-        'encoding_warning': encoding_warning,
+        'processed_count': len(statement["rows"]),
+        'unchanged_count': statement.get("unchanged_count", 0),
+        'protected_count': statement.get("protected_count", 0),
+        'skipped_rows': statement["skipped_rows"],
+        'has_manual_work': bool(statuses['CONFLICT'] or statuses['UNPROCESSED']),
+        'conflict_count': statuses['CONFLICT'],
+        'unprocessed_count': statuses['UNPROCESSED'],
+        'encoding_warning': statement["encoding_warning"],
+        'ai': ai_summary,
+        'classified_count': classified_count,
+        'created_rules': created_rules,
+        'duplicate_candidates': duplicates,
     }
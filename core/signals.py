@@ -0,0 +1,176 @@
+# core/signals.py
+"""
+Sygnały unieważniające cache raportów (patrz core/services/report_cache.py)
+oraz oznaczające naliczenia miesięczne (core/services/charges.py) i salda umów
+(core/services/balances.py) do przeliczenia, a także utrzymujące odcisk
+transakcji do wykrywania duplikatów (core/services/duplicates.py).
+Zmiany danych wspólnych podbijają wersję całej kamienicy, zmiany danych
+jednego lokalu — tylko wersję tego lokalu.
+"""
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    Agreement,
+    CapturedProfile,
+    FinancialTransaction,
+    FixedCost,
+    Lokal,
+    Meter,
+    MeterReading,
+    ProfilingRule,
+    RentSchedule,
+    User,
+    WaterCostOverride,
+)
+from .services.balances import mark_balances_stale
+from .services.charges import billing_period_start, mark_charges_stale
+from .services.duplicates import fingerprint_of
+from .services.profiling import clear_rules_cache
+from .services.report_cache import BUILDING_SCOPE, invalidate, lokal_scope
+
+
+@receiver(post_save, sender=MeterReading)
+@receiver(post_delete, sender=MeterReading)
+@receiver(post_save, sender=Meter)
+@receiver(post_delete, sender=Meter)
+@receiver(post_save, sender=FixedCost)
+@receiver(post_delete, sender=FixedCost)
+@receiver(post_save, sender=WaterCostOverride)
+@receiver(post_delete, sender=WaterCostOverride)
+def invalidate_building_reports(sender, instance, **kwargs):
+    # Odczyt jednego licznika zmienia sumę zużycia kamienicy, a więc
+    # cenę jednostkową wody dla wszystkich lokali.
+    invalidate(BUILDING_SCOPE)
+
+
+@receiver(post_save, sender=Lokal)
+@receiver(post_delete, sender=Lokal)
+def invalidate_lokal_reports(sender, instance, **kwargs):
+    invalidate(BUILDING_SCOPE, lokal_scope(instance.pk))
+
+
+@receiver(post_save, sender=Agreement)
+@receiver(post_delete, sender=Agreement)
+def invalidate_agreement_reports(sender, instance, **kwargs):
+    invalidate(lokal_scope(instance.lokal_id))
+
+
+@receiver(post_save, sender=RentSchedule)
+@receiver(post_delete, sender=RentSchedule)
+def invalidate_rent_schedule_reports(sender, instance, **kwargs):
+    invalidate(lokal_scope(instance.agreement.lokal_id))
+
+
+@receiver(post_save, sender=User)
+def invalidate_tenant_reports(sender, instance, created, **kwargs):
+    # Imię i nazwisko najemcy trafia do zapisanych raportów (np. panelu zaległości).
+    # Usunięcia nie obsługujemy — umowy chronią najemcę (PROTECT).
+    if created:
+        return
+    lokal_ids = Agreement.all_objects.filter(user=instance).values_list('lokal_id', flat=True).distinct()
+    invalidate(*(lokal_scope(lokal_id) for lokal_id in lokal_ids))
+
+
+@receiver(post_init, sender=FinancialTransaction)
+def remember_transaction_lokal(sender, instance, **kwargs):
+    # Zapamiętujemy lokal z chwili odczytu, aby przy przepięciu wpłaty
+    # unieważnić raporty zarówno starego, jak i nowego lokalu.
+    instance._loaded_lokal_id = instance.lokal_id
+    # __dict__ zamiast atrybutu: przy .only()/.defer() nie dociągamy pola zapytaniem.
+    instance._loaded_posting_date = instance.__dict__.get('posting_date')
+
+
+@receiver(post_save, sender=FinancialTransaction)
+@receiver(post_delete, sender=FinancialTransaction)
+def invalidate_transaction_reports(sender, instance, **kwargs):
+    lokal_ids = {instance.lokal_id, getattr(instance, '_loaded_lokal_id', None)}
+    invalidate(*(lokal_scope(lokal_id) for lokal_id in lokal_ids if lokal_id is not None))
+
+
+# --- Naliczenia miesięczne ---
+
+@receiver(post_save, sender=MeterReading)
+@receiver(post_delete, sender=MeterReading)
+def stale_charges_for_reading(sender, instance, **kwargs):
+    # Odczyt zamyka bieżący przedział zużycia i otwiera następny,
+    # więc dotyczy swojego okresu i wszystkich późniejszych.
+    mark_charges_stale(month_year__gte=billing_period_start(instance.reading_date) - relativedelta(months=2))
+
+
+@receiver(post_save, sender=WaterCostOverride)
+@receiver(post_delete, sender=WaterCostOverride)
+def stale_charges_for_water_override(sender, instance, **kwargs):
+    mark_charges_stale(month_year=instance.period_start_date)
+
+
+@receiver(post_save, sender=Meter)
+@receiver(post_delete, sender=Meter)
+@receiver(post_save, sender=FixedCost)
+@receiver(post_delete, sender=FixedCost)
+@receiver(post_save, sender=Lokal)
+@receiver(post_delete, sender=Lokal)
+def stale_all_open_charges(sender, instance, **kwargs):
+    mark_charges_stale()
+
+
+@receiver(post_save, sender=Agreement)
+def stale_charges_for_agreement(sender, instance, **kwargs):
+    mark_charges_stale(agreement=instance)
+
+
+@receiver(post_save, sender=RentSchedule)
+@receiver(post_delete, sender=RentSchedule)
+def stale_charges_for_rent_schedule(sender, instance, **kwargs):
+    mark_charges_stale(agreement_id=instance.agreement_id, month_year=instance.year_month.replace(day=1))
+
+
+# --- Salda umów ---
+
+@receiver(post_save, sender=FinancialTransaction)
+@receiver(post_delete, sender=FinancialTransaction)
+def stale_balances_for_transaction(sender, instance, **kwargs):
+    # Przepięcie wpłaty lub zmiana daty księgowania dotyczy obu lokali
+    # od wcześniejszej z dat — stara i nowa wartość.
+    dates = [
+        d.date() if isinstance(d, datetime) else d
+        for d in (instance.posting_date, getattr(instance, '_loaded_posting_date', None))
+        if d
+    ]
+    if not dates:
+        return
+    from_date = min(dates)
+    for lokal_id in {instance.lokal_id, getattr(instance, '_loaded_lokal_id', None)}:
+        if lokal_id is not None:
+            mark_balances_stale(lokal_id, from_date)
+
+
+# --- Odcisk transakcji (duplikaty) ---
+
+FINGERPRINT_FIELDS = {'posting_date', 'amount', 'description', 'contractor'}
+
+
+@receiver(pre_save, sender=FinancialTransaction)
+def fill_transaction_fingerprint(sender, instance, update_fields=None, **kwargs):
+    # Zapis tylko wybranych pól (update_fields) bez pól odcisku go nie zmienia.
+    if update_fields is not None and not FINGERPRINT_FIELDS & set(update_fields):
+        return
+    instance.fingerprint = fingerprint_of(instance)
+
+
+# --- Profilowanie na żądanie ---
+
+@receiver(post_save, sender=ProfilingRule)
+@receiver(post_delete, sender=ProfilingRule)
+def reload_profiling_rules(sender, instance, **kwargs):
+    # Pozostałe procesy serwera zobaczą zmianę po PROFILING_RULES_TTL sekundach.
+    clear_rules_cache()
+
+
+@receiver(post_delete, sender=CapturedProfile)
+def delete_profile_file(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
@@ -1,9 +1,45 @@
-from django.test import TestCase, Client
+import io
+import json
+import marshal
+import os
+import tempfile
+import time
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User as AuthUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import ProtectedError
+from django.utils import timezone
 from decimal import Decimal
 from datetime import date, timedelta
-from .models import BUILDING_LOKAL_NUMBER, Lokal, Meter, MeterReading, Agreement, User, FinancialTransaction, WaterCostOverride, FixedCost
+from .models import (
+    BUILDING_LOKAL_NUMBER, Lokal, Meter, MeterReading, Agreement, User, FinancialTransaction, WaterCostOverride, FixedCost,
+    AIDecision, AgreementBalance, CapturedProfile, CategorizationRule, DuplicateCandidate, ImportJob, MonthlyCharge, ProfilingRule,
+    RentSchedule, StagedTransaction,
+)
+from .management.commands.benchmark_import import generate_statement, parse_mix, seed_benchmark_data
+from .management.commands.benchmark_pdf_rendering import _sample_context
+from .services import metrics, performance
+from .services.ai_categorization import OllamaClient, categorize_with_ai, new_session, test_ollama_connection
+from .services.balances import get_arrears_summary, get_closing_balance, refresh_balances
+from .services.benchmarking import check_budgets
+from .services.charges import close_period, ensure_charges_posted, month_range, post_charges
+from .services.duplicates import delete_duplicate, scan_duplicates, transaction_fingerprint
+from .services.fake_ollama import FakeOllamaConfig, running_fake_ollama
+from .services.import_staging import commit_import
+from .services.pdf_generation import build_annual_report_pdf, get_pdf_renderer
+from .services.provenance import attach_processing_details, matched_by_rule
+from .services.reporting import get_building_water_consumptions, get_water_cost_table_data
+from .services.report_cache import BUILDING_SCOPE, get_cached_bimonthly_report_context, get_data_versions, lokal_scope
+from .services.rule_analysis import analyze_rules, drop_phrase, merge_rules, prune_stale_rules
+from .services.rule_suggestions import RuleSuggestion, auto_create_suggestions, contractor_key, create_rules, suggest_rules
+from .services.splits import delete_split_family, merge_split, split_transaction, undo_split
+from .services.transaction_processing import (
+    RuleHits, get_title_from_description, parse_statement, process_csv_file, resolve_titles, write_transactions,
+)
 
 class BimonthlyReportViewTest(TestCase):
     def setUp(self):
@@ -150,4 +186,954 @@ class BimonthlyReportViewTest(TestCase):
         
         # W widoku `all_lokals_total_consumption` jest teraz obliczane precyzyjniej
         # dla najnowszego okresu.
-        self.assertEqual(all_lokals_consumption, Decimal('20.000'))
\ No newline at end of file
+        self.assertEqual(all_lokals_consumption, Decimal('20.000'))
+
+
+STATEMENT_HEADER = (
+    '"Data transakcji";"Data księgowania";"Dane kontrahenta";"Tytuł";"Nr rachunku";'
+    '"Nazwa banku";"Szczegóły";"Nr transakcji";"Kwota transakcji (waluta rachunku)";"Waluta"'
+)
+
+
+def bank_statement(rows):
+    """
+    Wyciąg CSV w układzie eksportu ING (windows-1250, średniki).
+    rows — krotki (nr transakcji, data księgowania, kontrahent, tytuł, kwota).
+    """
+    lines = ['"Lista transakcji";;;;;"ING Bank Śląski S.A.";', "", STATEMENT_HEADER]
+    for transaction_id, posting_date, contractor, description, amount in rows:
+        day = posting_date.isoformat()
+        amount = f"{Decimal(amount):.2f}".replace(".", ",")
+        lines.append(
+            f'{day};{day};"{contractor}";"{description}";"12 3456 7890";"ING Bank Śląski S.A.";'
+            f'"PRZELEW";{transaction_id};{amount};PLN'
+        )
+    lines += ["", '"Dokument ma charakter informacyjny, nie stanowi dowodu księgowego";']
+    return "\r\n".join(lines).encode("windows-1250")
+
+
+class AnnualReportPdfRendererTest(TestCase):
+    def test_renderer_is_shared_and_produces_pdf(self):
+        self.assertIs(get_pdf_renderer(), get_pdf_renderer())
+        buffer = build_annual_report_pdf(_sample_context())
+        self.assertEqual(buffer.read(4), b"%PDF")
+
+
+class ReportCacheInvalidationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(name="Jan", lastname="Kowalski", email="jan@kowalski.com", role="lokator")
+        self.lokal1 = Lokal.objects.create(unit_number="1", size_sqm=50)
+        self.lokal2 = Lokal.objects.create(unit_number="2", size_sqm=40)
+        meter = Meter.objects.create(serial_number="CW1", type="cold_water", lokal=self.lokal1)
+        MeterReading.objects.create(meter=meter, reading_date=date(2025, 2, 28), value=Decimal("100.0"))
+        MeterReading.objects.create(meter=meter, reading_date=date(2025, 4, 30), value=Decimal("110.0"))
+
+    def test_cached_report_follows_data_changes(self):
+        context = get_cached_bimonthly_report_context(self.lokal1, 2025)
+        self.assertIsNone(context['report_data'][0]['water_cost_details']['bill_amount'])
+
+        WaterCostOverride.objects.create(period_start_date=date(2025, 3, 1), overridden_bill_amount=Decimal("200.00"))
+        context = get_cached_bimonthly_report_context(self.lokal1, 2025)
+        self.assertEqual(context['report_data'][0]['water_cost_details']['lokal_water_cost'], Decimal("200.00"))
+
+    def test_lokal_edit_does_not_touch_other_lokals(self):
+        before = get_data_versions([BUILDING_SCOPE, lokal_scope(self.lokal1.pk)])
+        Agreement.objects.create(
+            user=self.user, lokal=self.lokal2, signing_date=date(2024, 1, 1),
+            start_date=date(2024, 1, 1), rent_amount=900, number_of_occupants=1,
+        )
+        self.assertEqual(get_data_versions([BUILDING_SCOPE, lokal_scope(self.lokal1.pk)]), before)
+
+
+class MonthlyChargePostingTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(name="Jan", lastname="Kowalski", email="jan@kowalski.com", role="lokator")
+        self.lokal = Lokal.objects.create(unit_number="1", size_sqm=50)
+        self.agreement = Agreement.objects.create(
+            user=user, lokal=self.lokal, signing_date=date(2024, 1, 1),
+            start_date=date(2024, 1, 1), rent_amount=1000, number_of_occupants=2,
+        )
+        FixedCost.objects.create(name="Wywóz śmieci", category="waste", calculation_method="per_person", amount=Decimal("30"), effective_date=date(2024, 1, 1))
+
+    def test_posting_is_idempotent_and_follows_input_changes(self):
+        months = month_range(date(2024, 1, 1), date(2024, 12, 1))
+        agreements = [self.agreement]
+        self.assertEqual(post_charges(months, agreements)['created'], 12)
+        self.assertEqual(post_charges(months, agreements), {'created': 0, 'updated': 0, 'deleted': 0})
+
+        january = MonthlyCharge.objects.get(agreement=self.agreement, month_year=date(2024, 1, 1))
+        self.assertEqual((january.rent, january.fixed_fees), (Decimal("1000.00"), Decimal("60.00")))
+
+        self.agreement.number_of_occupants = 3
+        self.agreement.save()
+        january.refresh_from_db()
+        self.assertTrue(january.is_stale)
+        post_charges(months, agreements)
+        january.refresh_from_db()
+        self.assertEqual(january.fixed_fees, Decimal("90.00"))
+        self.assertFalse(january.is_stale)
+
+    def test_closed_period_is_frozen(self):
+        close_period([date(2024, 1, 1)])
+        FixedCost.objects.create(name="Nowa stawka", category="waste", calculation_method="per_person", amount=Decimal("50"), effective_date=date(2024, 1, 1))
+        post_charges([date(2024, 1, 1)])
+        january = MonthlyCharge.objects.get(agreement=self.agreement, month_year=date(2024, 1, 1))
+        self.assertEqual(january.fixed_fees, Decimal("60.00"))
+        self.assertIsNotNone(january.closed_at)
+
+    def test_agreement_added_after_closing_is_posted_once(self):
+        close_period([date(2024, 1, 1)])
+        other = Agreement.objects.create(
+            user=self.agreement.user, lokal=Lokal.objects.create(unit_number="2", size_sqm=40),
+            signing_date=date(2024, 1, 1), start_date=date(2024, 1, 1), rent_amount=700, number_of_occupants=1,
+        )
+        charges = ensure_charges_posted([other], date(2024, 1, 1), date(2024, 1, 1), today=date(2024, 6, 1))
+        self.assertEqual(charges[other.pk][date(2024, 1, 1)].rent, Decimal("700.00"))
+        # Zaksięgowany wiersz jest odczytywany — bez ponownego księgowania przy każdym raporcie.
+        with self.assertNumQueries(1):
+            ensure_charges_posted([other], date(2024, 1, 1), date(2024, 1, 1), today=date(2024, 6, 1))
+
+    def test_closing_posts_inactive_agreements(self):
+        Agreement.objects.filter(pk=self.agreement.pk).update(is_active=False)
+        close_period([date(2024, 1, 1)])
+        january = MonthlyCharge.objects.get(agreement=self.agreement, month_year=date(2024, 1, 1))
+        self.assertIsNotNone(january.closed_at)
+
+
+class SettlementTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(name="Jan", lastname="Kowalski", email="jan@kowalski.com", role="lokator")
+        self.lokal = Lokal.objects.create(unit_number="1", size_sqm=50)
+        self.agreement = Agreement.objects.create(
+            user=user, lokal=self.lokal, signing_date=date(2025, 1, 1),
+            start_date=date(2025, 1, 1), end_date=date(2025, 3, 15), rent_amount=1000, number_of_occupants=2,
+        )
+        FixedCost.objects.create(name="Wywóz śmieci", category="waste", calculation_method="per_person", amount=Decimal("30"), effective_date=date(2024, 1, 1))
+        meter = Meter.objects.create(serial_number="CW-S", type="cold_water", lokal=self.lokal)
+        MeterReading.objects.create(meter=meter, reading_date=date(2025, 2, 28), value=Decimal("100.0"))
+        MeterReading.objects.create(meter=meter, reading_date=date(2025, 3, 15), value=Decimal("104.0"))
+        WaterCostOverride.objects.create(period_start_date=date(2025, 3, 1), overridden_bill_amount=Decimal("400.00"))
+        AuthUser.objects.create_superuser(username='admin', email='admin@test.com', password='testpass123')
+        self.client.login(username='admin', password='testpass123')
+
+    def test_settlement_ending_mid_period_charges_covered_months(self):
+        response = self.client.get(reverse('settlement', kwargs={'pk': self.agreement.pk}))
+        self.assertEqual(response.status_code, 200)
+        # Styczeń-marzec: czynsz i śmieci za trzy miesiące, a nie za dwa pełne okresy.
+        self.assertEqual(response.context['total_rent'], Decimal("3000.00"))
+        self.assertEqual(response.context['total_fixed_costs'], Decimal("180.00"))
+        # Koszt wody marca-kwietnia wchodzi do rozliczenia w połowie (umowa obejmuje marzec).
+        building = sum(get_building_water_consumptions({date(2025, 3, 1)})[date(2025, 3, 1)].values())
+        expected_water = (Decimal("4.0") * Decimal("400.00") / building / 2).quantize(Decimal("0.01"))
+        self.assertEqual(response.context['total_water_cost'], expected_water)
+
+    def test_settlement_view_does_not_post_charges(self):
+        Agreement.objects.filter(pk=self.agreement.pk).update(end_date=None)
+        response = self.client.get(reverse('settlement', kwargs={'pk': self.agreement.pk}))
+        self.assertEqual(response.context['settlement_date'], date.today())
+        self.assertIsNone(response.context['agreement'].end_date)
+        self.assertFalse(MonthlyCharge.objects.filter(agreement=self.agreement).exists())
+
+
+class AgreementBalanceTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(name="Jan", lastname="Kowalski", email="jan@kowalski.com", role="lokator")
+        self.lokal = Lokal.objects.create(unit_number="1", size_sqm=50)
+        self.agreement = Agreement.objects.create(
+            user=user, lokal=self.lokal, signing_date=date(2024, 1, 1),
+            start_date=date(2024, 1, 1), rent_amount=1000, number_of_occupants=2,
+        )
+        FixedCost.objects.create(name="Wywóz śmieci", category="waste", calculation_method="per_person", amount=Decimal("30"), effective_date=date(2024, 1, 1))
+
+    def test_balance_ledger_follows_reassigned_payment(self):
+        other_lokal = Lokal.objects.create(unit_number="2", size_sqm=40)
+        today = date(2024, 3, 15)
+        payment = FinancialTransaction.objects.create(
+            amount=Decimal("1000.00"), posting_date=date(2024, 1, 10), lokal=self.lokal, transaction_id="bal-1",
+        )
+        # Styczeń: czynsz 1000 + śmieci za styczeń 60.
+        self.assertEqual(get_closing_balance(self.agreement, date(2024, 1, 1), today), Decimal("-60.00"))
+
+        payment = FinancialTransaction.objects.get(pk=payment.pk)
+        payment.lokal = other_lokal
+        payment.save()
+        self.assertEqual(get_closing_balance(self.agreement, date(2024, 1, 1), today), Decimal("-1060.00"))
+        self.assertEqual(get_closing_balance(self.agreement, date(2024, 2, 1), today), Decimal("-2120.00"))
+
+    def test_refresh_recomputes_only_from_the_changed_month(self):
+        today = date(2024, 6, 15)
+        self.assertEqual(refresh_balances([self.agreement], today), 1)
+        # Bez zmian nic nie jest przeliczane — także następnego dnia.
+        self.assertEqual(refresh_balances([self.agreement], today + timedelta(days=1)), 0)
+
+        # Znacznik w styczniu: przeliczenie od kwietnia nie może go nadpisać.
+        AgreementBalance.objects.filter(agreement=self.agreement, month=date(2024, 1, 1)).update(payments=Decimal("999.00"))
+        FinancialTransaction.objects.create(
+            amount=Decimal("500.00"), posting_date=date(2024, 4, 3), lokal=self.lokal, transaction_id="bal-2",
+        )
+        self.assertEqual(
+            list(AgreementBalance.objects.filter(agreement=self.agreement, is_stale=True).values_list('month', flat=True).order_by('month')),
+            month_range(date(2024, 4, 1), date(2024, 6, 1)),
+        )
+        self.assertEqual(refresh_balances([self.agreement], today + timedelta(days=1)), 1)
+        self.assertEqual(
+            AgreementBalance.objects.get(agreement=self.agreement, month=date(2024, 1, 1)).payments, Decimal("999.00")
+        )
+        april = AgreementBalance.objects.get(agreement=self.agreement, month=date(2024, 4, 1))
+        self.assertEqual(april.payments, Decimal("500.00"))
+        self.assertEqual(april.opening_balance, AgreementBalance.objects.get(agreement=self.agreement, month=date(2024, 3, 1)).closing_balance)
+
+
+class ArrearsDashboardTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(name="Anna", lastname="Nowak", email="anna@nowak.com", role="lokator")
+        self.lokal = Lokal.objects.create(unit_number="7", size_sqm=40)
+        self.agreement = Agreement.objects.create(
+            user=user, lokal=self.lokal, signing_date=date(2024, 1, 1),
+            start_date=date(2024, 1, 1), end_date=date(2024, 3, 31), rent_amount=500, number_of_occupants=1,
+        )
+        FinancialTransaction.objects.create(
+            amount=Decimal("500.00"), posting_date=date(2024, 1, 5), lokal=self.lokal, transaction_id="arr-1",
+        )
+        AuthUser.objects.create_superuser(username='arrears_admin', email='admin@example.com', password='testpass123')
+        self.client.login(username='arrears_admin', password='testpass123')
+
+    def test_summary_counts_consecutive_months_in_arrears(self):
+        [row] = get_arrears_summary([self.agreement], today=date(2024, 6, 1))
+        self.assertEqual(row["balance"], Decimal("-1000.00"))
+        # Księga trwa do grudnia roku zakończenia umowy — dług po marcu dalej się liczy.
+        self.assertEqual(row["months_in_arrears"], 5)
+        self.assertEqual(row["last_payment_date"], date(2024, 1, 5))
+
+    def test_payment_after_end_month_counts_within_the_year(self):
+        # Jak w raporcie rocznym: wpłata na lokal do końca roku zakończenia umowy spłaca jej dług.
+        FinancialTransaction.objects.create(
+            amount=Decimal("1000.00"), posting_date=date(2024, 5, 10), lokal=self.lokal, transaction_id="arr-2",
+        )
+        [row] = get_arrears_summary([self.agreement], today=date(2024, 6, 1))
+        self.assertEqual(row["balance"], Decimal("0.00"))
+        self.assertEqual(row["months_in_arrears"], 0)
+
+    def test_renamed_tenant_is_not_served_from_cache(self):
+        self.client.get(reverse('arrears_dashboard'))
+        self.agreement.user.lastname = "Kowalska"
+        self.agreement.user.save()
+        response = self.client.get(reverse('arrears_dashboard'))
+        [row] = [row for row in response.context['rows'] if row['agreement_id'] == self.agreement.pk]
+        self.assertIn("Anna Kowalska", row['tenant'])
+
+    def test_dashboard_renders_sorted_rows(self):
+        response = self.client.get(reverse('arrears_dashboard'), {'sort': 'months', 'dir': 'desc'})
+        self.assertEqual(response.status_code, 200)
+        months = [row['months_in_arrears'] for row in response.context['rows']]
+        self.assertEqual(months, sorted(months, reverse=True))
+
+
+class ImportBenchmarkGeneratorTest(TestCase):
+    """Generator wyciągów komendy benchmark_import — testowany sam w sobie."""
+
+    def test_synthetic_statement_is_accepted_by_importer(self):
+        seed_benchmark_data()
+        timings = {}
+        statement = generate_statement(50, parse_mix("rule=1,unprocessed=1"), seed=1)
+        summary = process_csv_file(io.BytesIO(statement), ai_mode='rule_only', timings=timings)
+
+        self.assertEqual(summary['processed_count'], 50)
+        self.assertEqual(summary['skipped_rows'], [])
+        self.assertEqual(summary['conflict_count'], 0)
+        self.assertEqual(set(timings), {'decode', 'prefetch', 'parse', 'title_match', 'lokal_match', 'write'})
+
+
+class GenerateScaleDatasetTest(TestCase):
+    def setUp(self):
+        call_command('generate_scale_dataset', lokals=3, years=6, prefix='T', stdout=io.StringIO())
+        self.lokals = Lokal.objects.filter(unit_number__startswith='T')
+
+    def test_generates_lokals_with_meters(self):
+        self.assertEqual(self.lokals.count(), 3)
+        self.assertEqual(Meter.objects.filter(lokal__in=self.lokals).count(), 6)
+
+    def test_annex_links_to_closed_agreement_with_history(self):
+        annex = Agreement.all_objects.filter(lokal__in=self.lokals, type='aneks').first()
+        self.assertIsNotNone(annex.old_agreement)
+        self.assertEqual(annex.old_agreement.end_date, annex.start_date - timedelta(days=1))
+        self.assertTrue(Agreement.history.filter(id=annex.pk, history_type='~').exists())
+
+    def test_readings_grow_and_rent_is_positive(self):
+        values = list(
+            MeterReading.objects.filter(meter__lokal=self.lokals[0]).order_by('meter', 'reading_date').values_list('meter', 'value')
+        )
+        for (meter, value), (next_meter, next_value) in zip(values, values[1:]):
+            if meter == next_meter:
+                self.assertGreater(next_value, value)
+        self.assertFalse(RentSchedule.objects.filter(agreement__lokal__in=self.lokals, due_amount__lte=0).exists())
+
+
+class ReportQueryCountTest(TestCase):
+    def setUp(self):
+        call_command('generate_scale_dataset', lokals=2, years=2, prefix='Q', stdout=io.StringIO())
+
+    def count_queries(self, func, *args):
+        with CaptureQueriesContext(connection) as ctx:
+            func(*args)
+        return len(ctx.captured_queries)
+
+    def test_building_consumptions_do_not_grow_with_meters(self):
+        before = self.count_queries(get_building_water_consumptions)
+        call_command('generate_scale_dataset', lokals=4, years=2, prefix='R', stdout=io.StringIO())
+        self.assertEqual(self.count_queries(get_building_water_consumptions), before)
+
+    def test_water_cost_table_does_not_grow_with_lokals(self):
+        before = self.count_queries(get_water_cost_table_data, Lokal.objects.filter(unit_number__startswith='Q'), 2025, True)
+        call_command('generate_scale_dataset', lokals=4, years=2, prefix='R', stdout=io.StringIO())
+        lokals = Lokal.objects.filter(unit_number__regex=r'^[QR]')
+        self.assertEqual(self.count_queries(get_water_cost_table_data, lokals, 2025, True), before)
+
+
+class ReportBudgetCheckTest(TestCase):
+    def test_violations_are_reported_per_metric(self):
+        budgets = {
+            'settlement': {'max_queries': 10, 'max_ms': 100},
+            'fixed_costs': {'max_queries': 5},
+            'water_cost_table': {'max_queries': 5},
+        }
+        results = {
+            'settlement': {'status': 200, 'ms': 150.0, 'queries': 8, 'sql_ms': 3.0},
+            'fixed_costs': {'status': 200, 'ms': 900.0, 'queries': 5, 'sql_ms': 1.0},
+        }
+        violations = check_budgets(results, budgets)
+        self.assertEqual(len(violations), 2)
+        self.assertTrue(violations[0].startswith('settlement: ms'))
+        self.assertTrue(violations[1].startswith('water_cost_table'))
+
+
+class PerformanceMiddlewareTest(TestCase):
+    def setUp(self):
+        performance.reset()
+        AuthUser.objects.create_superuser(username='perf_admin', email='perf@example.com', password='testpass123')
+        self.client.login(username='perf_admin', password='testpass123')
+
+    def test_request_is_timed_and_recorded(self):
+        with override_settings(PERF_MONITORING_ENABLED=True, PERF_SLOW_REQUEST_MS=0):
+            response = self.client.get(reverse('fixed_costs_list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        [stats] = performance.get_endpoint_stats()
+        self.assertEqual(stats['endpoint'], 'fixed_costs_list')
+        self.assertGreater(stats['max_queries'], 0)
+        self.assertEqual(performance.get_slow_requests()[0]['path'], reverse('fixed_costs_list'))
+
+        response = self.client.get(reverse('perf_dashboard'))
+        self.assertContains(response, 'fixed_costs_list')
+
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            performance.fingerprint_sql('SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 5'),
+            performance.fingerprint_sql('SELECT * FROM t WHERE id IN (%s) AND x = 17'),
+        )
+
+
+class StageMetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        for seconds in (0.01, 0.02, 0.03, 0.5):
+            metrics.record("import.write", seconds)
+        with metrics.span("pdf.build"):
+            pass
+
+    def scrape(self, authorization=None):
+        headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            return self.client.get(reverse('metrics_export'), **headers)
+
+    def test_spans_are_exported_in_prometheus_format(self):
+        response = self.scrape('Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('kamienica_stage_seconds_count{stage="import.write"} 4', response.content.decode())
+
+    def test_localhost_without_token_is_refused(self):
+        # Za reverse proxy każde żądanie ma REMOTE_ADDR 127.0.0.1 — sam adres nie wystarcza.
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape('Bearer wrong').status_code, 403)
+
+    def test_exported_text_parses_back_to_percentiles(self):
+        rows = {row["name"]: row for row in metrics.parse_prometheus(self.scrape('Bearer scrape-secret').content.decode())}
+        self.assertEqual(rows["import.write"]["p50"], 0.02)
+        self.assertEqual(rows["import.write"]["p99"], 0.5)
+        self.assertEqual(rows["pdf.build"]["count"], 1)
+
+
+class ProfilingHookTest(TestCase):
+    def setUp(self):
+        media = override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='kamienica-profiles-'), PROFILING_MAX_PROFILES=1)
+        media.enable()
+        self.addCleanup(media.disable)
+        AuthUser.objects.create_superuser(username='prof_admin', email='prof@example.com', password='testpass123')
+        self.client.login(username='prof_admin', password='testpass123')
+        ProfilingRule.objects.create(kind='url', target='fixed_costs_list', threshold_ms=0)
+
+    def test_matching_request_is_profiled_and_rotated(self):
+        self.client.get(reverse('fixed_costs_list'))
+        first = CapturedProfile.objects.get()
+        first_path = first.file.path
+        self.client.get(reverse('fixed_costs_list'))
+        self.client.get(reverse('lokal_list'))  # brak reguły — bez profilu
+
+        profile = CapturedProfile.objects.get()
+        self.assertNotEqual(profile.pk, first.pk)
+        self.assertEqual(profile.target, 'fixed_costs_list')
+        self.assertIn('cumulative', profile.summary)
+        self.assertFalse(os.path.exists(first_path))
+
+    def test_profile_download_is_marshalled_stats(self):
+        self.client.get(reverse('fixed_costs_list'))
+        profile = CapturedProfile.objects.get()
+        response = self.client.get(reverse('profile_download', args=[profile.pk]))
+        self.assertIsInstance(marshal.loads(b''.join(response.streaming_content)), dict)
+
+
+class FakeOllamaTest(TestCase):
+    def test_categorize_with_ai_against_fake_server(self):
+        config = FakeOllamaConfig(latency_ms=0, jitter_ms=0, distribution="fixed")
+        with running_fake_ollama(config) as server, override_settings(OLLAMA_URL=server.url):
+            self.assertTrue(test_ollama_connection())
+            self.assertEqual(categorize_with_ai("Wywóz odpadów 03/2025")[0], "wywoz_smieci")
+            first = categorize_with_ai("Przelew środków własnych")
+            self.assertEqual(categorize_with_ai("Przelew środków własnych"), first)
+
+            server.config.error_rate = 1.0
+            self.assertEqual(categorize_with_ai("Czynsz")[1], "ERROR")
+            self.assertEqual(server.stats.as_dict()["errors"], 1)
+
+    def test_client_circuit_breaker_and_health_check(self):
+        config = FakeOllamaConfig(latency_ms=0, jitter_ms=0, distribution="fixed", error_rate=1.0)
+        with running_fake_ollama(config) as server, override_settings(OLLAMA_URL=server.url):
+            with OllamaClient(failure_threshold=2) as client:
+                self.assertTrue(client.health_check())
+                for _ in range(5):
+                    client.categorize("Czynsz")
+            self.assertEqual(server.stats.as_dict()["requests"], 2)
+            self.assertEqual(client.summary()["skipped"], 3)
+
+    def test_unreachable_server_is_not_called(self):
+        with override_settings(OLLAMA_URL="http://127.0.0.1:9"), OllamaClient() as client:
+            self.assertFalse(client.health_check())
+            self.assertEqual(client.categorize("Czynsz")[1], "ERROR")
+            self.assertEqual(client.calls, 0)
+
+    def test_import_batches_ai_requests(self):
+        CategorizationRule.objects.create(keywords="wywóz odpadów", title="wywoz_smieci")
+        CategorizationRule.objects.create(keywords="sprzątanie klatki", title="sprzatanie")
+        statement = bank_statement(
+            [(f"C{i}", date(2025, 3, 1), "FIRMA USŁUGOWA", f"Wywóz odpadów oraz sprzątanie klatki {i}", -120) for i in range(20)]
+            + [(f"U{i}", date(2025, 3, 1), "JAN PRZYKŁADOWY", f"Przelew środków własnych {i}", 300) for i in range(20)]
+        )
+        config = FakeOllamaConfig(latency_ms=0, jitter_ms=0, distribution="fixed", unknown_rate=0)
+        with running_fake_ollama(config) as server, override_settings(OLLAMA_URL=server.url, OLLAMA_BATCH_SIZE=10):
+            summary = process_csv_file(io.BytesIO(statement), ai_mode='conflict_and_unprocessed')
+        self.assertEqual(summary['processed_count'], 40)
+        # 40 wierszy wymagających AI = 4 zapytania wsadowe po 10.
+        self.assertEqual(server.stats.as_dict()['requests'], 4)
+        self.assertEqual(summary['unprocessed_count'], 0)
+
+    def test_streaming_reads_to_end_and_reuses_connection(self):
+        # Bez limitu "wyjaśnienie" modelu trwałoby ~1 s (50 tokenów po 20 ms); num_predict je ucina.
+        config = FakeOllamaConfig(latency_ms=0, jitter_ms=0, distribution="fixed", token_ms=20, chatter_tokens=50)
+        with running_fake_ollama(config) as server, override_settings(OLLAMA_URL=server.url, OLLAMA_NUM_PREDICT=4), \
+                new_session() as session:
+            started = time.perf_counter()
+            self.assertEqual(categorize_with_ai("Wywóz odpadów", session=session)[0], "wywoz_smieci")
+            self.assertEqual(categorize_with_ai("Czynsz za lokal", session=session)[0], "czynsz")
+            self.assertLess(time.perf_counter() - started, 0.5)
+            stats = server.stats.as_dict()
+        # Strumień przeczytany do końca — oba zapytania poszły jednym połączeniem z puli.
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['connections'], 1)
+
+
+class CompareAiModesTest(TestCase):
+    def setUp(self):
+        CategorizationRule.objects.create(keywords="wywóz odpadów", title="wywoz_smieci")
+        CategorizationRule.objects.create(keywords="naprawa dachu", title="naprawy_remonty")
+        self.path = os.path.join(tempfile.mkdtemp(prefix='kamienica-compare-'), 'statement.csv')
+        with open(self.path, 'wb') as fh:
+            fh.write(bank_statement(
+                [(f"C{i}", date(2025, 3, 1), "FIRMA USŁUGOWA", f"Wywóz odpadów oraz naprawa dachu {i}", -90) for i in range(10)]
+                + [(f"U{i}", date(2025, 3, 1), "JAN PRZYKŁADOWY", f"Przelew środków własnych {i}", 300) for i in range(10)]
+            ))
+        # Wiersz C0 jest już zweryfikowany — jego tytuł jest wzorcem trafności.
+        FinancialTransaction.objects.create(transaction_id="C0", amount=-1, description="x", title="czynsz", verified=True)
+        self.config = FakeOllamaConfig(latency_ms=0, jitter_ms=0, distribution="fixed", unknown_rate=0)
+
+    def compare(self, server, **options):
+        out = io.StringIO()
+        with override_settings(OLLAMA_URL=server.url, OLLAMA_BATCH_SIZE=10):
+            call_command('compare_ai_modes', self.path, no_classifier=True, json=True, stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_sequential_modes_share_ai_answers(self):
+        with running_fake_ollama(self.config) as server:
+            report = self.compare(server, modes=['conflict_and_unprocessed', 'conflict_only'], sequential=True)
+            # 20 wierszy do AI = 2 zapytania wsadowe; conflict_only korzysta z tych samych odpowiedzi.
+            self.assertEqual(server.stats.as_dict()['requests'], 2)
+        full, conflicts = report['modes']
+        self.assertEqual(full['ai_rows'], 20)
+        self.assertEqual(full['unprocessed'], 0)
+        self.assertEqual(conflicts['ai_rows_reused'], conflicts['ai_rows'])
+        self.assertIsNone(conflicts['ai'])
+
+    def test_modes_are_scored_against_verified_transactions(self):
+        with running_fake_ollama(self.config) as server:
+            full = self.compare(server, modes=['conflict_and_unprocessed'])['modes'][0]
+        self.assertEqual(full['accuracy']['labelled'], 1)
+        self.assertIsNotNone(full['latency_ms'])
+
+    def test_parallel_run_sends_each_row_to_ollama_once(self):
+        before = FinancialTransaction.objects.count()
+        with running_fake_ollama(self.config) as server:
+            report = self.compare(server)
+        self.assertEqual(sum(m['ai_rows'] - m['ai_rows_reused'] for m in report['modes']), 20)
+        self.assertEqual(FinancialTransaction.objects.count(), before)
+
+
+class LocalCategorizerTest(TestCase):
+    def setUp(self):
+        for i in range(20):
+            FinancialTransaction.objects.create(
+                transaction_id=f"T{i}", amount=-100, description=f"Przelew środków własnych {i}",
+                contractor="JAN PRZYKŁADOWY", title="oplata_nie_stanowiaca_kosztu", status="MANUALLY_EDITED",
+            )
+            FinancialTransaction.objects.create(
+                transaction_id=f"K{i}", amount=-80, description=f"Usługa kominiarska nr {i}",
+                contractor="ZAKŁAD KOMINIARSKI", title="kominiarz", verified=True,
+            )
+        path = os.path.join(tempfile.mkdtemp(prefix='kamienica-model-'), 'model.json')
+        call_command('train_categorizer', output=path, stdout=io.StringIO())
+        statement = bank_statement(
+            [(f"N{i}", date(2025, 3, 1), "JAN PRZYKŁADOWY", f"Przelew środków własnych {i}", 300) for i in range(10)]
+        )
+        # Ollama niedostępna — wszystko, co rozstrzygnięte, pochodzi z klasyfikatora.
+        with override_settings(CATEGORIZER_MODEL_PATH=path, OLLAMA_URL="http://127.0.0.1:9"):
+            self.summary = process_csv_file(io.BytesIO(statement), ai_mode='conflict_and_unprocessed')
+
+    def test_classifier_resolves_rows_before_ollama(self):
+        self.assertEqual(self.summary['classified_count'], 10)
+        self.assertEqual(self.summary['unprocessed_count'], 0)
+
+    def test_classified_rows_record_their_source(self):
+        transaction = FinancialTransaction.objects.get(transaction_id="N0")
+        self.assertEqual(transaction.title, "oplata_nie_stanowiaca_kosztu")
+        self.assertEqual(transaction.provenance["ai"], "ML")
+
+
+class RuleSuggestionTest(TestCase):
+    def setUp(self):
+        for i in range(4):
+            AIDecision.objects.create(
+                description=f"Faktura prąd klatka nr {i}", contractor="ENEA OBSŁUGA KLATKI SP. Z O.O.",
+                contractor_key="enea obsługa klatki", title="energia_klatka",
+            )
+            AIDecision.objects.create(
+                description=f"Naprawa dachu {i}", contractor="JAN DEKARZ", contractor_key="jan dekarz",
+                title="naprawy_remonty",
+            )
+        # Zweryfikowana ręcznie transakcja z innym tytułem blokuje wzorzec dekarza.
+        FinancialTransaction.objects.create(
+            transaction_id="V1", amount=-500, description="Naprawa rynny", contractor="JAN DEKARZ",
+            title="na_potrzeby_kamienicy", verified=True,
+        )
+
+    def test_contractor_key_drops_legal_form_and_address(self):
+        self.assertEqual(contractor_key("ENEA OBSŁUGA KLATKI SP. Z O.O. ul. Jana 1"), "enea obsługa klatki")
+
+    def test_repeated_decisions_become_rule_unless_contradicted(self):
+        keywords = {s.keywords: s.title for s in suggest_rules(min_count=3, min_agreement=0.9)}
+        self.assertEqual(keywords.get("enea obsługa klatki"), "energia_klatka")
+        self.assertNotIn("jan dekarz", keywords)
+        # "klatka" z opisu nie wnosi nic ponad regułę kontrahenta.
+        self.assertNotIn("klatka", keywords)
+
+    def test_created_rules_are_not_suggested_again(self):
+        suggestions = suggest_rules(min_count=3, min_agreement=0.9)
+        self.assertEqual(create_rules(suggestions), len(suggestions))
+        self.assertTrue(CategorizationRule.objects.filter(keywords="enea obsługa klatki", title="energia_klatka").exists())
+        self.assertNotIn("enea obsługa klatki", {s.keywords for s in suggest_rules(min_count=3)})
+
+    def test_month_names_are_not_suggested(self):
+        for i in range(4):
+            AIDecision.objects.create(description=f"Wpłata marzec {i}", contractor="", title="czynsz")
+        self.assertNotIn("marzec", {s.keywords for s in suggest_rules(min_count=3)})
+
+    def test_only_long_keywords_are_auto_created(self):
+        suggestions = [
+            RuleSuggestion("dach", "naprawy_remonty", 5, 1.0, "opis"),
+            RuleSuggestion("enea obsługa klatki", "energia_klatka", 4, 1.0, "kontrahent"),
+        ]
+        self.assertEqual([s.keywords for s in auto_create_suggestions(suggestions)], ["enea obsługa klatki"])
+
+
+class RuleAnalysisTest(TestCase):
+    def setUp(self):
+        for i in range(3):
+            FinancialTransaction.objects.create(
+                transaction_id=f"E{i}", amount=-100, description=f"Tauron energia klatka schodowa {i}",
+                contractor="TAURON SPRZEDAŻ",
+            )
+        self.energy = CategorizationRule.objects.create(keywords="tauron, tauron sprzedaż", title="energia_klatka")
+        self.repairs = CategorizationRule.objects.create(keywords="klatka schodowa", title="naprawy_remonty")
+        CategorizationRule.objects.create(keywords="tauron", title="energia_klatka")
+        self.dead = CategorizationRule.objects.create(keywords="kominiarz", title="kominiarz")
+        AuthUser.objects.create_superuser(username='rules_admin', email='rules@example.com', password='testpass123')
+        self.client.login(username='rules_admin', password='testpass123')
+
+    def test_finds_conflicts_redundancy_and_dead_rules(self):
+        analysis = analyze_rules()
+        by_kind = {}
+        for finding in analysis.findings:
+            by_kind.setdefault(finding.kind, []).append(finding)
+        self.assertEqual(analysis.conflict_rows, 3)
+        self.assertEqual({f.affected for f in by_kind['conflict']}, {3})
+        self.assertEqual(len(by_kind['duplicate']), 1)
+        self.assertEqual([p.text for p in by_kind['redundant'][0].phrases], ["tauron", "tauron sprzedaż"])
+        self.assertEqual([f.phrases[0].rule for f in by_kind['dead']], [self.dead])
+
+    def test_page_lists_findings(self):
+        self.assertContains(self.client.get(reverse('rule_analysis')), "kominiarz")
+
+    def test_drop_phrase_and_merge_rules_with_one_title(self):
+        drop_phrase(self.energy, "tauron sprzedaż")
+        self.assertEqual(CategorizationRule.objects.get(pk=self.energy.pk).keywords, "tauron")
+        with self.assertRaises(ValueError):
+            merge_rules([self.energy.pk, self.repairs.pk])
+        merged = merge_rules(CategorizationRule.objects.filter(title="energia_klatka").values_list("pk", flat=True))
+        self.assertEqual(merged.keywords, "tauron")
+        self.assertEqual(CategorizationRule.objects.filter(title="energia_klatka").count(), 1)
+
+    def test_delete_action_removes_rule(self):
+        self.client.post(reverse('rule_analysis'), {'action': 'delete', 'rule': [f"title:{self.dead.pk}"]})
+        self.assertFalse(CategorizationRule.objects.filter(pk=self.dead.pk).exists())
+
+
+class RuleHitStatsTest(TestCase):
+    def setUp(self):
+        self.rules = [
+            CategorizationRule.objects.create(keywords="wywóz odpadów", title="wywoz_smieci"),
+            CategorizationRule.objects.create(keywords="naprawa dachu", title="naprawy_remonty"),
+        ]
+        self.statement = bank_statement(
+            [(f"R{i}", date(2025, 3, 1), "FIRMA USŁUGOWA", f"Faktura {i} wywóz odpadów", -90) for i in range(20)]
+            + [(f"D{i}", date(2025, 3, 1), "FIRMA USŁUGOWA", f"Faktura {i} naprawa dachu", -900) for i in range(10)]
+        )
+
+    def test_import_counts_hits_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            process_csv_file(io.BytesIO(self.statement), ai_mode='rule_only')
+        updates = [q for q in queries.captured_queries if 'UPDATE "core_categorizationrule"' in q['sql']]
+        # Jedno UPDATE na każdą różną liczbę trafień, a nie na wiersz.
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            list(CategorizationRule.objects.order_by('pk').values_list('hit_count', flat=True)), [20, 10],
+        )
+        self.assertTrue(all(r.last_hit_at for r in CategorizationRule.objects.all()))
+
+    def test_rule_after_two_conflicting_rules_is_counted(self):
+        a = CategorizationRule.objects.create(keywords="alfa", title="czynsz")
+        b = CategorizationRule.objects.create(keywords="beta", title="podatek")
+        c = CategorizationRule.objects.create(keywords="gamma", title="ogrodnik")
+        hits = RuleHits()
+        _, status, provenance = get_title_from_description(
+            "alfa beta gamma", categorization_rules=[a, b, c], hits=hits.title,
+        )
+        self.assertEqual(status, "CONFLICT")
+        self.assertEqual(dict(hits.title), {a.pk: 1, b.pk: 1, c.pk: 1})
+        self.assertEqual(provenance["tr"], [a.pk, b.pk, c.pk])
+
+    def test_stale_rules_are_pruned(self):
+        process_csv_file(io.BytesIO(self.statement), ai_mode='rule_only')
+        stale = CategorizationRule.objects.create(keywords="gamma", title="ogrodnik")
+        CategorizationRule.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(days=400))
+        AuthUser.objects.create_superuser(username='hits_admin', email='hits@example.com', password='testpass123')
+        self.client.login(username='hits_admin', password='testpass123')
+        self.assertContains(self.client.get(reverse('rule_list')), "Usuń nieaktualne (1)")
+        self.assertEqual(prune_stale_rules(365), (1, 0))
+        self.assertFalse(CategorizationRule.objects.filter(pk=stale.pk).exists())
+
+
+class ImportStagingTest(TestCase):
+    def setUp(self):
+        CategorizationRule.objects.create(keywords="wywóz odpadów", title="wywoz_smieci")
+        FinancialTransaction.objects.create(
+            transaction_id="S0", posting_date=date(2025, 3, 1), amount=-1, description="stary opis",
+        )
+        self.before = FinancialTransaction.objects.count()
+        self.statement = bank_statement(
+            [(f"S{i}", date(2025, 3, 1), "FIRMA USŁUGOWA", f"Faktura {i} wywóz odpadów", -90) for i in range(10)]
+        )
+        AuthUser.objects.create_superuser('staging_admin', 'staging@example.com', 'testpass123')
+        self.client.login(username='staging_admin', password='testpass123')
+        response = self.client.post(reverse('upload_csv'), {
+            'csv_file': SimpleUploadedFile('wyciag.csv', self.statement),
+            'ai_mode': 'rule_only',
+            'preview': '1',
+        })
+        self.job = ImportJob.objects.get()
+        self.assertRedirects(response, reverse('import_preview', args=[self.job.pk]))
+
+    def test_preview_writes_nothing(self):
+        self.assertEqual(FinancialTransaction.objects.count(), self.before)
+        self.assertEqual(self.job.staged_rows.count(), 10)
+        self.assertEqual(self.job.staged_rows.filter(action='UPDATE').count(), 1)
+        response = self.client.get(reverse('import_preview', args=[self.job.pk]))
+        self.assertEqual(response.context['stats']['total'], 10)
+
+    def test_commit_moves_staged_rows(self):
+        self.client.post(reverse('import_preview', args=[self.job.pk]), {'action': 'commit'})
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'COMMITTED')
+        self.assertEqual(FinancialTransaction.objects.count(), self.before + 9)
+        self.assertFalse(StagedTransaction.objects.exists())
+        self.assertEqual(FinancialTransaction.objects.get(transaction_id="S0").title, "wywoz_smieci")
+
+    def test_commit_skips_rows_edited_while_preview_waited(self):
+        edited = FinancialTransaction.objects.get(transaction_id="S0")
+        edited.title, edited.status = 'oplata_bankowa', 'MANUALLY_EDITED'
+        edited.save()
+        summary = commit_import(self.job)
+        self.assertEqual(summary['protected_count'], 1)
+        edited.refresh_from_db()
+        self.assertEqual((edited.title, edited.status), ('oplata_bankowa', 'MANUALLY_EDITED'))
+        self.assertEqual(FinancialTransaction.objects.count(), self.before + 9)
+
+    def test_rule_hits_are_counted_on_commit_only(self):
+        rule = CategorizationRule.objects.get()
+        self.assertEqual(rule.hit_count, 0)
+        commit_import(self.job)
+        rule.refresh_from_db()
+        self.assertEqual(rule.hit_count, 10)
+
+    def test_discard_keeps_job_without_rows(self):
+        self.client.post(reverse('import_preview', args=[self.job.pk]), {'action': 'discard'})
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'DISCARDED')
+        self.assertFalse(StagedTransaction.objects.exists())
+        self.assertEqual(FinancialTransaction.objects.count(), self.before)
+        self.assertEqual(CategorizationRule.objects.get().hit_count, 0)
+
+
+class IdempotentReimportTest(TestCase):
+    def setUp(self):
+        CategorizationRule.objects.create(keywords="wywóz odpadów", title="wywoz_smieci")
+        self.statement = bank_statement(
+            [(f"I{i}", date(2025, 3, i + 1), "FIRMA USŁUGOWA", f"Faktura {i} wywóz odpadów", -90) for i in range(10)]
+        )
+        self.first = process_csv_file(io.BytesIO(self.statement), ai_mode='rule_only')
+
+    def reimport(self):
+        return process_csv_file(io.BytesIO(self.statement), ai_mode='rule_only')
+
+    def test_unchanged_rows_are_skipped(self):
+        self.assertEqual(self.first['processed_count'], 10)
+        again = self.reimport()
+        self.assertEqual((again['processed_count'], again['unchanged_count']), (0, 10))
+
+    def test_manual_edit_is_protected(self):
+        manual = FinancialTransaction.objects.get(transaction_id="I1")
+        manual.title, manual.status = 'oplata_bankowa', 'MANUALLY_EDITED'
+        manual.save()
+        self.assertEqual(self.reimport()['protected_count'], 1)
+        manual.refresh_from_db()
+        self.assertEqual((manual.title, manual.status), ('oplata_bankowa', 'MANUALLY_EDITED'))
+
+    def test_changed_row_is_matched_again(self):
+        # Wcześniejszy import miał inny opis (bank go poprawił) — inny skrót, wiersz trafia do ponownego dopasowania.
+        changed = FinancialTransaction.objects.get(transaction_id="I2")
+        FinancialTransaction.objects.filter(pk=changed.pk).update(description='stary opis', content_hash='0' * 40)
+        again = self.reimport()
+        self.assertEqual((again['processed_count'], again['unchanged_count']), (1, 9))
+        self.assertEqual(FinancialTransaction.objects.get(pk=changed.pk).description, changed.description)
+
+    def test_row_verified_during_matching_is_not_overwritten(self):
+        changed = FinancialTransaction.objects.get(transaction_id="I2")
+        FinancialTransaction.objects.filter(pk=changed.pk).update(description='stary opis', content_hash='0' * 40)
+        statement = parse_statement(io.BytesIO(self.statement), skip_known=True)
+        resolve_titles(statement["rows"], 'rule_only')
+        # Weryfikacja ręczna w trakcie dopasowania (np. długiej kategoryzacji AI).
+        FinancialTransaction.objects.filter(pk=changed.pk).update(verified=True)
+        statuses, _, _, protected = write_transactions(statement["rows"])
+        self.assertEqual((protected, sum(statuses.values())), ({"I2"}, 0))
+        self.assertEqual(FinancialTransaction.objects.get(pk=changed.pk).description, 'stary opis')
+
+
+class DuplicateDetectionTest(TestCase):
+    def setUp(self):
+        self.original = FinancialTransaction.objects.create(
+            transaction_id="B1", posting_date=date(2026, 3, 2), amount=Decimal('100.00'),
+            description='Czynsz  MARZEC', contractor='Jan Kowalski',
+        )
+        # Część podzielonej wpłaty z tym samym odciskiem należy do tej samej transakcji bankowej.
+        FinancialTransaction.objects.create(
+            transaction_id="B1_split", posting_date=date(2026, 3, 2), amount=Decimal('100.00'),
+            description='Czynsz marzec', contractor='Jan Kowalski', parent=self.original, split_group=self.original.pk,
+        )
+        FinancialTransaction.objects.filter(pk=self.original.pk).update(split_group=self.original.pk)
+
+    def write_reissued(self):
+        row = {
+            "transaction_id": "B2", "posting_date": date(2026, 3, 2), "description": 'Czynsz marzec.',
+            "amount": Decimal('100.00'), "contractor": 'Jan Kowalski', "title": None, "lokal": None,
+            "status": 'UNPROCESSED', "provenance": {},
+        }
+        return write_transactions([row])[2]
+
+    def test_fingerprint_normalises_text(self):
+        self.assertEqual(
+            self.original.fingerprint,
+            transaction_fingerprint(date(2026, 3, 2), Decimal('100'), 'czynsz marzec', 'JAN KOWALSKI'),
+        )
+
+    def test_split_parts_are_not_duplicates(self):
+        self.assertEqual(scan_duplicates(), 0)
+
+    def test_reissued_transaction_is_flagged(self):
+        self.assertEqual(self.write_reissued(), 2)
+
+    def test_review_deletes_chosen_transaction(self):
+        self.write_reissued()
+        AuthUser.objects.create_superuser('dup_admin', 'dup@example.com', 'testpass123')
+        self.client.login(username='dup_admin', password='testpass123')
+        self.assertEqual(len(self.client.get(reverse('duplicate_review')).context['candidates']), 2)
+        candidate = DuplicateCandidate.objects.get(first=self.original)
+        self.client.post(reverse('duplicate_review'), {
+            'action': 'delete', 'candidate': candidate.pk, 'transaction': candidate.second_id,
+        })
+        self.assertFalse(FinancialTransaction.objects.filter(transaction_id="B2").exists())
+        self.assertFalse(DuplicateCandidate.objects.exists())
+
+    def test_split_parent_is_not_deleted_as_duplicate(self):
+        self.write_reissued()
+        candidate = DuplicateCandidate.objects.get(first=self.original)
+        with self.assertRaises(ValueError):
+            delete_duplicate(candidate, self.original.pk)
+        self.assertEqual(FinancialTransaction.objects.filter(transaction_id__startswith="B1").count(), 2)
+
+
+class SplitLineageTest(TestCase):
+    def setUp(self):
+        self.a = Lokal.objects.create(unit_number='S1', size_sqm=40)
+        self.b = Lokal.objects.create(unit_number='S2', size_sqm=40)
+        self.root = FinancialTransaction.objects.create(
+            transaction_id="B9", posting_date=date(2026, 4, 1), amount=Decimal('300.00'), description='Czynsz',
+        )
+        self.first, self.second = split_transaction(
+            self.root, [(Decimal('100'), self.a.pk, 'czynsz'), (Decimal('50'), self.b.pk, None)],
+        )
+
+    def test_split_creates_numbered_parts(self):
+        self.assertEqual([self.first.transaction_id, self.second.transaction_id], ["B9_split", "B9_split_2"])
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.amount, Decimal('150.00'))
+        self.assertTrue(self.first.is_split_payment)
+        self.assertFalse(self.root.is_split_payment)
+
+    def test_nested_split_shares_group_and_can_be_undone(self):
+        nested, = split_transaction(self.first, [(Decimal('40'), self.b.pk, None)])
+        self.assertEqual((nested.parent_id, nested.split_group), (self.first.pk, self.root.pk))
+        parent = undo_split(nested)
+        self.assertEqual(parent.pk, self.first.pk)
+        self.assertEqual(FinancialTransaction.objects.get(pk=self.first.pk).amount, Decimal('100.00'))
+
+    def test_delete_page_lists_children(self):
+        AuthUser.objects.create_superuser('split_admin', 'split@example.com', 'testpass123')
+        self.client.login(username='split_admin', password='testpass123')
+        response = self.client.get(reverse('transaction-delete', args=[self.root.pk]))
+        self.assertEqual(len(response.context['child_transactions']), 2)
+
+    def test_edit_form_rejects_half_filled_part_rows(self):
+        AuthUser.objects.create_superuser('split_admin', 'split@example.com', 'testpass123')
+        self.client.login(username='split_admin', password='testpass123')
+        self.client.post(reverse('transaction-edit', args=[self.second.pk]), {
+            'enable_split': 'on',
+            'split_amount': ['20', ''],
+            'split_lokal': ['', str(self.a.pk)],
+            'remaining_amount': '30',
+        })
+        self.assertFalse(FinancialTransaction.objects.filter(parent=self.second).exists())
+        self.assertEqual(FinancialTransaction.objects.get(pk=self.second.pk).amount, Decimal('50.00'))
+
+    def test_edit_form_pairs_amounts_with_their_lokals(self):
+        AuthUser.objects.create_superuser('split_admin', 'split@example.com', 'testpass123')
+        self.client.login(username='split_admin', password='testpass123')
+        self.client.post(reverse('transaction-edit', args=[self.second.pk]), {
+            'enable_split': 'on',
+            'split_amount': ['', '20'],
+            'split_lokal': ['', str(self.a.pk)],
+            'remaining_amount': '30',
+        })
+        part = FinancialTransaction.objects.get(parent=self.second)
+        self.assertEqual((part.amount, part.lokal_id), (Decimal('20.00'), self.a.pk))
+
+    def test_split_parent_is_protected_from_plain_delete(self):
+        with self.assertRaises(ProtectedError):
+            self.root.delete()
+        self.assertEqual(FinancialTransaction.objects.filter(split_group=self.root.pk).count(), 3)
+
+    def test_delete_all_removes_nested_family(self):
+        split_transaction(self.first, [(Decimal('40'), self.b.pk, None)])
+        self.assertEqual(delete_split_family(self.root), 3)
+        self.assertFalse(FinancialTransaction.objects.filter(transaction_id__startswith="B9").exists())
+
+    def test_clear_all_removes_split_families(self):
+        AuthUser.objects.create_superuser('split_admin', 'split@example.com', 'testpass123')
+        self.client.login(username='split_admin', password='testpass123')
+        self.client.post(reverse('clear_all_transactions'))
+        self.assertFalse(FinancialTransaction.objects.exists())
+
+    def test_merge_restores_amount_and_clears_group(self):
+        split_transaction(self.first, [(Decimal('40'), self.b.pk, None)])
+        self.assertEqual(merge_split(self.root), (3, Decimal('150.00')))
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.amount, Decimal('300.00'))
+        self.assertIsNone(self.root.split_group)
+        self.assertEqual(FinancialTransaction.objects.filter(transaction_id__startswith="B9").count(), 1)
+
+
+class ProcessingProvenanceTest(TestCase):
+    def setUp(self):
+        self.rule = CategorizationRule.objects.create(keywords="wywóz odpadów", title="wywoz_smieci")
+        process_csv_file(io.BytesIO(bank_statement([
+            ("P1", date(2025, 3, 1), "FIRMA USŁUGOWA", "Faktura 1 wywóz odpadów", -90),
+            ("P2", date(2025, 3, 2), "JAN PRZYKŁADOWY", "Przelew środków własnych", 300),
+        ])), ai_mode='rule_only')
+        self.matched = FinancialTransaction.objects.get(transaction_id="P1")
+
+    def test_import_stores_rule_ids_instead_of_text(self):
+        self.assertIsNone(self.matched.processing_log)
+        self.assertEqual((self.matched.provenance["t"], self.matched.provenance["tr"]), ("P", [self.rule.pk]))
+
+    def test_matched_by_rule_finds_only_matched_rows(self):
+        self.assertEqual(list(matched_by_rule(self.rule).values_list("transaction_id", flat=True)), ["P1"])
+
+    def test_log_is_rendered_on_view(self):
+        details = attach_processing_details([self.matched])[0].processing_details
+        self.assertIn(f"Dopasowano regułę: '{self.rule.keywords}'", details)
+
+    def test_reprocessing_rewrites_stale_provenance(self):
+        legacy = FinancialTransaction.objects.create(
+            transaction_id="L1", posting_date=date(2024, 5, 1), amount=-90, description="Faktura wywóz odpadów",
+            title="wywoz_smieci", status="PROCESSED", processing_log="Kategoryzacja Tytułu: Dopasowano regułę.",
+        )
+        FinancialTransaction.objects.filter(pk=self.matched.pk).update(provenance={"t": "P", "tr": [0]})
+        AuthUser.objects.create_superuser('prov_admin', 'prov@example.com', 'testpass123')
+        self.client.login(username='prov_admin', password='testpass123')
+        self.client.post(reverse('reprocess_transactions'))
+        self.assertEqual(
+            set(matched_by_rule(self.rule).values_list("transaction_id", flat=True)), {"P1", "L1"},
+        )
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.processing_log)
+
+    def test_history_filters_by_rule(self):
+        AuthUser.objects.create_superuser('prov_admin', 'prov@example.com', 'testpass123')
+        self.client.login(username='prov_admin', password='testpass123')
+        response = self.client.get(reverse('upload_csv'), {'rule': f'title:{self.rule.pk}'})
+        self.assertEqual(response.context['current_rule'], self.rule)
+        self.assertContains(response, "Transakcje dopasowane przez regułę")
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 
-from .views import auth, users, lokals, agreements, meters, transactions, rules, reports
+from .views import auth, users, lokals, agreements, meters, transactions, rules, reports, performance
 
 urlpatterns = [
     # Authentication URLs
@@ -25,6 +25,8 @@ urlpatterns = [
     path('meter_readings/', meters.meter_readings_view, name='meter_readings'),
     path('meter-consumption-report/', meters.meter_consumption_report, name='meter-consumption-report'),
     path('upload_csv/', transactions.upload_csv, name='upload_csv'),
+    path('upload_csv/preview/<int:pk>/', transactions.import_preview, name='import_preview'),
+    path('upload_csv/duplicates/', transactions.duplicate_review, name='duplicate_review'),
     path('upload_csv/verify/', transactions.verify_transactions, name='verify_transactions'),
     path('upload_csv/verify_ajax/', transactions.verify_transactions_ajax, name='verify_transactions_ajax'),
     path('reprocess_transactions/', transactions.reprocess_transactions, name='reprocess_transactions'),
@@ -34,9 +36,14 @@ urlpatterns = [
     path('fixed-costs/', reports.fixed_costs_view, name='fixed_costs_list'),
     path('water-cost-summary/', reports.water_cost_summary_view, name='water_cost_summary'),
     path('water-cost-table/', reports.water_cost_table, name='water_cost_table'),
+    path('arrears/', reports.arrears_dashboard, name='arrears_dashboard'),
+    path('perf/', performance.perf_dashboard, name='perf_dashboard'),
+    path('metrics/', performance.metrics_export, name='metrics_export'),
+    path('perf/profiles/<int:pk>/download/', performance.profile_download, name='profile_download'),
 
     # Rule Management
     path('rules/', rules.rule_list, name='rule_list'),
+    path('rules/analysis/', rules.rule_analysis, name='rule_analysis'),
     path('rules/<int:pk>/edit/', rules.edit_rule, name='rule_edit'),
     path('rules/<int:pk>/delete/', rules.delete_rule, name='rule_delete'),
 
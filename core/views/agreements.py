@@ -2,7 +2,6 @@ import datetime
 import re
 from decimal import Decimal, InvalidOperation
 from datetime import date
-from dateutil.relativedelta import relativedelta
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -11,9 +10,10 @@ from django.http import HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
 
 from ..decorators import require_admin
-from ..models import Agreement, FinancialTransaction, FixedCost, User
+from ..models import Agreement, FinancialTransaction, User
 from ..forms import AgreementForm
-from ..services.reporting import get_annual_report_context
+from ..services.charges import settlement_charge_totals
+from ..services.report_cache import get_cached_annual_report_context
 
 
 @login_required
@@ -245,36 +245,18 @@ def settlement(request, pk):
         if agreement.user.email.lower() != request.user.email.lower():
             return HttpResponseForbidden("Nie masz uprawnień do przeglądania tego rozliczenia.")
 
-    if not agreement.end_date:
-        agreement.end_date = date.today()
+    # Umowa bez daty zakończenia rozliczana jest na dziś — bez zmiany obiektu umowy.
+    settlement_date = agreement.end_date or date.today()
 
-    year = agreement.end_date.year
+    year = settlement_date.year
     period_start = date(year, 1, 1)
     period_end = date(year, 12, 31)
 
-    total_rent = Decimal('0.00')
-    current_month = period_start
-    while current_month <= period_end:
-        agreement_starts_before_month_end = agreement.start_date <= (current_month + relativedelta(months=1, days=-1))
-        agreement_ends_after_month_start = agreement.end_date >= current_month
-
-        if agreement_starts_before_month_end and agreement_ends_after_month_start:
-            total_rent += agreement.rent_amount
-
-        current_month += relativedelta(months=1)
-
-    total_fixed_costs = Decimal('0.00')
-    waste_rule = FixedCost.objects.filter(category="waste", calculation_method='per_person').order_by('-effective_date').first()
-    if waste_rule:
-        current_month = period_start
-        while current_month <= period_end:
-            agreement_starts_before_month_end = agreement.start_date <= (current_month + relativedelta(months=1, days=-1))
-            agreement_ends_after_month_start = agreement.end_date >= current_month
-
-            if agreement_starts_before_month_end and agreement_ends_after_month_start and waste_rule.effective_date <= current_month:
-                total_fixed_costs += waste_rule.amount * agreement.number_of_occupants
-
-            current_month += relativedelta(months=1)
+    # Naliczenia do dnia rozliczenia, łącznie z niezakończonym ostatnim okresem (bez zapisu do bazy).
+    charge_totals = settlement_charge_totals(agreement, period_start, settlement_date)
+    total_rent = charge_totals['rent']
+    total_fixed_costs = charge_totals['fixed_fees']
+    total_water_cost = charge_totals['water_cost']
 
     total_payments = FinancialTransaction.objects.filter(
         lokal=agreement.lokal,
@@ -292,15 +274,17 @@ def settlement(request, pk):
 
     deposit = agreement.deposit_amount or Decimal('0.00')
     total_income = total_payments + deposit
-    total_costs = total_rent + total_fixed_costs + additional_costs
+    total_costs = total_rent + total_fixed_costs + total_water_cost + additional_costs
     final_balance = total_income - total_costs
 
     context = {
         'agreement': agreement,
+        'settlement_date': settlement_date,
         'period_start': period_start,
         'period_end': period_end,
         'total_rent': total_rent,
         'total_fixed_costs': total_fixed_costs,
+        'total_water_cost': total_water_cost,
         'total_payments': total_payments,
         'additional_costs': additional_costs,
         'total_income': total_income,
@@ -328,5 +312,5 @@ def annual_agreement_report(request, pk):
     except (ValueError, TypeError):
         selected_year = date.today().year
 
-    context = get_annual_report_context(agreement, selected_year, _cache={})
+    context = get_cached_annual_report_context(agreement, selected_year)
     return render(request, 'core/annual_agreement_report.html', context)
@@ -0,0 +1,62 @@
+import os
+
+from django.conf import settings
+from django.contrib import messages
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.crypto import constant_time_compare
+
+from ..decorators import require_admin
+from ..models import CapturedProfile
+from ..services import metrics, performance
+
+ENDPOINT_SORT_KEYS = ('avg_ms', 'max_ms', 'count', 'avg_queries', 'max_queries', 'slow_count')
+
+
+@require_admin
+def perf_dashboard(request):
+    """
+    Statystyki wydajności żądań zebrane przez PerformanceMiddleware:
+    najgorsze endpointy (agregaty per nazwa URL) i ostatnie wolne żądania.
+    """
+    if request.method == 'POST':
+        performance.reset()
+        messages.success(request, "Statystyki wydajności zostały wyczyszczone.")
+        return redirect('perf_dashboard')
+
+    order_by = request.GET.get('sort', 'avg_ms')
+    if order_by not in ENDPOINT_SORT_KEYS:
+        order_by = 'avg_ms'
+
+    context = {
+        'title': 'Wydajność żądań',
+        'enabled': getattr(settings, 'PERF_MONITORING_ENABLED', False),
+        'slow_threshold_ms': getattr(settings, 'PERF_SLOW_REQUEST_MS', 500),
+        'endpoints': performance.get_endpoint_stats(order_by),
+        'slow_requests': performance.get_slow_requests(),
+        'sort': order_by,
+    }
+    return render(request, 'core/perf_dashboard.html', context)
+
+
+def metrics_export(request):
+    """
+    Histogramy etapów (core/services/metrics.py) w formacie tekstowym Prometheusa.
+    Dostępne dla superużytkownika albo z nagłówkiem "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not request.user.is_superuser and not (token and constant_time_compare(authorization, f"Bearer {token}")):
+        return HttpResponseForbidden("Nie masz uprawnień do tej strony.")
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def profile_download(request, pk):
+    """Plik .prof zapisanego profilu — tylko dla superużytkownika (MEDIA nie jest publiczne)."""
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Nie masz uprawnień do tej strony.")
+    profile = get_object_or_404(CapturedProfile, pk=pk)
+    return FileResponse(
+        profile.file.open('rb'), as_attachment=True, filename=os.path.basename(profile.file.name),
+        content_type='application/octet-stream',
+    )
@@ -1,6 +1,5 @@
 import datetime
 import re
-from collections import defaultdict
 from datetime import date
 from decimal import Decimal, InvalidOperation
 from dateutil.relativedelta import relativedelta
@@ -18,10 +17,14 @@ from ..models import (
     FinancialTransaction,
     FixedCost,
     Lokal,
-    Meter,
     WaterCostOverride,
 )
-from ..services.reporting import get_bimonthly_report_context, get_annual_report_context
+from ..services.report_cache import (
+    get_cached_arrears_summary,
+    get_cached_annual_report_context,
+    get_cached_bimonthly_report_context,
+    get_cached_water_cost_table_data,
+)
 from ..services.pdf_generation import build_annual_report_pdf
 
 
@@ -113,7 +116,7 @@ def bimonthly_report_view(request, pk):
     current_year = date.today().year
     available_years = list(range(current_year, current_year - 5, -1))
 
-    context = get_bimonthly_report_context(lokal, selected_year)
+    context = get_cached_bimonthly_report_context(lokal, selected_year)
     context.update({
         'title': f"Raport dwumiesięczny dla lokalu {lokal.unit_number} ({selected_year})",
         'available_years': available_years,
@@ -252,60 +255,7 @@ def water_cost_table(request):
         except Agreement.DoesNotExist:
             lokals = Lokal.objects.none()
 
-    consumptions = defaultdict(lambda: defaultdict(Decimal))
-    all_water_meters = Meter.objects.filter(
-        lokal__in=lokals,
-        type__in=['hot_water', 'cold_water'],
-        status='aktywny'
-    ).select_related('lokal').prefetch_related('readings')
-
-    for meter in all_water_meters:
-        readings = list(meter.readings.all().order_by('reading_date'))
-        for i in range(1, len(readings)):
-            start_reading, end_reading = readings[i-1], readings[i]
-            consumption = end_reading.value - start_reading.value
-
-            end_date = end_reading.reading_date
-            period_start_month = ((end_date.month - 1) // 2) * 2 + 1
-            if end_date.day < 15 and end_date.month % 2 != 0:
-                effective_date = end_date - relativedelta(months=2)
-                period_start_month = ((effective_date.month - 1) // 2) * 2 + 1
-                period_key = date(effective_date.year, period_start_month, 1)
-            else:
-                period_key = date(end_date.year, period_start_month, 1)
-            consumptions[period_key][meter.lokal_id] += consumption
-
-    period_names = [
-        "styczeń-luty", "marzec-kwiecień", "maj-czerwiec",
-        "lipiec-sierpień", "wrzesień-październik", "listopad-grudzień"
-    ]
-
-    table_data = []
-    month_start_num = 1
-    for name in period_names:
-        period_start_date = date(selected_year, month_start_num, 1)
-
-        override_obj = WaterCostOverride.objects.filter(period_start_date=period_start_date).first()
-        unit_price = Decimal('0.00')
-        total_period_consumption = sum(consumptions[period_start_date].values())
-        if override_obj and override_obj.overridden_bill_amount and total_period_consumption > 0:
-            unit_price = override_obj.overridden_bill_amount / total_period_consumption
-
-        row = {'report': {'name': f"{name} {selected_year}", 'unit_price': unit_price}, 'details': []}
-        total_row_cost = Decimal('0.00')
-
-        for lokal in lokals:
-            lokal_consumption = consumptions[period_start_date].get(lokal.id, Decimal('0.00'))
-            cost = lokal_consumption * unit_price
-            row['details'].append({'consumption': lokal_consumption, 'cost': cost})
-            total_row_cost += cost
-
-        row['total_cost'] = total_row_cost
-        row['total_consumption'] = total_period_consumption if request.user.is_superuser else sum(d['consumption'] for d in row['details'])
-        table_data.append(row)
-        month_start_num += 2
-
-    table_data.reverse()
+    table_data = get_cached_water_cost_table_data(lokals, selected_year, request.user.is_superuser)
 
     context = {
         'lokals': lokals,
@@ -335,7 +285,41 @@ def annual_report_pdf(request, pk):
     except (ValueError, TypeError):
         selected_year = date.today().year
 
-    context = get_annual_report_context(agreement, selected_year, _cache={})
+    context = get_cached_annual_report_context(agreement, selected_year)
     buffer = build_annual_report_pdf(context)
     filename = f"raport_roczny_{context['agreement'].lokal.unit_number}_{selected_year}.pdf"
     return FileResponse(buffer, as_attachment=True, filename=filename)
+
+
+ARREARS_SORT_KEYS = {
+    'balance': lambda row: row['balance'],
+    'months': lambda row: row['months_in_arrears'],
+    'last_payment': lambda row: row['last_payment_date'] or date.min,
+    'lokal': lambda row: row['lokal'],
+    'tenant': lambda row: row['tenant'].lower(),
+}
+
+
+@require_admin
+def arrears_dashboard(request):
+    """
+    Panel zaległości: bieżące saldo, liczba miesięcy zaległości i data ostatniej
+    wpłaty dla wszystkich aktywnych umów, liczone zbiorczo z księgi sald.
+    """
+    sort = request.GET.get('sort', 'balance')
+    if sort not in ARREARS_SORT_KEYS:
+        sort = 'balance'
+    descending = request.GET.get('dir') == 'desc'
+
+    agreements = Agreement.objects.filter(is_active=True).select_related('lokal', 'user').order_by('pk')
+    rows = sorted(get_cached_arrears_summary(agreements), key=ARREARS_SORT_KEYS[sort], reverse=descending)
+
+    context = {
+        'rows': rows,
+        'sort': sort,
+        'descending': descending,
+        'total_arrears': sum((row['balance'] for row in rows if row['balance'] < 0), Decimal('0.00')),
+        'arrears_count': sum(1 for row in rows if row['balance'] < 0),
+        'title': 'Zaległości najemców',
+    }
+    return render(request, 'core/arrears_dashboard.html', context)
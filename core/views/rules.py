@@ -1,14 +1,56 @@
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import BooleanField, Case, When
 from django.forms import modelform_factory
 from django.shortcuts import render, redirect, get_object_or_404
 
 from ..decorators import require_admin
-from ..models import CategorizationRule
+from ..models import CategorizationRule, LokalAssignmentRule
+from ..services.rule_analysis import (
+    FINDING_KINDS,
+    FINDING_LABELS,
+    analyze_rules,
+    delete_rules,
+    drop_phrase,
+    merge_rules,
+    prune_stale_rules,
+    resolve_rule,
+    split_rule_keys,
+    stale_rule_filter,
+)
 
 
 @require_admin
 def rule_list(request):
-    rules = CategorizationRule.objects.all().order_by('keywords')
-    return render(request, 'core/rule_list.html', {'rules': rules})
+    """
+    Reguły kategoryzacji i przypisania lokalu ze statystyką dopasowań
+    (najczęściej trafiające na górze). POST usuwa reguły nieaktualne —
+    bez dopasowania od RULE_STALE_DAYS dni.
+    """
+    stale_days = getattr(settings, 'RULE_STALE_DAYS', 365)
+    if request.method == 'POST':
+        deleted_title, deleted_lokal = prune_stale_rules(stale_days)
+        messages.success(
+            request,
+            f"Usunięto {deleted_title} reguł kategoryzacji i {deleted_lokal} reguł przypisania lokalu "
+            f"bez dopasowania od {stale_days} dni.",
+        )
+        return redirect('rule_list')
+
+    stale = stale_rule_filter(stale_days)
+    stale_flag = Case(When(stale, then=True), default=False, output_field=BooleanField())
+    context = {
+        'rules': CategorizationRule.objects.annotate(is_stale=stale_flag).order_by('-hit_count', 'keywords'),
+        'lokal_rules': (
+            LokalAssignmentRule.objects.select_related('lokal')
+            .annotate(is_stale=stale_flag).order_by('-hit_count', 'keywords')
+        ),
+        'stale_days': stale_days,
+        'stale_count': (
+            CategorizationRule.objects.filter(stale).count() + LokalAssignmentRule.objects.filter(stale).count()
+        ),
+    }
+    return render(request, 'core/rule_list.html', context)
 
 
 @require_admin
@@ -33,3 +75,49 @@ def delete_rule(request, pk):
         rule.delete()
         return redirect('rule_list')
     return render(request, 'core/confirm_delete.html', {'object': rule, 'type': 'regułę', 'cancel_url': 'rule_list'})
+
+
+@require_admin
+def rule_analysis(request):
+    """
+    Analiza reguł kategoryzacji i przypisania lokalu: konflikty, duplikaty,
+    nadmiarowe frazy i reguły, które nigdy nie zadziałały, z liczbą
+    dotkniętych transakcji z historii. POST wykonuje operacje zbiorcze
+    (usuń / scal zaznaczone reguły, usuń pojedynczą frazę).
+    """
+    if request.method == 'POST':
+        title_ids, lokal_ids = split_rule_keys(request.POST.getlist('rule'))
+        if request.POST.get('drop'):
+            key, _, phrase = request.POST['drop'].partition('|')
+            rule = resolve_rule(key)
+            if rule is None:
+                messages.error(request, "Reguła już nie istnieje.")
+            elif drop_phrase(rule, phrase):
+                messages.success(request, f"Usunięto regułę '{rule.keywords}'.")
+            else:
+                messages.success(request, f"Usunięto frazę '{phrase}' z reguły '{rule.keywords}'.")
+        elif request.POST.get('action') == 'delete':
+            deleted = delete_rules(title_ids, lokal_ids)
+            messages.success(request, f"Usunięto {deleted} reguł.")
+        elif request.POST.get('action') == 'merge':
+            try:
+                if lokal_ids:
+                    raise ValueError("Reguł przypisania lokalu nie można scalać — każda ma jedną frazę.")
+                rule = merge_rules(title_ids)
+                messages.success(request, f"Scalono {len(title_ids)} reguł w '{rule.keywords}'.")
+            except ValueError as e:
+                messages.error(request, str(e))
+        return redirect('rule_analysis')
+
+    analysis = analyze_rules()
+    kind = request.GET.get('kind')
+    findings = [f for f in analysis.findings if f.kind == kind] if kind in FINDING_KINDS else analysis.findings
+    counts = analysis.counts()
+    context = {
+        'title': 'Analiza reguł',
+        'analysis': analysis,
+        'findings': findings,
+        'kinds': [(k, FINDING_LABELS[k], counts[k]) for k in FINDING_KINDS],
+        'kind': kind,
+    }
+    return render(request, 'core/rule_analysis.html', context)
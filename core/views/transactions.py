@@ -1,19 +1,27 @@
-import time
 from decimal import Decimal, InvalidOperation
+from itertools import zip_longest
 from django.http import JsonResponse
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.db import transaction as db_transaction
 from django.db.models import Q
 from django.http import HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
 
 
-from ..models import Agreement, FinancialTransaction, CategorizationRule, LokalAssignmentRule, Lokal
+from ..models import Agreement, FinancialTransaction, CategorizationRule, LokalAssignmentRule, Lokal, ImportJob, StagedTransaction, DuplicateCandidate
 from ..forms import CSVUploadForm
+from ..services.duplicates import delete_duplicate, dismiss_candidate, open_candidates, scan_duplicates
+from ..services.import_staging import commit_import, discard_import, preview_stats, stage_import
+from ..services.provenance import attach_processing_details, matched_by_rule
+from ..services.rule_analysis import resolve_rule
+from ..services.splits import delete_split_family, merge_split, split_transaction, undo_split
 from ..services.transaction_processing import (
+    RuleHits,
     process_csv_file,
     get_title_from_description,
+    load_matching_context,
     match_lokal_for_transaction,
 )
 
@@ -58,6 +66,10 @@ def upload_csv(request):
             Q(description__icontains=search_query) |
             Q(contractor__icontains=search_query)
         )
+    # Transakcje dopasowane przez regułę ('title:<pk>' / 'lokal:<pk>', link z listy reguł).
+    rule_filter = resolve_rule(request.GET.get('rule', '')) if request.user.is_superuser else None
+    if rule_filter is not None:
+        transactions = matched_by_rule(rule_filter, transactions)
 
     context = {
         'form': CSVUploadForm(initial={'ai_mode': 'conflict_and_unprocessed'}),
@@ -72,6 +84,7 @@ def upload_csv(request):
         'current_date_to': date_to,
         'current_search_query': search_query,
         'current_verified': verified_filter,
+        'current_rule': rule_filter,
     }
 
     if request.method == 'POST':
@@ -82,27 +95,137 @@ def upload_csv(request):
         if form.is_valid():
             csv_file = request.FILES['csv_file']
             ai_mode = form.cleaned_data.get('ai_mode', 'conflict_and_unprocessed')
+            if 'preview' in request.POST:
+                job, error = stage_import(csv_file, ai_mode=ai_mode, user=request.user, file_name=csv_file.name)
+                if error:
+                    context['upload_summary'] = error
+                    return render(request, 'core/upload_csv.html', context)
+                return redirect('import_preview', pk=job.pk)
+
             summary = process_csv_file(csv_file, ai_mode=ai_mode)
 
             if summary.get('error'):
                 context['upload_summary'] = summary
                 return render(request, 'core/upload_csv.html', context)
+            return _finish_import(request, summary)
 
-            request.session['upload_summary'] = {
-                'processed_count': summary.get('processed_count', 0),
-                'skipped_rows': summary.get('skipped_rows', []),
-                'encoding_warning': summary.get('encoding_warning', False),
-                'conflict_count': summary.get('conflict_count', 0),
-                'unprocessed_count': summary.get('unprocessed_count', 0),
-            }
+    return render(request, 'core/upload_csv.html', context)
 
-            if summary.get('has_manual_work'):
-                return redirect('categorize_transactions')
-            else:
-                messages.success(request, f"Import zakończony. Pomyślnie przetworzono {summary.get('processed_count', 0)} transakcji.")
-                return redirect('upload_csv')
 
-    return render(request, 'core/upload_csv.html', context)
+def _finish_import(request, summary):
+    """Komunikaty po zapisaniu importu (bezpośrednio lub z podglądu) i przekierowanie."""
+    request.session['upload_summary'] = {
+        'processed_count': summary.get('processed_count', 0),
+        'unchanged_count': summary.get('unchanged_count', 0),
+        'protected_count': summary.get('protected_count', 0),
+        'skipped_rows': summary.get('skipped_rows', []),
+        'encoding_warning': summary.get('encoding_warning', False),
+        'conflict_count': summary.get('conflict_count', 0),
+        'unprocessed_count': summary.get('unprocessed_count', 0),
+    }
+
+    ai_summary = summary.get('ai')
+    if ai_summary and ai_summary['disabled_reason']:
+        messages.warning(
+            request,
+            f"AI zostało wyłączone w trakcie importu ({ai_summary['disabled_reason']}). "
+            f"Pominięto {ai_summary['skipped']} zapytań — te transakcje przetworzono tylko regułami.",
+        )
+
+    if summary.get('duplicate_candidates'):
+        messages.warning(
+            request,
+            f"Wykryto {summary['duplicate_candidates']} możliwych duplikatów transakcji — sprawdź je w przeglądzie duplikatów.",
+        )
+
+    if summary.get('created_rules'):
+        messages.info(
+            request,
+            f"Utworzono {summary['created_rules']} nowych reguł kategoryzacji z powtarzalnych decyzji AI.",
+        )
+    if summary.get('has_manual_work'):
+        return redirect('categorize_transactions')
+    messages.success(request, f"Import zakończony. Pomyślnie przetworzono {summary.get('processed_count', 0)} transakcji.")
+    return redirect('upload_csv')
+
+
+@login_required
+def import_preview(request, pk):
+    """
+    Podgląd importu zapisany w stagingu (StagedTransaction): nowe i aktualizowane
+    wiersze, konflikty i propozycje AI. POST zatwierdza import (jeden zbiorczy
+    zapis, bez ponownego dopasowania i AI) albo go odrzuca.
+    """
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Nie masz uprawnień do importowania transakcji.")
+    job = get_object_or_404(ImportJob, pk=pk)
+
+    if request.method == 'POST':
+        try:
+            if request.POST.get('action') == 'commit':
+                return _finish_import(request, commit_import(job))
+            discard_import(job)
+            messages.info(request, "Podgląd importu został odrzucony — nic nie zapisano.")
+        except ValueError as e:
+            messages.error(request, str(e))
+        return redirect('upload_csv')
+
+    rows = job.staged_rows.select_related('lokal')
+    status_filter = request.GET.get('status')
+    if status_filter:
+        rows = rows.filter(status=status_filter)
+    action_filter = request.GET.get('action')
+    if action_filter:
+        rows = rows.filter(action=action_filter)
+
+    stats = preview_stats(job)
+    context = {
+        'job': job,
+        'stats': stats,
+        'action_counts': [
+            (value, label, stats['actions'].get(value, 0)) for value, label in StagedTransaction.ACTION_CHOICES
+        ],
+        'status_counts': [
+            (value, label, stats['statuses'].get(value, 0)) for value, label in FinancialTransaction.STATUS_CHOICES
+            if stats['statuses'].get(value)
+        ],
+        'rows': attach_processing_details(rows),
+        'current_status': status_filter,
+        'current_action': action_filter,
+    }
+    return render(request, 'core/import_preview.html', context)
+
+
+@login_required
+def duplicate_review(request):
+    """
+    Przegląd par transakcji o tym samym odcisku (data, kwota, opis, kontrahent).
+    POST: usunięcie jednej z transakcji pary, oznaczenie pary jako „to nie
+    duplikat” albo przeszukanie całej historii.
+    """
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Nie masz uprawnień do przeglądu duplikatów.")
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        if action == 'scan':
+            found = scan_duplicates()
+            messages.success(request, f"Przeszukano historię — nowych par: {found}.")
+            return redirect('duplicate_review')
+        candidate = get_object_or_404(DuplicateCandidate, pk=request.POST.get('candidate'))
+        if action == 'dismiss':
+            dismiss_candidate(candidate)
+            messages.success(request, "Oznaczono parę jako różne transakcje.")
+        elif action == 'delete':
+            try:
+                delete_duplicate(candidate, int(request.POST.get('transaction', 0)))
+                messages.success(request, "Usunięto zdublowaną transakcję.")
+            except (ValueError, FinancialTransaction.DoesNotExist) as e:
+                messages.error(request, str(e) or "Transakcja już nie istnieje.")
+        return redirect('duplicate_review')
+
+    candidates = [(candidate, (candidate.first, candidate.second)) for candidate in open_candidates()]
+    return render(request, 'core/duplicate_review.html', {'candidates': candidates})
 
 
 @login_required
@@ -168,14 +291,25 @@ def reprocess_transactions(request):
         return HttpResponseForbidden("Nie masz uprawnień do ponownego przetwarzania transakcji.")
     transactions = FinancialTransaction.objects.exclude(status='MANUALLY_EDITED')
     updated_count = 0
+    context = load_matching_context()
+    hits = RuleHits()
+    # Wynik bez zmian, ale inne pochodzenie (wpis sprzed provenance, scalona
+    # lub usunięta reguła) — zapis zbiorczy, bez sygnałów przeliczających raporty.
+    provenance_only = []
 
     for transaction in transactions:
-        title, title_status, title_log = get_title_from_description(transaction.description, transaction.contractor)
-        suggested_lokal, lokal_status, lokal_log = match_lokal_for_transaction(
+        title, title_status, title_provenance = get_title_from_description(
+            transaction.description, transaction.contractor,
+            categorization_rules=context['categorization_rules'],
+            hits=hits.title,
+        )
+        suggested_lokal, lokal_status, lokal_provenance = match_lokal_for_transaction(
             transaction.description,
             transaction.contractor,
             transaction.amount,
-            transaction.posting_date
+            transaction.posting_date,
+            hits=hits.lokal,
+            **context['lokal'],
         )
 
         final_status = 'PROCESSED'
@@ -184,6 +318,7 @@ def reprocess_transactions(request):
         elif title_status == 'UNPROCESSED':
             final_status = 'UNPROCESSED'
 
+        provenance = {**title_provenance, **lokal_provenance}
         is_changed = (
             transaction.title != title or
             transaction.lokal != suggested_lokal or
@@ -193,9 +328,16 @@ def reprocess_transactions(request):
             transaction.title = title
             transaction.lokal = suggested_lokal
             transaction.status = final_status
-            transaction.processing_log = f"Kategoryzacja Tytułu: {title_log} | Przypisanie Lokalu: {lokal_log}"
+            transaction.provenance = provenance
+            transaction.processing_log = None
             transaction.save()
             updated_count += 1
+        elif transaction.provenance != provenance:
+            transaction.provenance = provenance
+            transaction.processing_log = None
+            provenance_only.append(transaction)
+    FinancialTransaction.objects.bulk_update(provenance_only, ['provenance', 'processing_log'], batch_size=500)
+    hits.flush()
 
     messages.success(request, f"Pomyślnie przetworzono ponownie transakcje. Zaktualizowano {updated_count} wpisów. Pominięto te edytowane ręcznie.")
     return redirect('upload_csv')
@@ -216,7 +358,7 @@ def categorize_transactions(request):
     lokale = Lokal.objects.filter(is_active=True)
 
     context = {
-        'transactions': transactions_to_process,
+        'transactions': attach_processing_details(transactions_to_process),
         'title_choices': FinancialTransaction.TITLE_CHOICES,
         'lokale': lokale,
     }
@@ -280,7 +422,10 @@ def clear_all_transactions(request):
     if not request.user.is_superuser:
         return HttpResponseForbidden()
     if request.method == 'POST':
-        FinancialTransaction.objects.all().delete()
+        # parent ma on_delete=PROTECT — najpierw zrywamy powiązania podziałów.
+        with db_transaction.atomic():
+            FinancialTransaction.objects.filter(parent__isnull=False).update(parent=None)
+            FinancialTransaction.objects.all().delete()
         return redirect('upload_csv')
     return render(request, 'core/confirm_clear_transactions.html')
 
@@ -303,41 +448,37 @@ def edit_transaction(request, pk):
         keyword = request.POST.get('keyword')
 
         enable_split = request.POST.get('enable_split') == 'on'
-        split_amount_str = request.POST.get('split_amount')
-        split_lokal_id = request.POST.get('split_lokal')
+        # Kwota i lokal części łączone po pozycji wiersza formularza; puste wiersze są pomijane.
+        split_rows = [
+            (amount.strip(), lokal_id)
+            for amount, lokal_id in zip_longest(
+                request.POST.getlist('split_amount'), request.POST.getlist('split_lokal'), fillvalue='',
+            )
+            if amount.strip() or lokal_id
+        ]
+        split_complete = bool(split_rows) and all(amount and lokal_id for amount, lokal_id in split_rows)
         remaining_amount_str = request.POST.get('remaining_amount')
 
-        if enable_split and split_amount_str and split_lokal_id and remaining_amount_str:
+        if enable_split and split_complete and remaining_amount_str:
             try:
-                split_amount = Decimal(split_amount_str.replace(',', '.'))
+                amounts = [Decimal(amount.replace(',', '.')) for amount, _ in split_rows]
                 remaining_amount = Decimal(remaining_amount_str.replace(',', '.'))
 
-                if abs(split_amount + remaining_amount - transaction.amount) > Decimal('0.01'):
-                    messages.error(request, f"Błąd: Suma kwot ({split_amount + remaining_amount}) nie zgadza się z pierwotną kwotą ({transaction.amount}).")
+                if abs(sum(amounts) + remaining_amount - transaction.amount) > Decimal('0.01'):
+                    messages.error(request, f"Błąd: Suma kwot ({sum(amounts) + remaining_amount}) nie zgadza się z pierwotną kwotą ({transaction.amount}).")
                     return redirect('transaction-edit', pk=pk)
 
+                split_transaction(transaction, [
+                    (amount, lokal_id, new_category) for amount, (_, lokal_id) in zip(amounts, split_rows)
+                ])
                 transaction.amount = remaining_amount
-
-                new_trans_id = f"{transaction.transaction_id}_split" if transaction.transaction_id else None
-                if new_trans_id and FinancialTransaction.objects.filter(transaction_id=new_trans_id).exists():
-                    new_trans_id = f"{new_trans_id}_{int(time.time())}"
-
-                FinancialTransaction.objects.create(
-                    transaction_id=new_trans_id,
-                    posting_date=transaction.posting_date,
-                    amount=split_amount,
-                    description=f"{transaction.description} (część wydzielona)",
-                    contractor=transaction.contractor,
-                    title=new_category if new_category else transaction.title,
-                    lokal_id=split_lokal_id
-                )
-                messages.success(request, f"Pomyślnie wydzielono kwotę {split_amount} dla drugiego lokalu.")
+                messages.success(request, f"Pomyślnie wydzielono {len(amounts)} części na łączną kwotę {sum(amounts)}.")
 
             except (InvalidOperation, ValueError):
                 messages.error(request, "Nieprawidłowy format kwoty do podziału.")
                 return redirect('transaction-edit', pk=pk)
         elif enable_split:
-            messages.error(request, "Wypełnij wszystkie pola podziału (kwoty i drugi lokal).")
+            messages.error(request, "Wypełnij wszystkie pola podziału (kwoty i lokale).")
             return redirect('transaction-edit', pk=pk)
 
         if new_category:
@@ -386,43 +527,27 @@ def delete_transaction(request, pk):
         return HttpResponseForbidden("Nie masz uprawnień do usuwania transakcji.")
     transaction = get_object_or_404(FinancialTransaction, pk=pk)
 
-    parent_transaction = None
-    if transaction.transaction_id and '_split' in transaction.transaction_id:
-        potential_parent_id = transaction.transaction_id.rsplit('_split', 1)[0]
-        parent_transaction = FinancialTransaction.objects.filter(transaction_id=potential_parent_id).first()
-
-    child_transactions = None
-    if transaction.transaction_id:
-        children = FinancialTransaction.objects.filter(transaction_id__startswith=f"{transaction.transaction_id}_split")
-        if children.exists():
-            child_transactions = children
+    parent_transaction = transaction.parent
+    child_transactions = transaction.split_children.all() or None
 
     if request.method == 'POST':
         action = request.POST.get('action')
 
         if action == 'merge' and parent_transaction:
-            parent_transaction.amount += transaction.amount
-            parent_transaction.save()
-            transaction.delete()
+            undo_split(transaction)
             messages.success(request, f"Cofnięto podział. Kwota {transaction.amount} została zwrócona do transakcji {parent_transaction.transaction_id}.")
 
         elif action == 'merge_children' and child_transactions:
-            total_restored = Decimal('0.00')
-            count = 0
-            for child in child_transactions:
-                total_restored += child.amount
-                count += 1
-
-            transaction.amount += total_restored
-            transaction.save()
-            child_transactions.delete()
+            count, total_restored = merge_split(transaction)
             messages.success(request, f"Scalono {count} części. Łączna kwota {total_restored} PLN wróciła do transakcji głównej.")
 
         elif action == 'delete_all' and child_transactions:
-            count = child_transactions.count() + 1
-            child_transactions.delete()
-            transaction.delete()
-            messages.success(request, f"Usunięto transakcję główną oraz {count-1} powiązanych części.")
+            deleted = delete_split_family(transaction)
+            messages.success(request, f"Usunięto transakcję główną oraz {deleted} powiązanych części.")
+
+        elif child_transactions:
+            messages.error(request, "Z tej transakcji wydzielono części — scal je albo usuń razem z nimi.")
+            return redirect('transaction-delete', pk=transaction.pk)
 
         else:
             transaction.delete()